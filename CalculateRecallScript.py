@@ -1,32 +1,23 @@
 import os
-import requests
 import json
+from evaluation_store import ResponseStore
+from evaluation_runner import EvaluationRunner
+from ground_truth import ANNOTATIONS_PATH, load_ground_truth
 
-# Path to ground truth JSON file and OCR service URL
-GROUND_TRUTH_PATH = "benchmark_dataset/ground_truth.json"
+# Path to the ground truth annotations and OCR service URL
+GROUND_TRUTH_PATH = ANNOTATIONS_PATH
 OCR_SERVICE_URL = "https://shubhamsaini01--ocr-service-fastapi-modal-app.modal.run/ocr"
 
-# Load ground truth data
-def load_ground_truth(file_path):
-    with open(file_path, 'r') as f:
-        return json.load(f)
+# Raw service responses, recorded and replayed according to OCR_EVAL_MODE
+response_store = ResponseStore(OCR_SERVICE_URL)
 
-# Get OCR results from the service for an image
-def get_ocr_results(image_path):
-    with open(image_path, 'rb') as image_file:
-        files = {'files': (os.path.basename(image_path), image_file, 'image/jpeg')}
-        response = requests.post(OCR_SERVICE_URL, files=files)
-        
-        if response.status_code == 200:
-            try:
-                json_response = response.json()
-                if isinstance(json_response, list) and len(json_response) > 0:
-                    return json_response[0].get('ocr_results', [])
-            except json.JSONDecodeError:
-                print(f"Error: Failed to parse JSON response for {image_path}.")
-        else:
-            print(f"Error: OCR service failed for {image_path}. Status code: {response.status_code}")
-    
+# OCR results of an image from its service response. None when the image was never
+# recorded in replay mode, so it is left out rather than scored as empty
+def get_ocr_results(image_path, json_response):
+    if json_response is None and response_store.mode == "replay":
+        return None
+    if isinstance(json_response, list) and len(json_response) > 0:
+        return json_response[0].get('ocr_results', [])
     return []
 
 # Calculate recall based on OCR results and ground truth
@@ -37,7 +28,7 @@ def calculate_recall(ocr_results, ground_truth_data):
     detected_texts = [result['text'] for result in ocr_results]
 
     for gt in ground_truth_data:
-        if gt['text'] in detected_texts:
+        if gt['attributes']['text'] in detected_texts:
             true_positives += 1
         else:
             false_negatives += 1
@@ -52,23 +43,29 @@ def process_images(image_folder, ground_truth_path, output_file):
     cumulative_true_positives = 0
     cumulative_false_negatives = 0
 
-    # Process each image in the folder
-    for image_name in os.listdir(image_folder):
-        image_path = os.path.join(image_folder, image_name)
-
+    # Collect the images that have ground truth to score against
+    image_paths = []
+    for image_name in sorted(os.listdir(image_folder)):
         # Skip non-image files
         if not image_name.lower().endswith(('.png', '.jpg', '.jpeg')):
             print(f"Skipping non-image file: {image_name}")
             continue
 
-        gt_data = ground_truth.get(f"images/{image_name}", [])
-
-        if not gt_data:
+        if not ground_truth.get(f"images/{image_name}"):
             print(f"No ground truth data for {image_name}")
             continue
+        image_paths.append(os.path.join(image_folder, image_name))
 
-        # Get OCR results from the service
-        ocr_results = get_ocr_results(image_path)
+    # Score each image as its response arrives, in file name order, while the
+    # runner's workers keep requesting the rest
+    runner = EvaluationRunner(OCR_SERVICE_URL, response_store)
+    for image_path, json_response in runner.run(image_paths):
+        image_name = os.path.basename(image_path)
+        gt_data = ground_truth[f"images/{image_name}"]
+
+        ocr_results = get_ocr_results(image_path, json_response)
+        if ocr_results is None:
+            continue
         
         # Calculate recall for the current image
         recall, true_positives, false_negatives = calculate_recall(ocr_results, gt_data)
@@ -90,6 +87,8 @@ def process_images(image_folder, ground_truth_path, output_file):
         "false_negatives": cumulative_false_negatives
     }
 
+    print(response_store.summary())
+
     # Save the recall results to a file
     with open(output_file, 'w') as f:
         json.dump(recall_results, f, indent=4)
@@ -98,7 +97,7 @@ def process_images(image_folder, ground_truth_path, output_file):
 if __name__ == "__main__":
     # Input paths
     IMAGE_FOLDER = "benchmark_dataset/images"
-    GROUND_TRUTH_PATH = "benchmark_dataset/ground_truth.json"
+    GROUND_TRUTH_PATH = ANNOTATIONS_PATH
     OUTPUT_FILE = "recall_results.json"
 
     # Run the recall calculation
@@ -0,0 +1,112 @@
+import os
+import math
+import threading
+from fastapi import HTTPException
+
+# Admission settings:
+#   OCR_MAX_QUEUE         images (or videos) admitted per engine at once, waiting or running
+#   OCR_CLIENT_MAX_SHARE  fraction of that queue one client may hold (0 disables fair share)
+OCR_MAX_QUEUE = int(os.environ.get("OCR_MAX_QUEUE", 64))
+OCR_CLIENT_MAX_SHARE = float(os.environ.get("OCR_CLIENT_MAX_SHARE", 0))
+
+# Weight of the newest observation in the service-time average
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+# An admitted unit of work; hand it back to AdmissionController.release when done
+class Ticket:
+    def __init__(self, client_id, weight):
+        self.client_id = client_id
+        self.weight = weight
+        self.released = False
+
+
+# Bounds the work queued for one engine. Requests beyond the bound are turned away
+# at once with 503 (or 429 when a single client holds more than its share) and a
+# Retry-After estimated from the queue depth and the observed service time, instead
+# of piling up in memory while their latency grows without bound.
+class AdmissionController:
+    def __init__(self, name, concurrency, max_queue=OCR_MAX_QUEUE, client_max_share=OCR_CLIENT_MAX_SHARE):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+        self.client_limit = max(1, int(max_queue * client_max_share)) if client_max_share else None
+        self.depth = 0
+        self.clients = {}
+        # Seconds of engine time per image, averaged over recent batches
+        self.service_time = None
+        # Updated from inference threads as well as the event loop
+        self._lock = threading.Lock()
+
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_client = 0
+
+    # Estimated seconds until the current queue has drained
+    def retry_after(self):
+        service_time = self.service_time if self.service_time is not None else 1.0
+        return max(1, math.ceil(self.depth * service_time / self.concurrency))
+
+    def _reject(self, status_code, detail):
+        raise HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(self.retry_after())})
+
+    # Admit weight units of work for a client or raise HTTPException 503/429
+    def admit(self, client_id, weight=1):
+        with self._lock:
+            if self.max_queue and self.depth + weight > self.max_queue and self.depth > 0:
+                self.rejected_full += 1
+                self._reject(503, f"The {self.name} queue is full. Please retry later.")
+            client_depth = self.clients.get(client_id, 0)
+            if self.client_limit and client_depth + weight > self.client_limit and client_depth > 0:
+                self.rejected_client += 1
+                self._reject(429, f"Too many requests in progress for this client on {self.name}. Please retry later.")
+            self.depth += weight
+            self.clients[client_id] = client_depth + weight
+            self.admitted += 1
+        return Ticket(client_id, weight)
+
+    def release(self, ticket):
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            self.depth -= ticket.weight
+            remaining = self.clients[ticket.client_id] - ticket.weight
+            if remaining:
+                self.clients[ticket.client_id] = remaining
+            else:
+                del self.clients[ticket.client_id]
+
+    # Record how long the engine took for a batch of items
+    def observe(self, seconds, items):
+        if items <= 0:
+            return
+        per_item = seconds / items
+        with self._lock:
+            if self.service_time is None:
+                self.service_time = per_item
+            else:
+                self.service_time += SERVICE_TIME_SMOOTHING * (per_item - self.service_time)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self.depth,
+                "max_queue": self.max_queue,
+                "client_limit": self.client_limit,
+                "clients": len(self.clients),
+                "concurrency": self.concurrency,
+                "service_time_seconds": self.service_time,
+                "retry_after_seconds": self.retry_after(),
+                "admitted": self.admitted,
+                "rejected_full": self.rejected_full,
+                "rejected_client": self.rejected_client,
+            }
+
+
+# Client identity for fair share: an explicit X-Client-ID header, else the peer address
+def client_id_for(request):
+    client_id = request.headers.get("x-client-id")
+    if client_id:
+        return client_id
+    return request.client.host if request.client else "unknown"
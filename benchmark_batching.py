@@ -0,0 +1,110 @@
+import os
+import time
+import json
+import asyncio
+import argparse
+from micro_batcher import MicroBatcher
+
+# Path to the folder containing images
+DATASET_FOLDER = "benchmark_dataset/images"
+
+# File to store the benchmark results
+OUTPUT_FILE = "batching_benchmark_results.json"
+
+# Grid of scheduler settings to compare
+BATCH_SIZES = [1, 2, 4, 8, 16]
+WAIT_TIMES_MS = [0, 2, 5, 10, 20]
+
+# Stand-in for a GPU engine: every call pays a fixed launch overhead plus a smaller
+# per-image cost, which is what makes batching pay off. time.sleep releases the GIL
+# just like a real CUDA call does.
+def make_fake_engine(overhead_ms, per_image_ms):
+    def run_batch(items):
+        time.sleep((overhead_ms + per_image_ms * len(items)) / 1000.0)
+        return [[] for _ in items]
+    return run_batch
+
+# Run a real EasyOCR batch on dataset images (needs easyocr and ideally a GPU)
+def make_easyocr_engine():
+    from ocr_engines import load_easyocr, run_easyocr_batch, make_warm_up
+    reader = load_easyocr()
+    make_warm_up(run_easyocr_batch)(reader)
+    return lambda images: run_easyocr_batch(reader, images)
+
+def percentile(values, pct):
+    if not values:
+        return 0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+# Closed-loop load: each simulated client submits one image, waits for it, repeats
+async def run_load(batcher, items, concurrency, duration_s):
+    latencies = []
+    stop_at = time.monotonic() + duration_s
+
+    async def client(client_id):
+        i = client_id
+        while time.monotonic() < stop_at:
+            start_time = time.monotonic()
+            await batcher.submit(items[i % len(items)])
+            latencies.append(time.monotonic() - start_time)
+            i += concurrency
+
+    start_time = time.monotonic()
+    await asyncio.gather(*[client(c) for c in range(concurrency)])
+    elapsed = time.monotonic() - start_time
+    return latencies, elapsed
+
+def benchmark_setting(run_batch, items, batch_size, wait_ms, concurrency, duration_s):
+    batcher = MicroBatcher(run_batch, max_batch_size=batch_size, max_wait_ms=wait_ms)
+    latencies, elapsed = asyncio.run(run_load(batcher, items, concurrency, duration_s))
+    stats = batcher.stats()
+    return {
+        "max_batch_size": batch_size,
+        "max_wait_ms": wait_ms,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "throughput_images_per_second": len(latencies) / elapsed if elapsed else 0,
+        "latency_p50_ms": percentile(latencies, 50) * 1000,
+        "latency_p95_ms": percentile(latencies, 95) * 1000,
+        "latency_p99_ms": percentile(latencies, 99) * 1000,
+        "average_batch_size": stats["average_batch_size"],
+    }
+
+def run_benchmark(engine, concurrency, duration_s, overhead_ms, per_image_ms):
+    if engine == "easyocr":
+        import cv2
+        run_batch = make_easyocr_engine()
+        # Decode up front so the benchmark measures the scheduler and engine, not disk reads
+        items = [cv2.imread(os.path.join(DATASET_FOLDER, img)) for img in sorted(os.listdir(DATASET_FOLDER)) if img.endswith(('jpg', 'png'))]
+    else:
+        run_batch = make_fake_engine(overhead_ms, per_image_ms)
+        items = list(range(32))
+
+    results = []
+    for batch_size in BATCH_SIZES:
+        for wait_ms in WAIT_TIMES_MS:
+            if batch_size == 1 and wait_ms > 0:
+                continue  # Waiting is pointless when nothing can be batched
+            print(f"Benchmarking max_batch_size={batch_size}, max_wait_ms={wait_ms}...")
+            result = benchmark_setting(run_batch, items, batch_size, wait_ms, concurrency, duration_s)
+            print(f"  {result['throughput_images_per_second']:.1f} img/s, "
+                  f"p50 {result['latency_p50_ms']:.1f} ms, p99 {result['latency_p99_ms']:.1f} ms, "
+                  f"avg batch {result['average_batch_size']:.2f}")
+            results.append(result)
+
+    with open(OUTPUT_FILE, 'w') as outfile:
+        json.dump({"engine": engine, "results": results}, outfile, indent=4)
+    print(f"Benchmark completed. Results saved to {OUTPUT_FILE}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput/latency tradeoff of the OCR micro-batcher")
+    parser.add_argument("--engine", choices=["fake", "easyocr"], default="fake")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per setting")
+    parser.add_argument("--overhead-ms", type=float, default=40.0, help="Fake engine per-call overhead")
+    parser.add_argument("--per-image-ms", type=float, default=5.0, help="Fake engine per-image cost")
+    args = parser.parse_args()
+
+    run_benchmark(args.engine, args.concurrency, args.duration, args.overhead_ms, args.per_image_ms)
@@ -0,0 +1,121 @@
+import time
+import json
+import argparse
+from ground_truth import load_ground_truth
+from mapCalculation import evaluate_image, summarize_evaluations
+from benchmark_onnx import DATASET_FOLDER, GROUND_TRUTH_PATH, load_images
+from cascade import OCR_CASCADE_FAST_ENGINE, OCR_CASCADE_MAX_ESCALATED_SHARE, CascadePolicy, tag_results, merge_escalated
+
+# File to store the benchmark results
+OUTPUT_FILE = "cascade_benchmark_results.json"
+
+# First-pass confidence thresholds to compare
+THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.9]
+
+
+def load_engine(name):
+    from ocr_engines import ENGINES, make_warm_up
+    loader, run_batch = ENGINES[name]
+    engine = loader()
+    make_warm_up(run_batch)(engine)
+    return engine, run_batch
+
+
+def timed(fn, *args):
+    start_time = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start_time
+
+
+# Scored the way mapCalculation.py scores the service: numeric texts only
+def score(image_results, images):
+    return summarize_evaluations([
+        evaluate_image([result for result in results if result["text"].isdigit()], gt_data)
+        for results, (_, _, gt_data) in zip(image_results, images)
+    ])
+
+
+# The cascade at one threshold, replayed over every image from the measured first pass
+# and heavy-engine runs: what the service's process_image_cascade would return and the
+# engine time it would spend
+def run_cascade(policy, heavy_name, heavy_engine, images, fast_runs, heavy_runs):
+    from ocr_engines import RECOGNIZERS
+
+    image_results = []
+    engine_seconds = 0.0
+    images_escalated = regions_escalated = 0
+    for (_, img, _), (results, fast_seconds), (heavy_results, heavy_seconds) in zip(images, fast_runs, heavy_runs):
+        confident, unsure = policy.split(results)
+        engine_seconds += fast_seconds
+        if policy.escalate_image(results, unsure, heavy_name in RECOGNIZERS):
+            image_results.append(tag_results(heavy_results, heavy_name))
+            engine_seconds += heavy_seconds
+            images_escalated += 1
+        elif not unsure:
+            image_results.append(tag_results(confident, policy.fast_engine))
+        else:
+            boxes = [result["bounding_box"] for result in unsure]
+            rereads, reread_seconds = timed(RECOGNIZERS[heavy_name], heavy_engine, img, boxes)
+            image_results.append(merge_escalated(confident, policy.fast_engine, rereads, heavy_name))
+            engine_seconds += reread_seconds
+            regions_escalated += len(unsure)
+
+    produced_by_fast = sum(result["engine"] == policy.fast_engine for results in image_results for result in results)
+    produced = sum(len(results) for results in image_results)
+    return {
+        "engine_seconds": engine_seconds,
+        "images_escalated": images_escalated,
+        "regions_escalated": regions_escalated,
+        "results_from_fast_engine": produced_by_fast / produced if produced else 0,
+        **score(image_results, images),
+    }
+
+
+def main(args):
+    images = load_images(args.images, load_ground_truth(args.ground_truth))
+    print(f"Benchmarking {len(images)} images: {args.fast_engine} first, {args.heavy_engine} on demand")
+
+    fast_engine, fast_run = load_engine(args.fast_engine)
+    heavy_engine, heavy_run = load_engine(args.heavy_engine)
+    # Every image once through each engine; the cascades below reuse these runs
+    fast_runs = [(results[0], seconds) for results, seconds in (timed(fast_run, fast_engine, [img]) for _, img, _ in images)]
+    heavy_runs = [(results[0], seconds) for results, seconds in (timed(heavy_run, heavy_engine, [img]) for _, img, _ in images)]
+
+    heavy_seconds = sum(seconds for _, seconds in heavy_runs)
+    results = {
+        f"{args.fast_engine}_only": {"engine_seconds": sum(seconds for _, seconds in fast_runs), **score([r for r, _ in fast_runs], images)},
+        f"{args.heavy_engine}_only": {"engine_seconds": heavy_seconds, **score([r for r, _ in heavy_runs], images)},
+    }
+    for threshold in args.thresholds:
+        policy = CascadePolicy(threshold, args.fast_engine, args.max_escalated_share)
+        results[f"cascade_{threshold}"] = run_cascade(policy, args.heavy_engine, heavy_engine, images, fast_runs, heavy_runs)
+
+    # Cost saved and recall lost against running the heavy engine on everything
+    reference = results[f"{args.heavy_engine}_only"]
+    for name, result in results.items():
+        result["cost_saved_vs_heavy"] = 1 - result["engine_seconds"] / heavy_seconds if heavy_seconds else 0
+        result["recall_change_vs_heavy"] = result["recall"] - reference["recall"]
+        result["mAP_change_vs_heavy"] = result["mAP"] - reference["mAP"]
+        print(
+            f"{name:<20} engine time {result['engine_seconds']:8.2f}s  cost saved {result['cost_saved_vs_heavy']:7.1%}  "
+            f"recall {result['recall']:.4f} ({result['recall_change_vs_heavy']:+.4f})  mAP {result['mAP']:.4f}"
+        )
+
+    for engine in (fast_engine, heavy_engine):
+        if hasattr(engine, "close"):
+            engine.close()
+    with open(args.output, 'w') as outfile:
+        json.dump({"fast_engine": args.fast_engine, "heavy_engine": args.heavy_engine, "results": results}, outfile, indent=4)
+    print(f"Benchmark completed. Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Engine time saved and recall lost by the confidence-gated cascade")
+    parser.add_argument("--fast-engine", default=OCR_CASCADE_FAST_ENGINE)
+    parser.add_argument("--heavy-engine", default="easyocr")
+    parser.add_argument("--thresholds", nargs="+", type=float, default=THRESHOLDS)
+    parser.add_argument("--max-escalated-share", type=float, default=OCR_CASCADE_MAX_ESCALATED_SHARE)
+    parser.add_argument("--images", default=DATASET_FOLDER)
+    parser.add_argument("--ground-truth", default=GROUND_TRUTH_PATH)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    main(parser.parse_args())
@@ -0,0 +1,140 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import requests
+from benchmark_batching import percentile
+
+# Path to the folder containing images
+DATASET_FOLDER = "benchmark_dataset/images"
+
+# File to store the benchmark results
+OUTPUT_FILE = "cold_start_results.json"
+
+# Seconds to wait for a container to become ready before giving up on it
+READY_TIMEOUT = 600
+
+# Startup strategies, as environment overrides on top of preloading the engine
+SCENARIOS = {
+    # Nothing loaded at startup: the first request imports, loads and runs the engine
+    "lazy": {"OCR_PRELOAD_ENGINES": ""},
+    # Loaded at startup, but the first request pays for the first inference
+    "preload": {"OCR_WARM_UP": "0"},
+    # Loaded and warmed up before the container reports ready (the default)
+    "preload_warm_up": {},
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def sample_images(count=2):
+    names = sorted(name for name in os.listdir(DATASET_FOLDER) if name.lower().endswith(('.png', '.jpg', '.jpeg')))
+    images = []
+    for name in names[:count]:
+        with open(os.path.join(DATASET_FOLDER, name), 'rb') as f:
+            images.append((name, f.read()))
+    return images
+
+
+def post_image(url, image, model_name):
+    name, content = image
+    start_time = time.perf_counter()
+    response = requests.post(f"{url}/ocr", files=[('files', (name, content))], data={"model_name": model_name})
+    response.raise_for_status()
+    return time.perf_counter() - start_time
+
+
+# Start the service in a fresh process, as a cold container would, and time it until
+# it is ready, its first request and a second, warm one
+def cold_start(engine, scenario_env, images):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "OCR_PRELOAD_ENGINES": engine,
+        # Measure startup, not the cache or the job workers
+        "OCR_CACHE_MAX_ENTRIES": "0",
+        "OCR_JOB_WORKERS": "0",
+        "OCR_JOBS_DIR": tempfile.mkdtemp(prefix="ocr_jobs_"),
+        **scenario_env,
+    }
+    start_time = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "modelService:fastapi_app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        # The server accepts connections only once its startup has finished
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"Service exited with code {process.returncode} during startup")
+            if time.perf_counter() - start_time > READY_TIMEOUT:
+                raise RuntimeError(f"Service not ready after {READY_TIMEOUT}s")
+            try:
+                response = requests.get(f"{url}/ready", timeout=1)
+                if response.status_code == 200:
+                    break
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.01)
+        ready_seconds = time.perf_counter() - start_time
+        startup = response.json()
+
+        first_request_seconds = post_image(url, images[0], engine)
+        first_result_seconds = time.perf_counter() - start_time
+        warm_request_seconds = post_image(url, images[-1], engine)
+        return {
+            "ready_seconds": ready_seconds,
+            "first_request_seconds": first_request_seconds,
+            "first_result_seconds": first_result_seconds,
+            "warm_request_seconds": warm_request_seconds,
+            "startup_phases": startup["phases"],
+        }
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main(args):
+    images = sample_images()
+    results = {}
+    for scenario in args.scenarios:
+        runs = [cold_start(args.engine, SCENARIOS[scenario], images) for _ in range(args.repeats)]
+        summary = {
+            key: percentile([run[key] for run in runs], 50)
+            for key in ("ready_seconds", "first_request_seconds", "first_result_seconds", "warm_request_seconds")
+        }
+        # Median of every startup phase seen
+        phases = list(dict.fromkeys(phase for run in runs for phase in run["startup_phases"]))
+        summary["startup_phases"] = {
+            phase: percentile([run["startup_phases"][phase] for run in runs if phase in run["startup_phases"]], 50)
+            for phase in phases
+        }
+        results[scenario] = {"summary": summary, "runs": runs}
+        print(
+            f"{scenario:<16} ready {summary['ready_seconds']:7.2f}s  first request {summary['first_request_seconds']:7.2f}s  "
+            f"first result {summary['first_result_seconds']:7.2f}s  warm request {summary['warm_request_seconds']:7.3f}s"
+        )
+        for phase, seconds in summary["startup_phases"].items():
+            print(f"    {phase:<28} {seconds:7.2f}s")
+
+    with open(args.output, 'w') as outfile:
+        json.dump({"engine": args.engine, "repeats": args.repeats, "scenarios": results}, outfile, indent=4)
+    print(f"Benchmark completed. Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold start of the OCR service, from process start to a warm request")
+    parser.add_argument("--engine", default="easyocr")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    main(parser.parse_args())
@@ -0,0 +1,109 @@
+import os
+import time
+import json
+import argparse
+import numpy as np
+from benchmark_batching import percentile
+from ground_truth import load_ground_truth
+from mapCalculation import evaluate_image, summarize_evaluations
+
+# Path to the folder containing images
+DATASET_FOLDER = "benchmark_dataset/images"
+
+# Ground truth the variants are scored against
+GROUND_TRUTH_PATH = "ground_truth_converted.json"
+
+# File to store the benchmark results
+OUTPUT_FILE = "onnx_benchmark_results.json"
+
+# EasyOCR builds compared on CPU: PyTorch eager mode (the reference), the ONNX Runtime
+# export in float32, and the export with int8 quantization
+VARIANTS = ["torch", "onnx_fp32", "onnx_int8"]
+
+
+def load_variant(variant, threads, quantize):
+    from ocr_engines import EASYOCR_LANGUAGES
+    if variant == "torch":
+        import torch
+        import easyocr
+        torch.set_num_threads(threads)
+        return easyocr.Reader(EASYOCR_LANGUAGES, gpu=False, quantize=False)
+
+    from onnx_easyocr import load_onnx_reader
+    return load_onnx_reader(EASYOCR_LANGUAGES, quantize="none" if variant == "onnx_fp32" else quantize, intra_op_threads=threads)
+
+
+# The dataset's images that have ground truth, decoded up front so only inference is timed
+def load_images(image_folder, ground_truth):
+    import cv2
+    images = []
+    for image_name in sorted(os.listdir(image_folder)):
+        if not image_name.lower().endswith(('.png', '.jpg', '.jpeg')):
+            continue
+        gt_data = ground_truth.get(f"images/{image_name}")
+        if gt_data:
+            images.append((image_name, cv2.imread(os.path.join(image_folder, image_name)), gt_data))
+    return images
+
+
+# Latency and accuracy of one variant over every image. Results are scored the way
+# mapCalculation.py scores the service: numeric texts only (the dataset annotates bib
+# numbers), precision/recall at MATCH_IOU_THRESHOLD and mAP over IOU_THRESHOLDS
+def benchmark_variant(reader, images):
+    from ocr_engines import make_warm_up, run_easyocr_batch
+    make_warm_up(run_easyocr_batch)(reader)
+
+    latencies = []
+    evaluations = []
+    for image_name, img, gt_data in images:
+        start_time = time.perf_counter()
+        ocr_results = run_easyocr_batch(reader, [img])[0]
+        latencies.append(time.perf_counter() - start_time)
+        evaluations.append(evaluate_image([result for result in ocr_results if result["text"].isdigit()], gt_data))
+
+    return {
+        "images": len(images),
+        "latency_mean_ms": float(np.mean(latencies)) * 1000,
+        "latency_p50_ms": percentile(latencies, 50) * 1000,
+        "latency_p95_ms": percentile(latencies, 95) * 1000,
+        **summarize_evaluations(evaluations),
+    }
+
+
+def main(args):
+    images = load_images(args.images, load_ground_truth(args.ground_truth))
+    print(f"Benchmarking {len(images)} images")
+
+    results = {}
+    for threads in args.threads:
+        for variant in args.variants:
+            label = f"{variant}_{threads}_threads"
+            result = benchmark_variant(load_variant(variant, threads, args.quantize), images)
+            results[label] = {"variant": variant, "threads": threads, **result}
+            print(
+                f"{label:<24} p50 {result['latency_p50_ms']:8.1f} ms  p95 {result['latency_p95_ms']:8.1f} ms  "
+                f"recall {result['recall']:.4f}  mAP {result['mAP']:.4f}  detection mAP {result['detection_mAP']:.4f}"
+            )
+
+    # What each ONNX build gives up (or gains) against PyTorch at the same thread count
+    for result in results.values():
+        reference = results.get(f"torch_{result['threads']}_threads")
+        if reference is not None and result["variant"] != "torch":
+            result["speedup_vs_torch"] = reference["latency_mean_ms"] / result["latency_mean_ms"]
+            result["recall_change_vs_torch"] = result["recall"] - reference["recall"]
+            result["mAP_change_vs_torch"] = result["mAP"] - reference["mAP"]
+
+    with open(args.output, 'w') as outfile:
+        json.dump(results, outfile, indent=4)
+    print(f"Benchmark completed. Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Speed and accuracy of EasyOCR on ONNX Runtime against PyTorch, on CPU")
+    parser.add_argument("--variants", nargs="+", choices=VARIANTS, default=VARIANTS)
+    parser.add_argument("--threads", nargs="+", type=int, default=[os.cpu_count() or 1], help="intra-op thread counts to compare")
+    parser.add_argument("--quantize", choices=["recognizer", "all"], default="recognizer", help="networks quantized in onnx_int8")
+    parser.add_argument("--images", default=DATASET_FOLDER)
+    parser.add_argument("--ground-truth", default=GROUND_TRUTH_PATH)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    main(parser.parse_args())
@@ -0,0 +1,115 @@
+import json
+import time
+import random
+import argparse
+from benchmark_batching import percentile
+from response_formats import (
+    JSON, MSGPACK, AVAILABLE_MEDIA_TYPES, AVAILABLE_ENCODINGS,
+    encode_body, decode_body, compress, decompress,
+)
+
+# Earlier benchmark run whose responses serve as realistic payloads
+BENCHMARK_RESULTS_FILE = "ocr_benchmark_results.json"
+
+# File to store the benchmark results
+OUTPUT_FILE = "response_format_results.json"
+
+# Words per image of the synthetic payloads, from a sparse photo to a dense document
+SYNTHETIC_WORD_COUNTS = [10, 100, 1000, 10000]
+
+
+# The /ocr responses recorded by benchMark.py (stored there as JSON strings)
+def recorded_payloads(path=BENCHMARK_RESULTS_FILE):
+    with open(path) as f:
+        recorded = json.load(f)
+    responses = []
+    for result in recorded.get("individual_processing", {}).get("results", []):
+        response = result.get("ocr_result")
+        responses.append(json.loads(response) if isinstance(response, str) else response)
+    if not responses:
+        return []
+    # One request with every recorded image, the size a client batch would send
+    return [("recorded", [file_result for response in responses for file_result in response])]
+
+
+# A single-image response with `words` random word boxes, confidences and short texts
+def synthetic_payload(words, seed=0):
+    rng = random.Random(seed)
+    results = []
+    for _ in range(words):
+        x, y = rng.randint(0, 4000), rng.randint(0, 3000)
+        w, h = rng.randint(20, 300), rng.randint(10, 60)
+        results.append({
+            "bounding_box": [[x, y], [x + w, y], [x + w, y + h], [x, y + h]],
+            "text": "".join(rng.choice("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(rng.randint(1, 10))),
+            "confidence": rng.random(),
+        })
+    return [{"file_name": "synthetic.png", "processing_time_seconds": 0.5, "frames_processed": None, "ocr_results": results}]
+
+
+def formats():
+    media_types = [media_type for media_type in (JSON, MSGPACK) if media_type in AVAILABLE_MEDIA_TYPES]
+    return [(media_type, encoding) for media_type in media_types for encoding in [None] + AVAILABLE_ENCODINGS]
+
+
+def time_call(fn, repeats):
+    durations = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - start_time)
+    return result, percentile(durations, 50)
+
+
+# Size and median encode/decode time of one payload in one format. Encode is what the
+# service spends (serialize + compress), decode what the client spends
+def measure(payload, media_type, encoding, repeats):
+    body, encode_seconds = time_call(lambda: compress(encode_body(payload, media_type), encoding), repeats)
+    decoded, decode_seconds = time_call(lambda: decode_body(decompress(body, encoding), media_type), repeats)
+    if not same_payload(decoded, payload):
+        raise AssertionError(f"{media_type} + {encoding} did not round-trip")
+    return {"bytes": len(body), "encode_ms": encode_seconds * 1000, "decode_ms": decode_seconds * 1000}
+
+
+# Equal apart from confidences, which msgpack carries as float32
+def same_payload(decoded, payload):
+    def split(files):
+        confidences = [result.pop("confidence", None) for file_result in files for result in file_result["ocr_results"]]
+        return files, confidences
+    decoded, decoded_confidences = split(json.loads(json.dumps(decoded)))
+    payload, payload_confidences = split(json.loads(json.dumps(payload)))
+    return decoded == payload and all(
+        (a is None and b is None) or abs(a - b) < 1e-6 for a, b in zip(decoded_confidences, payload_confidences)
+    )
+
+
+def main(args):
+    payloads = recorded_payloads(args.recorded) + [
+        (f"synthetic_{words}_words", synthetic_payload(words)) for words in SYNTHETIC_WORD_COUNTS
+    ]
+    results = {}
+    for name, payload in payloads:
+        results[name] = {}
+        baseline = None
+        for media_type, encoding in formats():
+            label = f"{media_type.split('/')[1]}+{encoding}" if encoding else media_type.split('/')[1]
+            result = measure(payload, media_type, encoding, args.repeats)
+            baseline = baseline or result["bytes"]
+            result["size_vs_json"] = result["bytes"] / baseline
+            results[name][label] = result
+            print(
+                f"{name:<24} {label:<14} {result['bytes']:>10} bytes ({result['size_vs_json']:6.1%})  "
+                f"encode {result['encode_ms']:8.3f} ms  decode {result['decode_ms']:8.3f} ms"
+            )
+
+    with open(args.output, 'w') as outfile:
+        json.dump(results, outfile, indent=4)
+    print(f"Benchmark completed. Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Payload size and serialization cost of each /ocr response format")
+    parser.add_argument("--recorded", default=BENCHMARK_RESULTS_FILE, help="benchMark.py results with recorded responses")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    main(parser.parse_args())
@@ -0,0 +1,278 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import importlib
+import subprocess
+import tempfile
+from load_generator import load_images, make_client
+from benchmark_batching import percentile
+
+# Path to the folder containing images
+DATASET_FOLDER = "benchmark_dataset/images"
+
+# File to store the benchmark results
+OUTPUT_FILE = "service_overhead_results.json"
+
+# Services and the form fields that select their engine
+SERVICES = {
+    "modelService/easyocr": ("modelService", {"model_name": "easyocr"}),
+    "modelService/tesseract": ("modelService", {"model_name": "tesseract"}),
+    "tesseract_ocr_service": ("tesseract_ocr_service", {}),
+    "keras_ocr_service": ("keras_ocr_service", {}),
+    "paddleOCRService": ("paddleOCRService", {}),
+}
+
+# (name, files per request, concurrent clients)
+SCENARIOS = [
+    ("single", 1, 1),
+    ("batch", 8, 1),
+    ("concurrent", 1, 16),
+]
+
+# Stages that are the engine's own time; everything else is service overhead
+ENGINE_STAGES = ("detection", "recognition", "inference")
+
+
+# Deterministic stand-ins for the OCR libraries. They expose the same calls the services
+# make (detect/recognize, recognize, ocr, a Tesseract pool) and sleep for a fixed
+# latency, so everything around the model (multipart parsing, decoding, batching,
+# result formatting, serialization) runs for real while the model costs a known amount.
+# time.sleep releases the GIL, like a real inference call.
+class FakeEngine:
+    def __init__(self, overhead_ms, per_image_ms, boxes):
+        self.overhead_ms = overhead_ms
+        self.per_image_ms = per_image_ms
+        self.boxes = boxes
+
+    def sleep(self, images, overhead=True):
+        time.sleep(((self.overhead_ms if overhead else 0) + self.per_image_ms * images) / 1000.0)
+
+    # The same `boxes` word boxes for every image, laid out on a grid that fits it
+    def word_boxes(self, image_shape):
+        height, width = image_shape[:2]
+        columns = 4
+        rows = max(1, (self.boxes + columns - 1) // columns)
+        box_width, box_height = max(1, width // columns), max(1, height // rows)
+        return [
+            ((i % columns) * box_width, (i // columns) * box_height,
+             (i % columns + 1) * box_width - 1, (i // columns + 1) * box_height - 1, f"word{i}")
+            for i in range(self.boxes)
+        ]
+
+
+class FakeEasyOCRReader(FakeEngine):
+    def detect(self, img, reformat=True, **kwargs):
+        images = img if img.ndim == 4 else [img]
+        self.sleep(len(images) / 2)
+        horizontal_lists = [[[x1, x2, y1, y2] for x1, y1, x2, y2, _ in self.word_boxes(image.shape)] for image in images]
+        return horizontal_lists, [[] for _ in images]
+
+    def recognize(self, img, horizontal_list=None, free_list=None, reformat=True, **kwargs):
+        self.sleep(0.5, overhead=False)
+        return [
+            ([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], f"word{i}", 0.9)
+            for i, (x1, x2, y1, y2) in enumerate(horizontal_list or [])
+        ]
+
+
+class FakeTesseractPool(FakeEngine):
+    def map_words(self, images, allowlist=None):
+        self.sleep(len(images))
+        return [[(text, 90.0, (x1, y1, x2, y2)) for x1, y1, x2, y2, text in self.word_boxes(image.shape)] for image in images]
+
+    # The standalone service sends encoded bytes; the pool decodes them in its workers,
+    # which the fake skips
+    async def text(self, image):
+        await asyncio.to_thread(self.sleep, 1)
+        return " ".join(f"word{i}" for i in range(self.boxes))
+
+    def close(self):
+        pass
+
+
+class FakeKerasPipeline(FakeEngine):
+    def recognize(self, images):
+        import numpy as np
+        self.sleep(len(images))
+        return [
+            [(text, np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.float32))
+             for x1, y1, x2, y2, text in self.word_boxes(image.shape)]
+            for image in images
+        ]
+
+
+class FakePaddleOCR(FakeEngine):
+    def ocr(self, img):
+        self.sleep(1)
+        return [[
+            [[[float(x1), float(y1)], [float(x2), float(y1)], [float(x2), float(y2)], [float(x1), float(y2)]], (text, 0.9)]
+            for x1, y1, x2, y2, text in self.word_boxes(img.shape)
+        ]]
+
+
+# Swap every engine loader for a fake one. Must run before a service module is imported,
+# since the services register their engines at import time.
+def install_fake_engines(overhead_ms, per_image_ms, boxes):
+    import ocr_engines
+
+    def loader(engine_class):
+        return lambda: engine_class(overhead_ms, per_image_ms, boxes)
+
+    ocr_engines.ENGINES.update({
+        "easyocr": (loader(FakeEasyOCRReader), ocr_engines.run_easyocr_batch),
+        "tesseract": (loader(FakeTesseractPool), ocr_engines.run_tesseract_batch),
+        "keras_ocr": (loader(FakeKerasPipeline), ocr_engines.run_keras_ocr_batch),
+        "paddleocr": (loader(FakePaddleOCR), ocr_engines.run_paddleocr_batch),
+    })
+    # The fakes need none of the engine libraries
+    ocr_engines.ENGINE_IMPORTS.clear()
+    return lambda workers=None, lang=None, config=None: FakeTesseractPool(overhead_ms, per_image_ms, boxes)
+
+
+# The services read their settings at import time: measure the layers around the model
+# without the result cache, admission limits or job workers getting in the way
+def configure_environment():
+    os.environ["OCR_CACHE_MAX_ENTRIES"] = "0"
+    os.environ.pop("OCR_CACHE_DIR", None)
+    os.environ["OCR_MAX_QUEUE"] = "0"
+    os.environ["OCR_JOB_WORKERS"] = "0"
+    os.environ["OCR_JOBS_DIR"] = tempfile.mkdtemp(prefix="ocr_jobs_")
+
+
+# Closed loop: each client sends a request, waits for the response, and sends the next
+async def run_scenario(client, images, total_requests, files_per_request, concurrency, form_fields):
+    latencies = []
+    stages = {}
+    errors = 0
+    next_request = 0
+
+    async def worker():
+        nonlocal next_request, errors
+        while next_request < total_requests:
+            index = next_request
+            next_request += 1
+            upload = [images[(index * files_per_request + i) % len(images)] for i in range(files_per_request)]
+            files = [('files', (name, content, 'image/png')) for name, content in upload]
+            start_time = time.perf_counter()
+            response = await client.post("/ocr", files=files, data={**form_fields, "include_timings": "true"})
+            body = response.content
+            latencies.append(time.perf_counter() - start_time)
+            if response.status_code != 200:
+                errors += 1
+                continue
+            for file_result in json.loads(body):
+                for stage, seconds in file_result.get("stage_seconds", {}).items():
+                    stages.setdefault(stage, []).append(seconds)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        "requests": total_requests,
+        "files_per_request": files_per_request,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_images_per_second": total_requests * files_per_request / elapsed,
+        "latency_seconds": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": sum(latencies) / len(latencies),
+        },
+        # Median time per file in each stage; overhead is every stage but the engine's
+        "stage_p50_seconds": {stage: percentile(values, 50) for stage, values in sorted(stages.items())},
+        "overhead_p50_seconds": sum(
+            percentile(values, 50) for stage, values in stages.items() if stage not in ENGINE_STAGES
+        ),
+    }
+
+
+async def benchmark_service(name, images, args, make_tesseract_pool):
+    module_name, form_fields = SERVICES[name]
+    module = importlib.import_module(module_name)
+    if hasattr(module, "TesseractPool"):
+        module.TesseractPool = make_tesseract_pool
+    app = module.fastapi_app
+
+    results = {}
+    async with app.router.lifespan_context(app), make_client(app) as client:
+        # A few untimed requests first, so one-off setup isn't measured
+        await run_scenario(client, images, 3, 1, 1, form_fields)
+        for scenario, files_per_request, concurrency in SCENARIOS:
+            result = await run_scenario(client, images, args.requests, files_per_request, concurrency, form_fields)
+            results[scenario] = result
+            latency = result["latency_seconds"]
+            print(
+                f"{name:<24} {scenario:<11} p50={latency['p50'] * 1000:8.1f} ms  p95={latency['p95'] * 1000:8.1f} ms  "
+                f"overhead p50={result['overhead_p50_seconds'] * 1000:7.1f} ms/file  "
+                f"throughput={result['throughput_images_per_second']:7.1f} img/s  errors={result['errors']}"
+            )
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Print how each scenario moved relative to an earlier results file
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nChange against {baseline_path} (commit {baseline.get('git_commit')}):")
+    for name, scenarios in results["services"].items():
+        for scenario, result in scenarios.items():
+            old = baseline.get("services", {}).get(name, {}).get(scenario)
+            if old is None:
+                continue
+            old_p50, new_p50 = old["latency_seconds"]["p50"], result["latency_seconds"]["p50"]
+            old_tp, new_tp = old["throughput_images_per_second"], result["throughput_images_per_second"]
+            print(
+                f"{name:<24} {scenario:<11} p50 {old_p50 * 1000:8.1f} -> {new_p50 * 1000:8.1f} ms ({(new_p50 / old_p50 - 1):+.1%})  "
+                f"throughput {old_tp:7.1f} -> {new_tp:7.1f} img/s ({(new_tp / old_tp - 1):+.1%})"
+            )
+
+
+async def main(args):
+    configure_environment()
+    make_tesseract_pool = install_fake_engines(args.overhead_ms, args.per_image_ms, args.boxes)
+    images = load_images(args.dataset)
+
+    results = {
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "fake_engine": {"overhead_ms": args.overhead_ms, "per_image_ms": args.per_image_ms, "boxes": args.boxes},
+        "requests_per_scenario": args.requests,
+        "services": {},
+    }
+    for name in args.services:
+        results["services"][name] = await benchmark_service(name, images, args, make_tesseract_pool)
+
+    with open(args.output, 'w') as outfile:
+        json.dump(results, outfile, indent=4)
+    print(f"Benchmark completed. Results saved to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure service overhead in-process with a fake OCR engine")
+    parser.add_argument("--services", type=lambda value: value.split(","), default=list(SERVICES),
+                        help=f"comma-separated subset of {','.join(SERVICES)}")
+    parser.add_argument("--requests", type=int, default=50, help="requests per scenario")
+    parser.add_argument("--overhead-ms", type=float, default=5.0, help="fake engine time per call")
+    parser.add_argument("--per-image-ms", type=float, default=10.0, help="fake engine time per image")
+    parser.add_argument("--boxes", type=int, default=20, help="words the fake engine finds per image")
+    parser.add_argument("--dataset", default=DATASET_FOLDER)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,61 @@
+import os
+from fastapi import HTTPException
+
+# Confidence-gated cascade: a cheap engine reads the image first, and only what it is
+# unsure of goes to the requested (heavier) engine.
+#   OCR_CASCADE_FAST_ENGINE          first-pass engine (default tesseract)
+#   OCR_CASCADE_THRESHOLD            first-pass results at or above this confidence are kept
+#   OCR_CASCADE_MAX_ESCALATED_SHARE  above this share of unsure results, or with none found
+#                                    at all, the whole image goes to the heavy engine;
+#                                    below it only the unsure regions are re-read
+OCR_CASCADE_FAST_ENGINE = os.environ.get("OCR_CASCADE_FAST_ENGINE", "tesseract")
+OCR_CASCADE_THRESHOLD = float(os.environ.get("OCR_CASCADE_THRESHOLD", 0.8))
+OCR_CASCADE_MAX_ESCALATED_SHARE = float(os.environ.get("OCR_CASCADE_MAX_ESCALATED_SHARE", 0.5))
+
+
+# Per-request cascade settings, with how a first pass is split and escalated. Results
+# are tagged with the engine that produced them
+class CascadePolicy:
+    def __init__(self, threshold=OCR_CASCADE_THRESHOLD, fast_engine=OCR_CASCADE_FAST_ENGINE, max_escalated_share=OCR_CASCADE_MAX_ESCALATED_SHARE):
+        if not 0.0 <= threshold <= 1.0:
+            raise HTTPException(status_code=400, detail="cascade_threshold must be between 0 and 1.")
+        self.threshold = threshold
+        self.fast_engine = fast_engine
+        self.max_escalated_share = max_escalated_share
+
+    # Rebuild a policy saved with to_params (e.g. in a job's parameters)
+    @classmethod
+    def from_params(cls, params):
+        return cls(**params) if params else None
+
+    def to_params(self):
+        return {"threshold": self.threshold, "fast_engine": self.fast_engine, "max_escalated_share": self.max_escalated_share}
+
+    # First-pass results split into those kept as they are and those to re-read
+    def split(self, results):
+        confident, unsure = [], []
+        for result in results:
+            (confident if result.get("confidence", 0.0) >= self.threshold else unsure).append(result)
+        return confident, unsure
+
+    # Whether the heavy engine should read the whole image rather than the unsure
+    # regions: when the first pass found nothing (it may have missed the text
+    # altogether), when most of it is unsure, or when the heavy engine can only read
+    # whole images
+    def escalate_image(self, results, unsure, can_recognize_regions):
+        if not results:
+            return True
+        if not unsure:
+            return False
+        return not can_recognize_regions or len(unsure) / len(results) > self.max_escalated_share
+
+
+def tag_results(results, engine):
+    return [{**result, "engine": engine} for result in results]
+
+
+# Final results of an image whose unsure regions were re-read: the confident first-pass
+# results, then each unsure region as the heavy engine read it. Regions it reads as
+# empty are dropped, like words no engine found
+def merge_escalated(confident, fast_engine, rereads, heavy_engine):
+    return tag_results(confident, fast_engine) + tag_results([result for result in rereads if result["text"].strip()], heavy_engine)
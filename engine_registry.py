@@ -0,0 +1,248 @@
+import os
+import gc
+import importlib
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+# Registry settings:
+#   OCR_MAX_LOADED_ENGINES   how many engines may be loaded at once; least recently used go first
+#   OCR_ENGINE_IDLE_SECONDS  engines unused for this long are unloaded (0 keeps them forever)
+OCR_MAX_LOADED_ENGINES = int(os.environ.get("OCR_MAX_LOADED_ENGINES", 4))
+OCR_ENGINE_IDLE_SECONDS = float(os.environ.get("OCR_ENGINE_IDLE_SECONDS", 0))
+
+
+# Resident set size of this process in bytes, from /proc where available
+def current_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss is a high-water mark (KB on Linux); good enough as a fallback
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# GPU memory currently held by torch, if torch is in use
+def current_gpu_bytes():
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        return torch.cuda.memory_allocated()
+    return 0
+
+
+class LoadedEngine:
+    def __init__(self, engine, import_time, load_time, warmup_time, memory_bytes, gpu_memory_bytes):
+        self.engine = engine
+        self.import_time = import_time
+        self.load_time = load_time
+        self.warmup_time = warmup_time
+        self.memory_bytes = memory_bytes
+        self.gpu_memory_bytes = gpu_memory_bytes
+        self.last_used = time.monotonic()
+        self.uses = 0
+        # Callers running inference on the engine right now; an unloaded engine is
+        # closed only once the last of them is done
+        self.in_use = 0
+        self.unloaded = False
+
+
+# Loads each OCR engine once, warms it up with a real inference, and keeps it in
+# memory for every later request. Engines are loaded on first use (or preloaded) and
+# unloaded again when they exceed the LRU limit or sit idle for too long. Engines busy
+# with inference are never evicted.
+class EngineRegistry:
+    def __init__(self, max_loaded=OCR_MAX_LOADED_ENGINES, idle_seconds=OCR_ENGINE_IDLE_SECONDS):
+        self.max_loaded = max_loaded
+        self.idle_seconds = idle_seconds
+        self._loaders = {}
+        self._loaded = {}
+        self._lock = threading.Lock()
+        # One lock per engine so a slow load doesn't block requests for other engines
+        self._load_locks = {}
+        self.loads = 0
+        self.evictions = 0
+
+    # loader() builds the engine; warm_up(engine) runs one throwaway inference on it.
+    # `imports` are the engine's libraries, imported first so their cost (torch alone
+    # takes seconds) is measured apart from loading the weights
+    def register(self, name, loader, warm_up=None, imports=()):
+        self._loaders[name] = (loader, warm_up, imports)
+        self._load_locks[name] = threading.Lock()
+
+    def names(self):
+        return list(self._loaders)
+
+    def is_loaded(self, name):
+        return name in self._loaded
+
+    # Return the engine, loading and warming it up first if needed (e.g. to preload
+    # it). Blocking: call it from an inference thread, not from the event loop. Code
+    # running inference on the engine holds it with use() instead, so it can't be
+    # unloaded halfway through.
+    def get(self, name):
+        entry = self._acquire(name)
+        self._release(name, entry)
+        return entry.engine
+
+    # Hold the engine for the duration of the with block: it is neither evicted nor
+    # closed until the block exits
+    @contextmanager
+    def use(self, name):
+        entry = self._acquire(name)
+        try:
+            yield entry.engine
+        finally:
+            self._release(name, entry)
+
+    def _acquire(self, name):
+        if name not in self._loaders:
+            raise ValueError(f"Unsupported OCR model: {name}")
+
+        self.evict_idle()
+        with self._load_locks[name]:
+            with self._lock:
+                entry = self._loaded.get(name)
+                if entry is not None:
+                    self._hold(entry)
+            if entry is None:
+                entry = self._load(name)
+                with self._lock:
+                    self._hold(entry)
+                    self._loaded[name] = entry
+                self._evict_over_limit(keep=name)
+        return entry
+
+    # Called with self._lock held
+    def _hold(self, entry):
+        entry.in_use += 1
+        entry.uses += 1
+        entry.last_used = time.monotonic()
+
+    def _release(self, name, entry):
+        with self._lock:
+            entry.in_use -= 1
+            # Idle time counts from the end of the last call, not its start
+            entry.last_used = time.monotonic()
+            close = entry.unloaded and entry.in_use == 0
+        if close:
+            self._close(name, entry)
+
+    def _load(self, name):
+        loader, warm_up, imports = self._loaders[name]
+        rss_before = current_rss_bytes()
+        gpu_before = current_gpu_bytes()
+
+        start_time = time.perf_counter()
+        for module in imports:
+            importlib.import_module(module)
+        import_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        engine = loader()
+        load_time = time.perf_counter() - start_time
+
+        # The first inference pays for lazy initialization (CUDA context, cuDNN
+        # autotuning, graph tracing); pay it here instead of in a user's request
+        start_time = time.perf_counter()
+        if warm_up is not None:
+            try:
+                warm_up(engine)
+            except Exception:
+                # The engine is dropped: release its processes or other resources now
+                if hasattr(engine, "close"):
+                    engine.close()
+                raise
+        warmup_time = time.perf_counter() - start_time
+
+        self.loads += 1
+        print(f"Loaded OCR engine {name} in {load_time:.2f}s (imports {import_time:.2f}s, warm-up {warmup_time:.2f}s)")
+        return LoadedEngine(
+            engine,
+            import_time,
+            load_time,
+            warmup_time,
+            max(0, current_rss_bytes() - rss_before),
+            max(0, current_gpu_bytes() - gpu_before),
+        )
+
+    # Drop the engine from the registry. It is closed at once if idle, otherwise when
+    # its last user releases it
+    def unload(self, name):
+        with self._lock:
+            entry = self._loaded.pop(name, None)
+            if entry is None:
+                return False
+            entry.unloaded = True
+            busy = entry.in_use > 0
+            self.evictions += 1
+        if busy:
+            print(f"Unloading OCR engine {name} once its running calls finish")
+        else:
+            self._close(name, entry)
+        return True
+
+    def _close(self, name, entry):
+        # Engines that own processes or other resources release them explicitly
+        if hasattr(entry.engine, "close"):
+            entry.engine.close()
+        del entry
+        gc.collect()
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        print(f"Unloaded OCR engine {name}")
+
+    def _evict_over_limit(self, keep):
+        while True:
+            with self._lock:
+                if len(self._loaded) <= self.max_loaded:
+                    return
+                candidates = [name for name, entry in self._loaded.items() if name != keep and not entry.in_use]
+                if not candidates:
+                    return
+                victim = min(candidates, key=lambda name: self._loaded[name].last_used)
+            self.unload(victim)
+
+    def evict_idle(self):
+        if not self.idle_seconds:
+            return
+        now = time.monotonic()
+        with self._lock:
+            idle = [
+                name for name, entry in self._loaded.items()
+                if not entry.in_use and now - entry.last_used > self.idle_seconds
+            ]
+        for name in idle:
+            self.unload(name)
+
+    def stats(self):
+        now = time.monotonic()
+        engines = {}
+        for name in self._loaders:
+            entry = self._loaded.get(name)
+            if entry is None:
+                engines[name] = {"loaded": False}
+                continue
+            engines[name] = {
+                "loaded": True,
+                "import_time_seconds": entry.import_time,
+                "load_time_seconds": entry.load_time,
+                "warmup_time_seconds": entry.warmup_time,
+                "memory_bytes": entry.memory_bytes,
+                "gpu_memory_bytes": entry.gpu_memory_bytes,
+                "idle_seconds": now - entry.last_used,
+                "uses": entry.uses,
+                "in_use": entry.in_use,
+            }
+            # Engines that run in their own processes report on them
+            if hasattr(entry.engine, "stats"):
+                engines[name]["processes"] = entry.engine.stats()
+        return {
+            "max_loaded": self.max_loaded,
+            "idle_seconds": self.idle_seconds,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "engines": engines,
+        }
@@ -0,0 +1,137 @@
+import os
+import math
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from evaluation_store import hash_file
+
+# Requests kept in flight at once by the evaluation scripts
+OCR_EVAL_WORKERS = int(os.environ.get("OCR_EVAL_WORKERS", 8))
+
+# Upper bounds on one multi-file /ocr request
+OCR_EVAL_MAX_BATCH_FILES = int(os.environ.get("OCR_EVAL_MAX_BATCH_FILES", 8))
+OCR_EVAL_MAX_BATCH_BYTES = int(os.environ.get("OCR_EVAL_MAX_BATCH_BYTES", 32 * 1024 * 1024))
+
+# Seconds before a single request is given up on
+OCR_EVAL_TIMEOUT = float(os.environ.get("OCR_EVAL_TIMEOUT", 600))
+
+# Batches aimed for per worker: enough that no worker sits idle while the last
+# large batch finishes, few enough that batching still pays off
+BATCHES_PER_WORKER = 4
+
+
+# Session with a persistent connection, retrying overloaded (429/503, honoring
+# Retry-After) and failed gateway responses like benchMark.py does
+def make_session():
+    session = requests.Session()
+    retries = Retry(total=5, backoff_factor=1, status_forcelist=[502, 503, 504, 429], allowed_methods=None)
+    session.mount('https://', HTTPAdapter(max_retries=retries))
+    session.mount('http://', HTTPAdapter(max_retries=retries))
+    return session
+
+
+# Sends the evaluation images to the OCR service from a pool of workers, each with its
+# own pooled session, several images per request. Responses already in the store are
+# not requested again. run() yields responses in input order as soon as each one (and
+# everything before it) is ready, so the caller scores while later requests are still
+# in flight and the results don't depend on which request finished first.
+class EvaluationRunner:
+    def __init__(self, service_url, store, workers=OCR_EVAL_WORKERS,
+                 max_batch_files=OCR_EVAL_MAX_BATCH_FILES, max_batch_bytes=OCR_EVAL_MAX_BATCH_BYTES):
+        self.service_url = service_url
+        self.store = store
+        self.workers = max(1, workers)
+        self.max_batch_files = max(1, max_batch_files)
+        self.max_batch_bytes = max_batch_bytes
+        self._local = threading.local()
+
+    def _session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = make_session()
+        return self._local.session
+
+    # Group the images to request into batches: as many files per request as spreads
+    # the work over BATCHES_PER_WORKER batches per worker, within the file and byte caps
+    def make_batches(self, pending):
+        files_per_batch = math.ceil(len(pending) / (self.workers * BATCHES_PER_WORKER)) if pending else 1
+        files_per_batch = min(max(1, files_per_batch), self.max_batch_files)
+
+        batches = []
+        batch, batch_bytes = [], 0
+        for index, image_path in pending:
+            size = os.path.getsize(image_path)
+            if batch and (len(batch) >= files_per_batch or batch_bytes + size > self.max_batch_bytes):
+                batches.append(batch)
+                batch, batch_bytes = [], 0
+            batch.append((index, image_path))
+            batch_bytes += size
+        if batch:
+            batches.append(batch)
+        return batches
+
+    # One /ocr request for a batch; the response of each image, or None when it failed.
+    # Each image's result is kept in the shape of a single-image response
+    def post_batch(self, batch):
+        image_paths = [image_path for _, image_path in batch]
+        print(f"Requesting OCR results for {len(image_paths)} images: {', '.join(map(os.path.basename, image_paths))}")
+        try:
+            with contextlib.ExitStack() as stack:
+                files = [
+                    ('files', (os.path.basename(image_path), stack.enter_context(open(image_path, 'rb')), 'image/jpeg'))
+                    for image_path in image_paths
+                ]
+                response = self._session().post(self.service_url, files=files, timeout=OCR_EVAL_TIMEOUT)
+        except requests.RequestException as e:
+            print(f"Error: OCR request failed for {', '.join(image_paths)}: {e}")
+            return [None] * len(batch)
+
+        if response.status_code != 200:
+            print(f"Error: OCR service failed for {', '.join(image_paths)}. Status code: {response.status_code}")
+            return [None] * len(batch)
+        try:
+            results = response.json()
+        except ValueError:
+            print(f"Error: Failed to parse JSON response for {', '.join(image_paths)}.")
+            return [None] * len(batch)
+        if not isinstance(results, list) or len(results) != len(batch):
+            print(f"Error: Expected {len(batch)} results for {', '.join(image_paths)}, got {results!r:.200}")
+            return [None] * len(batch)
+        return [[result] for result in results]
+
+    # (image_path, response) for every image, in the order given. The response is None
+    # when the request failed or, in replay mode, nothing was recorded for the image
+    def run(self, image_paths):
+        image_hashes = []
+        stored = {}
+        pending = []
+        for index, image_path in enumerate(image_paths):
+            image_hash = hash_file(image_path)
+            image_hashes.append(image_hash)
+            response = self.store.lookup(image_hash, os.path.basename(image_path))
+            if response is not None:
+                stored[index] = response
+            elif self.store.mode != "replay":
+                pending.append((index, image_path))
+
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ocr-eval")
+        try:
+            requested = {}
+            for batch in self.make_batches(pending):
+                future = executor.submit(self.post_batch, batch)
+                for position, (index, _) in enumerate(batch):
+                    requested[index] = (future, position)
+
+            for index, image_path in enumerate(image_paths):
+                if index in requested:
+                    future, position = requested[index]
+                    response = future.result()[position]
+                    self.store.record(image_hashes[index], os.path.basename(image_path), response)
+                else:
+                    response = stored.get(index)
+                yield image_path, response
+        finally:
+            # Stopped early: drop the batches that haven't been sent yet
+            executor.shutdown(wait=True, cancel_futures=True)
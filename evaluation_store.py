@@ -0,0 +1,107 @@
+import os
+import json
+import hashlib
+from urllib.parse import urlparse
+
+# Record-and-replay settings for the evaluation scripts:
+#   OCR_EVAL_MODE       record: reuse stored responses, request and store only missing ones
+#                       replay: stored responses only, never touch the network
+#                       live:   always request, and store what comes back
+#   OCR_EVAL_STORE_DIR  where responses are kept
+#   OCR_MODEL_VERSION   label of the deployed model; a new label means new responses.
+#                       Required: with a default, responses of a redeployed model would
+#                       be replayed as if they were the old one's
+OCR_EVAL_MODE = os.environ.get("OCR_EVAL_MODE", "record")
+OCR_EVAL_STORE_DIR = os.environ.get("OCR_EVAL_STORE_DIR", "ocr_response_store")
+OCR_MODEL_VERSION = os.environ.get("OCR_MODEL_VERSION")
+
+EVAL_MODES = ("record", "replay", "live")
+
+
+# Function to extract service name from URL
+def get_service_name(url):
+    parsed_url = urlparse(url)
+    # Extract the service name from the hostname (e.g., 'shubhamsaini01--ocr-service-fastapi-modal-app')
+    service_name = parsed_url.hostname.split('--')[1]
+    return service_name
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Raw OCR service responses on disk, one JSON file per (service, model version, image
+# content). Scoring code reads them back instead of calling the service, so metric or
+# filter changes are re-scored without inference, and only images or model versions
+# that changed are ever requested again.
+class ResponseStore:
+    def __init__(self, service_url, model_version=OCR_MODEL_VERSION, mode=OCR_EVAL_MODE, directory=OCR_EVAL_STORE_DIR):
+        if mode not in EVAL_MODES:
+            raise ValueError(f"Unsupported evaluation mode: {mode}. Available modes are {list(EVAL_MODES)}.")
+        self.service_name = get_service_name(service_url)
+        self.model_version = model_version
+        self.mode = mode
+        self.service_directory = os.path.join(directory, self.service_name)
+        self.directory = os.path.join(self.service_directory, model_version) if model_version else None
+        self.hits = 0
+        self.requests = 0
+        self.missing = 0
+
+    # Checked on first use rather than here, so scripts that import the evaluation
+    # modules for their scoring code alone don't need a version
+    def _check_version(self):
+        if self.directory is None:
+            recorded = sorted(os.listdir(self.service_directory)) if os.path.isdir(self.service_directory) else []
+            raise ValueError(
+                f"Set OCR_MODEL_VERSION to a label of the deployed model, and a new one after every redeploy. "
+                f"Versions recorded for {self.service_name}: {recorded or 'none'}."
+            )
+
+    def _path(self, image_hash):
+        return os.path.join(self.directory, image_hash[:2], f"{image_hash}.json")
+
+    def get(self, image_hash):
+        try:
+            with open(self._path(image_hash), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, image_hash, image_name, response):
+        path = self._path(image_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so an interrupted run never leaves a truncated entry
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"image_name": image_name, "response": response}, f)
+        os.replace(tmp_path, path)
+
+    # Stored response for an image, or None when it has to be requested (or, in replay
+    # mode, was never recorded)
+    def lookup(self, image_hash, image_name):
+        self._check_version()
+        if self.mode == "live":
+            return None
+        entry = self.get(image_hash)
+        if entry is not None:
+            self.hits += 1
+            return entry["response"]
+        if self.mode == "replay":
+            self.missing += 1
+            print(f"No stored response for {image_name} ({self.service_name}, {self.model_version}); skipping in replay mode.")
+        return None
+
+    # Keep a response the service just returned; failed requests (None) aren't stored
+    def record(self, image_hash, image_name, response):
+        self._check_version()
+        self.requests += 1
+        if response is not None:
+            self.put(image_hash, image_name, response)
+
+    def summary(self):
+        return (f"Response store {self.directory} ({self.mode}): {self.hits} replayed, "
+                f"{self.requests} requested, {self.missing} missing")
@@ -0,0 +1,192 @@
+import os
+import json
+import shutil
+import argparse
+import xml.etree.ElementTree as ET
+from array import array
+import numpy as np
+
+# CVAT export of the benchmark annotations
+ANNOTATIONS_PATH = "benchmark_dataset/annotations.xml"
+
+# Files of the columnar format: one row per box in boxes/rotations/labels/z_orders,
+# the text of box i at text[text_offsets[i]:text_offsets[i + 1]], the boxes of image j
+# at rows image_offsets[j]:image_offsets[j + 1]; image and label names in index.json
+INDEX_FILE = "index.json"
+COLUMNS = ("boxes", "rotations", "labels", "z_orders", "text", "text_offsets", "image_offsets")
+FORMAT_VERSION = 1
+
+
+# Where the columnar copy of an annotations file is kept by default
+def default_output_dir(xml_path):
+    return os.path.splitext(xml_path)[0] + "_columnar"
+
+
+def source_signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+# Convert a CVAT XML export into the columnar format in output_dir. The XML is parsed
+# incrementally and every <image> is dropped once read, so memory holds the columns
+# being built rather than the document tree
+def convert_cvat(xml_path, output_dir=None):
+    output_dir = output_dir or default_output_dir(xml_path)
+    boxes = array('d')
+    rotations = array('d')
+    labels = array('H')
+    z_orders = array('i')
+    text = bytearray()
+    text_offsets = array('q', [0])
+    image_offsets = array('q', [0])
+    image_names = []
+    label_names = {}
+
+    root = None
+    for event, element in ET.iterparse(xml_path, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+            continue
+        if element.tag != "image":
+            continue
+
+        for box in element.iter("box"):
+            boxes.extend(float(box.get(key)) for key in ("xtl", "ytl", "xbr", "ybr"))
+            rotations.append(float(box.get("rotation", 0.0)))
+            labels.append(label_names.setdefault(box.get("label"), len(label_names)))
+            z_orders.append(int(box.get("z_order", 0)))
+            value = next((attribute.text or "" for attribute in box.iter("attribute") if attribute.get("name") == "text"), "")
+            text.extend(value.encode("utf-8"))
+            text_offsets.append(len(text))
+        image_names.append(element.get("name"))
+        image_offsets.append(len(rotations))
+        root.clear()
+
+    columns = {
+        "boxes": np.frombuffer(boxes, dtype=np.float64).reshape(-1, 4),
+        "rotations": np.frombuffer(rotations, dtype=np.float64),
+        "labels": np.frombuffer(labels, dtype=np.uint16),
+        "z_orders": np.frombuffer(z_orders, dtype=np.int32),
+        "text": np.frombuffer(bytes(text), dtype=np.uint8),
+        "text_offsets": np.frombuffer(text_offsets, dtype=np.int64),
+        "image_offsets": np.frombuffer(image_offsets, dtype=np.int64),
+    }
+    index = {
+        "format_version": FORMAT_VERSION,
+        "source": source_signature(xml_path),
+        "images": image_names,
+        "labels": list(label_names),
+    }
+
+    # Build next to the target and swap it in, so readers never see a partial copy
+    tmp_dir = f"{output_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, column in columns.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), column)
+    with open(os.path.join(tmp_dir, INDEX_FILE), 'w') as f:
+        json.dump(index, f)
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp_dir, output_dir)
+    print(f"Converted {len(image_names)} images and {len(rotations)} boxes from {xml_path} to {output_dir}")
+    return output_dir
+
+
+# Ground truth in the columnar format, memory-mapped: opening it reads only the index,
+# and an image's rows are paged in when they are looked up. get() returns the same
+# per-image annotation dicts as ground_truth_converted.json
+class GroundTruth:
+    def __init__(self, directory):
+        with open(os.path.join(directory, INDEX_FILE), 'r') as f:
+            index = json.load(f)
+        self.directory = directory
+        self.source = index.get("source")
+        self.label_names = index["labels"]
+        self.image_names = index["images"]
+        self._image_index = {name: i for i, name in enumerate(self.image_names)}
+        for name in COLUMNS:
+            setattr(self, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.image_names)
+
+    def __contains__(self, image_name):
+        return image_name in self._image_index
+
+    # Row range of an image's boxes
+    def rows(self, image_name):
+        i = self._image_index[image_name]
+        return int(self.image_offsets[i]), int(self.image_offsets[i + 1])
+
+    def texts(self, start, stop):
+        offsets = self.text_offsets[start:stop + 1]
+        data = bytes(self.text[offsets[0]:offsets[-1]])
+        return [data[a - offsets[0]:b - offsets[0]].decode("utf-8") for a, b in zip(offsets[:-1], offsets[1:])]
+
+    # (boxes as (N, 4) xtl/ytl/xbr/ybr, rotations, texts) of one image
+    def arrays(self, image_name):
+        start, stop = self.rows(image_name)
+        return self.boxes[start:stop], self.rotations[start:stop], self.texts(start, stop)
+
+    def get(self, image_name, default=None):
+        if image_name not in self._image_index:
+            return default
+        start, stop = self.rows(image_name)
+        annotations = []
+        for (xtl, ytl, xbr, ybr), rotation, label, z_order, text in zip(
+            self.boxes[start:stop].tolist(), self.rotations[start:stop].tolist(), self.labels[start:stop].tolist(),
+            self.z_orders[start:stop].tolist(), self.texts(start, stop)
+        ):
+            annotations.append({
+                "label": self.label_names[label],
+                "bounding_box": [[xtl, ytl], [xbr, ytl], [xbr, ybr], [xtl, ybr]],
+                "rotation": rotation,
+                "z_order": z_order,
+                "attributes": {"text": text},
+            })
+        return annotations
+
+    def __getitem__(self, image_name):
+        if image_name not in self._image_index:
+            raise KeyError(image_name)
+        return self.get(image_name)
+
+    # Every image in the layout of ground_truth_converted.json
+    def to_json(self):
+        return {"annotations": {name: self.get(name) for name in self.image_names}}
+
+
+# Ground truth for the evaluation scripts, from any of: a CVAT XML export (converted on
+# first use and whenever the XML changes), a converted directory, or a JSON file with
+# an "annotations" mapping like ground_truth_converted.json
+def load_ground_truth(path=ANNOTATIONS_PATH):
+    print(f"Loading ground truth data from {path}...")
+    if os.path.isdir(path):
+        return GroundTruth(path)
+    if path.endswith(".json"):
+        with open(path, 'r') as f:
+            return json.load(f).get("annotations", {})
+
+    output_dir = default_output_dir(path)
+    try:
+        ground_truth = GroundTruth(output_dir)
+        if ground_truth.source == source_signature(path):
+            return ground_truth
+    except (OSError, ValueError, KeyError):
+        pass
+    return GroundTruth(convert_cvat(path, output_dir))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert CVAT annotations into the columnar ground truth format")
+    parser.add_argument("annotations", nargs="?", default=ANNOTATIONS_PATH, help="CVAT XML export")
+    parser.add_argument("--output", help="output directory (default: next to the XML)")
+    parser.add_argument("--json", help="also write the annotations as JSON, e.g. ground_truth_converted.json")
+    args = parser.parse_args()
+
+    ground_truth = GroundTruth(convert_cvat(args.annotations, args.output))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(ground_truth.to_json(), f, indent=4)
+        print(f"Ground truth JSON saved to {args.json}")
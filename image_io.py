@@ -0,0 +1,172 @@
+import os
+import struct
+import asyncio
+from fastapi import HTTPException
+
+# Uploads are read in chunks of this size so the size limit is enforced as bytes arrive
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
+
+# Largest image (width * height) we are willing to decode. A small, highly compressed
+# PNG can claim a huge canvas (decompression bomb); reject it from the header instead
+# of allocating the full bitmap.
+MAX_IMAGE_PIXELS = int(os.environ.get("OCR_MAX_IMAGE_PIXELS", 100_000_000))
+
+# Read an UploadFile into memory chunk by chunk, failing as soon as it grows past max_size.
+# Returns the bytearray itself (no final bytes() copy); np.frombuffer accepts it directly.
+async def read_upload(file, max_size):
+    content = bytearray()
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        content += chunk
+        if len(content) > max_size:
+            raise HTTPException(status_code=413, detail=f"File size of {file.filename} exceeds maximum limit of {max_size // (1024 * 1024)}MB.")
+    return content
+
+# Write an UploadFile to path chunk by chunk, with the same size limit, so a large
+# upload never has to fit in memory. Returns the number of bytes written
+async def save_upload(file, path, max_size):
+    size = 0
+    with open(path, "wb") as f:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                raise HTTPException(status_code=413, detail=f"File size of {file.filename} exceeds maximum limit of {max_size // (1024 * 1024)}MB.")
+            await asyncio.to_thread(f.write, chunk)
+    return size
+
+# Return (width, height) from the image header without decoding pixels, or None for
+# formats we don't parse. Covers PNG, JPEG, GIF, BMP and WebP.
+def read_image_size(data):
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        width, height = struct.unpack(">II", data[16:24])
+        return width, height
+
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        width, height = struct.unpack("<HH", data[6:10])
+        return width, height
+
+    if data[:2] == b"BM" and len(data) >= 26:
+        width, height = struct.unpack("<ii", data[18:26])
+        return abs(width), abs(height)
+
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP" and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", data[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(data[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            width = int.from_bytes(data[24:27], "little") + 1
+            height = int.from_bytes(data[27:30], "little") + 1
+            return width, height
+
+    if data[:2] == b"\xff\xd8":
+        # Walk the JPEG markers until a start-of-frame segment
+        offset = 2
+        while offset + 4 <= len(data):
+            if data[offset] != 0xFF:
+                offset += 1
+                continue
+            marker = data[offset + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                offset += 2
+                continue
+            if marker == 0xFF:
+                offset += 1
+                continue
+            (segment_length,) = struct.unpack(">H", data[offset + 2:offset + 4])
+            if marker in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+                if offset + 9 > len(data):
+                    return None
+                height, width = struct.unpack(">HH", data[offset + 5:offset + 9])
+                return width, height
+            offset += 2 + segment_length
+
+    return None
+
+# Reject images whose header claims more pixels than MAX_IMAGE_PIXELS
+def check_image_size(data, file_name="image"):
+    size = read_image_size(data)
+    if size is not None and size[0] * size[1] > MAX_IMAGE_PIXELS:
+        raise HTTPException(status_code=413, detail=f"Image {file_name} is {size[0]}x{size[1]} pixels, which exceeds the limit of {MAX_IMAGE_PIXELS} pixels.")
+    return size
+
+# Decode image bytes straight from memory into a BGR array, without a temp file
+def decode_image(data, file_name="image"):
+    # Imported here so services that only stream uploads don't need OpenCV locally
+    import numpy as np
+    import cv2
+
+    check_image_size(data, file_name)
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise HTTPException(status_code=400, detail=f"Failed to decode the image {file_name}.")
+    # Formats without a parsed header are still bounded after decoding
+    if img.shape[0] * img.shape[1] > MAX_IMAGE_PIXELS:
+        raise HTTPException(status_code=413, detail=f"Image {file_name} exceeds the limit of {MAX_IMAGE_PIXELS} pixels.")
+    return img
+
+
+# Pure ASGI middleware that caps the whole request body while it is being received.
+# Starlette spools multipart uploads before the handler runs, so without this a client
+# could still push an arbitrarily large body before read_upload ever sees it.
+class RequestSizeLimitMiddleware:
+    def __init__(self, app, max_body_size):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        # Fail fast when the client announces the size up front
+        for name, value in scope.get("headers", []):
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_body_size:
+                return await self._reject(send)
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    raise _BodyTooLarge()
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _BodyTooLarge:
+            if not response_started:
+                await self._reject(send)
+
+    async def _reject(self, send):
+        body = b'{"detail":"Request body exceeds the maximum allowed size."}'
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+# Raised from inside the request stream; as an HTTPException it is turned into a 413
+# response by FastAPI's own exception handling while the form is being parsed
+class _BodyTooLarge(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=413, detail="Request body exceeds the maximum allowed size.")
@@ -0,0 +1,49 @@
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+# Runs blocking inference calls off the asyncio event loop. Thread pools suit engines
+# that release the GIL while they work (EasyOCR/torch, TensorFlow, Paddle); a process
+# pool suits engines that hold it (Tesseract through pytesseract).
+# At most max_workers calls run at once; further callers wait on the event loop,
+# where they stay cancellable, instead of piling up inside the executor's queue.
+class BoundedExecutor:
+    def __init__(self, name, max_workers, kind="thread"):
+        if max_workers < 1:
+            raise ValueError(f"Concurrency for {name} must be at least 1.")
+        self.name = name
+        self.max_workers = max_workers
+        self.kind = kind
+        if kind == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-inference")
+        elif kind == "process":
+            self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            raise ValueError(f"Unsupported executor kind: {kind}")
+        self._semaphore = asyncio.Semaphore(max_workers)
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+# Per-engine concurrency, overridable with OCR_<ENGINE>_CONCURRENCY (e.g. OCR_EASYOCR_CONCURRENCY=2)
+def get_engine_concurrency(engine_name, default):
+    value = os.environ.get(f"OCR_{engine_name.upper()}_CONCURRENCY")
+    return int(value) if value else default
+
+
+_executors = {}
+
+# Return the shared executor for an engine, creating it on first use
+def get_executor(engine_name, kind="thread", default_concurrency=1):
+    if engine_name not in _executors:
+        max_workers = get_engine_concurrency(engine_name, default_concurrency)
+        _executors[engine_name] = BoundedExecutor(engine_name, max_workers, kind=kind)
+    return _executors[engine_name]
@@ -0,0 +1,463 @@
+import os
+import sys
+import time
+import queue
+import signal
+import threading
+import traceback
+import multiprocessing
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Connection
+from multiprocessing.reduction import recv_handle, send_handle
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+
+# Multi-process inference for CPU engines. The API process keeps the event loop,
+# uploads, decoding and response formatting; inference runs in long-lived worker
+# processes, so CPU-bound engine code is no longer serialized by one process's GIL.
+#   OCR_INFERENCE_WORKERS   worker processes per pooled engine (0 runs every engine
+#                           in-process, on inference threads)
+#   OCR_WORKER_ENGINES      engines run in workers; CPU engines only, CUDA state does
+#                           not survive the fork
+#   OCR_WORKER_THREADS      torch/OpenCV threads per worker (default: cores / workers)
+#   OCR_WORKER_BUFFER_BYTES initial shared-memory buffer per worker; grown on demand
+#   OCR_WORKER_TIMEOUT      seconds a batch may take before its worker is replaced
+OCR_INFERENCE_WORKERS = int(os.environ.get("OCR_INFERENCE_WORKERS", 0))
+OCR_WORKER_ENGINES = [name for name in os.environ.get("OCR_WORKER_ENGINES", "easyocr_onnx").split(",") if name]
+OCR_WORKER_THREADS = int(os.environ.get("OCR_WORKER_THREADS", 0))
+OCR_WORKER_BUFFER_BYTES = int(os.environ.get("OCR_WORKER_BUFFER_BYTES", 64 * 1024 * 1024))
+OCR_WORKER_TIMEOUT = float(os.environ.get("OCR_WORKER_TIMEOUT", 300))
+
+# Images are placed at multiples of this in the buffer, so every view is aligned
+ALIGNMENT = 64
+
+
+def aligned(size):
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+# Worker process: runs tasks on the engine it inherited from the fork server. Images
+# arrive as (offset, shape, dtype) layouts into the shared buffer and are used in place
+def worker_main(conn, engine, warm_up, buffer_name, threads, warm_up_first=False):
+    buffer = SharedMemory(name=buffer_name)
+    # Each worker gets its share of the cores: N workers x every core's worth of
+    # threads would oversubscribe the CPU
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
+    cv2 = sys.modules.get("cv2")
+    if cv2 is not None:
+        cv2.setNumThreads(threads)
+    # Replacement workers warm themselves up before reading their first task, so nobody
+    # waits on it; if it fails, the first task reports the underlying error
+    if warm_up_first and warm_up is not None:
+        try:
+            warm_up(engine)
+        except Exception:
+            pass
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        kind = message[0]
+        if kind == "stop":
+            break
+        try:
+            if kind == "warm_up":
+                if warm_up is not None:
+                    warm_up(engine)
+                conn.send(("ok", None))
+            elif kind == "task":
+                _, task, layouts, args = message
+                images = [np.ndarray(shape, dtype=dtype, buffer=buffer.buf, offset=offset) for offset, shape, dtype in layouts]
+                try:
+                    conn.send(("ok", task(engine, images, *args)))
+                finally:
+                    # Views into the buffer must be gone before it can ever be closed
+                    del images
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+    buffer.close()
+
+
+# Fork server: a single-threaded process forked once, when the pool is created, that
+# forks every worker. Replacements are forked from here instead of from the API
+# process, whose executor and runtime threads may hold locks at the moment of a fork
+# that the child would never see released. A worker's end of its pipe is handed to
+# the API process over `conn`; `api_conn` is the API process's own end, inherited by
+# the fork
+def fork_server_main(conn, api_conn, engine, warm_up, threads):
+    # Closed, so the server sees EOF if the API process dies
+    api_conn.close()
+    # Terminated with the API process: stop the workers too instead of orphaning them
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    pids = set()
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                return
+            kind = message[0]
+            if kind == "exit":
+                return
+            if kind == "stop":
+                _, pid, kill = message
+                pids.discard(pid)
+                conn.send(("ok", reap(pid, kill)))
+                continue
+            _, buffer_name, warm_up_first = message
+            try:
+                parent_conn, child_conn = multiprocessing.Pipe()
+                pid = os.fork()
+            except OSError as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+                continue
+            if pid == 0:
+                exit_code = 0
+                try:
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    conn.close()
+                    parent_conn.close()
+                    worker_main(child_conn, engine, warm_up, buffer_name, threads, warm_up_first)
+                except BaseException:
+                    traceback.print_exc()
+                    exit_code = 1
+                finally:
+                    os._exit(exit_code)
+            pids.add(pid)
+            # Only the worker holds its end, so a crash shows up in the API process as EOF
+            child_conn.close()
+            conn.send(("ok", pid))
+            send_handle(conn, parent_conn.fileno(), None)
+            parent_conn.close()
+    finally:
+        for pid in pids:
+            reap(pid, kill=True)
+
+
+# Wait for a worker to exit (killing it first, or after `timeout`) and return its exit
+# code, negative for a signal like multiprocessing's
+def reap(pid, kill, timeout=5):
+    if kill:
+        os.kill(pid, signal.SIGKILL)
+    deadline = time.monotonic() + timeout
+    while True:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            return os.waitstatus_to_exitcode(status)
+        if time.monotonic() > deadline:
+            os.kill(pid, signal.SIGKILL)
+            return os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+        time.sleep(0.01)
+
+
+# Worker-side tasks: each takes the engine and the shared images and returns
+# (result, stage timings)
+def batch_task(engine, images, run_batch, allowlist):
+    timings = {}
+    return run_batch(engine, images, timings, allowlist), timings
+
+def recognize_task(engine, images, recognize, boxes):
+    timings = {}
+    return recognize(engine, images[0], boxes, timings), timings
+
+
+class WorkerCrashed(RuntimeError):
+    pass
+
+
+class Worker:
+    def __init__(self, pid, conn, buffer):
+        self.pid = pid
+        self.conn = conn
+        self.buffer = buffer
+        self.exitcode = None
+        # Set when the worker died or timed out: a late reply may still be on its
+        # pipe, so it never takes another request
+        self.broken = False
+        self.stopped = False
+
+
+# An engine spread over long-lived worker processes. The engine is loaded once, here,
+# and the workers are forked from a fork server started right after, so they share its
+# weights copy-on-write instead of each loading a copy. Every worker owns a shared-memory
+# buffer: a batch's images are copied into it once and the worker reads them in place,
+# instead of pickling arrays through a pipe. Only the (small) results are pickled back.
+# One batch runs per worker at a time; a worker that crashes or hangs fails only its
+# batch and is replaced by a fresh fork.
+class InferenceWorkerPool:
+    def __init__(self, name, loader, warm_up=None, workers=OCR_INFERENCE_WORKERS, threads=OCR_WORKER_THREADS,
+                 buffer_bytes=OCR_WORKER_BUFFER_BYTES, timeout=OCR_WORKER_TIMEOUT):
+        if workers < 1:
+            raise ValueError(f"Worker count for {name} must be at least 1.")
+        torch = sys.modules.get("torch")
+        self.name = name
+        self.engine = loader()
+        if torch is not None and torch.cuda.is_available() and torch.cuda.is_initialized():
+            raise RuntimeError(f"{name} initialized CUDA, which forked workers can't use; run it in-process instead.")
+        self.workers = workers
+        self.threads = threads or max(1, (os.cpu_count() or 1) // workers)
+        self.timeout = timeout
+        self.batches = 0
+        self.crashes = 0
+        self.restarts = 0
+        self._lock = threading.Lock()
+        self._server_lock = threading.Lock()
+        self._all = []
+        # Every process in the tree shares the API process's tracker, so the workers
+        # attaching to a buffer don't each start one that would unlink it on exit
+        resource_tracker.ensure_running()
+        context = multiprocessing.get_context("fork")
+        self._server_conn, server_conn = context.Pipe()
+        self._server = context.Process(
+            target=fork_server_main, args=(server_conn, self._server_conn, self.engine, warm_up, self.threads),
+            name=f"{name}-fork-server", daemon=True,
+        )
+        self._server.start()
+        server_conn.close()
+        try:
+            for _ in range(workers):
+                self._all.append(self._start_worker(buffer_bytes))
+        except BaseException:
+            self.close()
+            raise
+        self._idle = queue.Queue()
+        for worker in self._all:
+            self._idle.put(worker)
+
+    # One request to the fork server and its reply
+    def _call_server(self, message):
+        with self._server_lock:
+            try:
+                self._server_conn.send(message)
+                status, payload = self._server_conn.recv()
+                if status == "ok" and message[0] == "start":
+                    payload = (payload, Connection(recv_handle(self._server_conn)))
+            except (EOFError, OSError):
+                raise WorkerCrashed(f"{self.name} fork server is gone (exit code {self._server.exitcode})")
+        if status == "error":
+            raise RuntimeError(payload)
+        return payload
+
+    def _start_worker(self, buffer_bytes, warm_up_first=False):
+        buffer = SharedMemory(create=True, size=buffer_bytes)
+        try:
+            pid, conn = self._call_server(("start", buffer.name, warm_up_first))
+        except BaseException:
+            buffer.close()
+            buffer.unlink()
+            raise
+        return Worker(pid, conn, buffer)
+
+    # Stop a worker and free its buffer; stopping it again does nothing
+    def _stop_worker(self, worker, kill=False):
+        if worker.stopped:
+            return
+        worker.stopped = True
+        if not kill:
+            try:
+                worker.conn.send(("stop",))
+            except OSError:
+                pass
+        try:
+            worker.exitcode = self._call_server(("stop", worker.pid, kill))
+        except WorkerCrashed:
+            # Without the fork server nobody can reap it, but it must not keep running
+            try:
+                os.kill(worker.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        worker.conn.close()
+        worker.buffer.close()
+        worker.buffer.unlink()
+
+    # Swap a worker for a fresh fork, with a buffer of at least buffer_bytes. The
+    # replacement warms itself up, so this doesn't wait on it. If it can't be started,
+    # this raises and `worker` stays broken, so the next request tries again
+    def _replace(self, worker, buffer_bytes=0, kill=False):
+        worker.broken = True
+        self._stop_worker(worker, kill=kill)
+        replacement = self._start_worker(max(buffer_bytes, worker.buffer.size), warm_up_first=True)
+        with self._lock:
+            self._all[self._all.index(worker)] = replacement
+            self.restarts += 1
+        return replacement
+
+    # The worker to put back in the pool after a request: itself, or its replacement
+    # when it died or fell out of step with its pipe. If no replacement can be started,
+    # the broken worker goes back instead, so the pool never loses the slot
+    def _usable(self, worker):
+        # Nothing is due on an idle worker's pipe, so anything there is the EOF of a
+        # worker that died
+        if not worker.broken and worker.conn.poll(0):
+            self._mark_broken(worker)
+        if worker.broken:
+            try:
+                return self._replace(worker, kill=True)
+            except Exception as e:
+                print(f"Couldn't replace a {self.name} inference worker: {str(e)}")
+        return worker
+
+    def _mark_broken(self, worker):
+        worker.broken = True
+        with self._lock:
+            self.crashes += 1
+
+    def _request(self, worker, message):
+        try:
+            worker.conn.send(message)
+        except OSError:
+            self._mark_broken(worker)
+            self._stop_worker(worker, kill=True)
+            raise WorkerCrashed(f"{self.name} inference worker is gone (exit code {worker.exitcode})")
+        return self._reply(worker, time.monotonic() + self.timeout)
+
+    # The worker's reply to the message it was last sent, by the given deadline
+    def _reply(self, worker, deadline):
+        try:
+            replied = worker.conn.poll(max(0.0, deadline - time.monotonic()))
+            if replied:
+                status, payload = worker.conn.recv()
+        except (EOFError, OSError):
+            self._mark_broken(worker)
+            self._stop_worker(worker, kill=True)
+            raise WorkerCrashed(f"{self.name} inference worker crashed (exit code {worker.exitcode})")
+        if not replied:
+            self._mark_broken(worker)
+            raise TimeoutError(f"{self.name} inference worker took longer than {self.timeout}s")
+        if status == "error":
+            raise RuntimeError(payload)
+        return payload
+
+    # Run task(engine, images, *args) on the next free worker. A worker that crashes or
+    # hangs fails this task and is replaced before going back to the pool
+    def _run(self, task, images, *args):
+        images = [np.ascontiguousarray(img) for img in images]
+        needed = sum(aligned(img.nbytes) for img in images)
+        worker = self._idle.get()
+        try:
+            if worker.broken:
+                # Left behind by a replacement that failed
+                worker = self._replace(worker, buffer_bytes=needed)
+            if worker.buffer.size < needed:
+                # Grown by replacing the worker: the new fork inherits the larger buffer
+                worker = self._replace(worker, buffer_bytes=2 * needed)
+            layouts = []
+            offset = 0
+            for img in images:
+                np.ndarray(img.shape, dtype=img.dtype, buffer=worker.buffer.buf, offset=offset)[...] = img
+                layouts.append((offset, img.shape, img.dtype.str))
+                offset += aligned(img.nbytes)
+            result = self._request(worker, ("task", task, layouts, args))
+            with self._lock:
+                self.batches += 1
+            return result
+        finally:
+            self._idle.put(self._usable(worker))
+
+    # Same signature as the engine's own batch runner
+    def run_batch(self, images, timings=None, allowlist=None, run_batch=None):
+        result, worker_timings = self._run(batch_task, images, run_batch, allowlist)
+        merge_timings(timings, worker_timings)
+        return result
+
+    def recognize(self, recognize, img, boxes, timings=None):
+        result, worker_timings = self._run(recognize_task, [img], recognize, boxes)
+        merge_timings(timings, worker_timings)
+        return result
+
+    # Warm every worker up at once: each has its own lazily initialized runtime state.
+    # Every reply is read before raising the first failure, so no worker goes back to
+    # the pool with one still on its pipe
+    def warm_up(self):
+        workers = [self._idle.get() for _ in range(self.workers)]
+        errors = []
+        deadline = time.monotonic() + self.timeout
+        try:
+            for worker in workers:
+                if worker.broken:
+                    errors.append(WorkerCrashed(f"{self.name} inference worker could not be replaced"))
+                    continue
+                try:
+                    worker.conn.send(("warm_up",))
+                except OSError:
+                    self._mark_broken(worker)
+                    self._stop_worker(worker, kill=True)
+                    errors.append(WorkerCrashed(f"{self.name} inference worker is gone (exit code {worker.exitcode})"))
+            for worker in workers:
+                if worker.broken:
+                    continue
+                try:
+                    self._reply(worker, deadline)
+                except Exception as e:
+                    errors.append(e)
+        finally:
+            for worker in workers:
+                self._idle.put(self._usable(worker))
+        if errors:
+            raise errors[0]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "alive": sum(not worker.broken for worker in self._all),
+                "threads_per_worker": self.threads,
+                "buffer_bytes": [worker.buffer.size for worker in self._all],
+                "batches": self.batches,
+                "crashes": self.crashes,
+                "restarts": self.restarts,
+            }
+
+    def close(self):
+        for worker in list(self._all):
+            self._stop_worker(worker)
+        try:
+            self._server_conn.send(("exit",))
+        except OSError:
+            pass
+        self._server.join(timeout=5)
+        if self._server.is_alive():
+            self._server.kill()
+            self._server.join()
+        self._server_conn.close()
+
+
+def merge_timings(timings, worker_timings):
+    if timings is not None:
+        for stage, seconds in worker_timings.items():
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+# The engine table with `names` moved into worker pools: their loader builds an
+# InferenceWorkerPool and their batch runner and recognizer send work to it. Returns
+# (engines, recognizers) shaped like ocr_engines.ENGINES and RECOGNIZERS. make_warm_up
+# is ocr_engines.make_warm_up, run inside every worker on its own copy of the engine
+def with_inference_workers(engines, recognizers, make_warm_up, names=OCR_WORKER_ENGINES, workers=OCR_INFERENCE_WORKERS):
+    if workers < 1:
+        return dict(engines), dict(recognizers)
+    engines, recognizers = dict(engines), dict(recognizers)
+    for name in names:
+        if name not in engines:
+            raise ValueError(f"Unsupported OCR model in OCR_WORKER_ENGINES: {name}")
+        loader, run_batch = engines[name]
+        engines[name] = (pooled_loader(name, loader, make_warm_up(run_batch), workers), pooled_batch(run_batch))
+        if name in recognizers:
+            recognizers[name] = pooled_recognizer(recognizers[name])
+    return engines, recognizers
+
+def pooled_loader(name, loader, warm_up, workers):
+    return lambda: InferenceWorkerPool(name, loader, warm_up, workers)
+
+def pooled_batch(run_batch):
+    def run_pooled_batch(pool, images, timings=None, allowlist=None):
+        return pool.run_batch(images, timings, allowlist, run_batch=run_batch)
+    return run_pooled_batch
+
+def pooled_recognizer(recognize):
+    def recognize_pooled(pool, img, boxes, timings=None):
+        return pool.recognize(recognize, img, boxes, timings)
+    return recognize_pooled
@@ -0,0 +1,383 @@
+import os
+import json
+import time
+import uuid
+import socket
+import shutil
+import sqlite3
+import asyncio
+import tempfile
+from contextlib import contextmanager, closing
+
+# Job queue settings:
+#   OCR_JOBS_DIR           where the SQLite queue and the uploaded inputs are kept. The
+#                          default is local to the container: jobs are only shared by
+#                          containers that mount the same directory, on a filesystem
+#                          with working SQLite locking (not a Modal Volume)
+#   OCR_JOB_WORKERS        jobs processed at once by this container (0 runs no worker)
+#   OCR_JOB_CHUNK_FILES    files of a job loaded and recognized together
+#   OCR_JOB_POLL_SECONDS   how often an idle worker looks for new jobs
+#   OCR_JOB_LEASE_SECONDS  how long a claimed job stays with its worker without a
+#                          heartbeat; after that, another worker takes it over
+OCR_JOBS_DIR = os.environ.get("OCR_JOBS_DIR", os.path.join(tempfile.gettempdir(), "ocr_jobs"))
+OCR_JOB_WORKERS = int(os.environ.get("OCR_JOB_WORKERS", 1))
+OCR_JOB_CHUNK_FILES = int(os.environ.get("OCR_JOB_CHUNK_FILES", 8))
+OCR_JOB_POLL_SECONDS = float(os.environ.get("OCR_JOB_POLL_SECONDS", 0.5))
+OCR_JOB_LEASE_SECONDS = float(os.environ.get("OCR_JOB_LEASE_SECONDS", 60))
+
+# Results are written to the store in groups of this many events
+RESULT_FLUSH_EVENTS = 16
+
+ACTIVE_STATES = ("queued", "running")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    total_files INTEGER NOT NULL,
+    files_done INTEGER NOT NULL DEFAULT 0,
+    results_count INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    owner TEXT,
+    lease_expires REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_files (
+    job_id TEXT NOT NULL,
+    file_index INTEGER NOT NULL,
+    file_name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (job_id, file_index)
+);
+CREATE TABLE IF NOT EXISTS job_results (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+# Columns added after the first release, for stores created before them
+MIGRATIONS = {"owner": "ALTER TABLE jobs ADD COLUMN owner TEXT", "lease_expires": "ALTER TABLE jobs ADD COLUMN lease_expires REAL"}
+
+
+# A running job's worker lost it: its lease ran out and another worker took it over,
+# or the job was cancelled
+class LeaseLost(Exception):
+    pass
+
+
+# Durable job queue in a single SQLite file, so jobs survive restarts and the service
+# runs locally without any outside queue. Inputs are stored as files next to it and
+# results as one row per event, so neither has to sit in memory. All methods block;
+# call them through asyncio.to_thread from the event loop.
+class JobStore:
+    def __init__(self, directory=OCR_JOBS_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.db_path = os.path.join(directory, "jobs.db")
+        with self._db() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+            columns = {row["name"] for row in db.execute("PRAGMA table_info(jobs)")}
+            for column, statement in MIGRATIONS.items():
+                if column not in columns:
+                    db.execute(statement)
+
+    @contextmanager
+    def _db(self):
+        # A connection per call keeps the store usable from any thread or process
+        with closing(sqlite3.connect(self.db_path, timeout=30, isolation_level=None)) as db:
+            db.row_factory = sqlite3.Row
+            yield db
+
+    def _input_dir(self, job_id):
+        return os.path.join(self.directory, job_id)
+
+    # Start a job: a new id and an empty input directory. The caller writes the inputs
+    # to input_path() and then queues the job with create(), or drops it with discard()
+    def reserve(self):
+        job_id = uuid.uuid4().hex
+        os.makedirs(self._input_dir(job_id))
+        return job_id
+
+    def input_path(self, job_id, file_index, file_name):
+        # Keep the extension, it decides whether the file is treated as a video
+        return os.path.join(self._input_dir(job_id), f"{file_index}{os.path.splitext(file_name)[1]}")
+
+    def discard(self, job_id):
+        shutil.rmtree(self._input_dir(job_id), ignore_errors=True)
+
+    # Queue a reserved job whose inputs are stored; files is a list of (file_name, path)
+    def create(self, job_id, params, files):
+        rows = [(job_id, file_index, file_name, path) for file_index, (file_name, path) in enumerate(files)]
+        with self._db() as db:
+            db.execute("BEGIN IMMEDIATE")
+            db.executemany("INSERT INTO job_files VALUES (?, ?, ?, ?)", rows)
+            db.execute(
+                "INSERT INTO jobs (job_id, status, params, total_files, created_at) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, json.dumps(params), len(files), time.time()),
+            )
+            db.execute("COMMIT")
+        return job_id
+
+    # Atomically take the oldest queued job for `owner`, leased to it for lease_seconds,
+    # or return None when there is none. Running jobs whose lease ran out (their worker
+    # died) are queued again first
+    def claim(self, owner, lease_seconds=OCR_JOB_LEASE_SECONDS):
+        now = time.time()
+        with self._db() as db:
+            db.execute("BEGIN IMMEDIATE")
+            self._requeue_expired(db, now)
+            row = db.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                db.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, owner = ?, lease_expires = ? WHERE job_id = ?",
+                    (now, owner, now + lease_seconds, row["job_id"]),
+                )
+            db.execute("COMMIT")
+        return None if row is None else self._job(row)
+
+    # Extend owner's lease on a running job; False once the job is no longer running
+    # under that owner (cancelled, or taken over after the lease ran out)
+    def renew(self, job_id, owner, lease_seconds=OCR_JOB_LEASE_SECONDS):
+        with self._db() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE job_id = ? AND owner = ? AND status = 'running'",
+                (time.time() + lease_seconds, job_id, owner),
+            )
+        return cursor.rowcount == 1
+
+    def _job(self, row):
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        return job
+
+    def get(self, job_id):
+        with self._db() as db:
+            row = db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return None if row is None else self._job(row)
+
+    def status(self, job_id):
+        with self._db() as db:
+            row = db.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return None if row is None else row["status"]
+
+    # (file_index, file_name, path) of every input of a job
+    def files(self, job_id):
+        with self._db() as db:
+            rows = db.execute(
+                "SELECT file_index, file_name, path FROM job_files WHERE job_id = ? ORDER BY file_index", (job_id,)
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    # Append owner's result events; events with "done" set count as finished files
+    def add_results(self, job_id, owner, events):
+        with self._db() as db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT results_count FROM jobs WHERE job_id = ? AND owner = ? AND status = 'running'", (job_id, owner)
+            ).fetchone()
+            if row is None:
+                db.execute("ROLLBACK")
+                raise LeaseLost(job_id)
+            start = row[0]
+            db.executemany(
+                "INSERT INTO job_results VALUES (?, ?, ?)",
+                [(job_id, start + i, json.dumps(event)) for i, event in enumerate(events)],
+            )
+            db.execute(
+                "UPDATE jobs SET results_count = results_count + ?, files_done = files_done + ? WHERE job_id = ?",
+                (len(events), sum(1 for event in events if event.get("done")), job_id),
+            )
+            db.execute("COMMIT")
+
+    # One page of results, in the order they were produced
+    def results(self, job_id, offset=0, limit=100):
+        with self._db() as db:
+            rows = db.execute(
+                "SELECT payload FROM job_results WHERE job_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+                (job_id, offset, limit),
+            ).fetchall()
+        return [json.loads(row["payload"]) for row in rows]
+
+    # Move owner's running job to its final state, unless it was cancelled or taken
+    # over meanwhile, and drop its inputs
+    def finish(self, job_id, owner, status, error=None):
+        with self._db() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE job_id = ? AND owner = ? AND status = 'running'",
+                (status, error, time.time(), job_id, owner),
+            )
+        if cursor.rowcount == 1:
+            shutil.rmtree(self._input_dir(job_id), ignore_errors=True)
+
+    # Put owner's running job back in the queue, to start over
+    def requeue(self, job_id, owner):
+        with self._db() as db:
+            db.execute("BEGIN IMMEDIATE")
+            cursor = db.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL WHERE job_id = ? AND owner = ? AND status = 'running'",
+                (job_id, owner),
+            )
+            if cursor.rowcount == 1:
+                self._reset_results(db, job_id)
+            db.execute("COMMIT")
+
+    # Running jobs whose worker stopped renewing its lease (its container died) are
+    # queued again. Jobs of live workers, in this container or another, are left alone
+    def _requeue_expired(self, db, now):
+        job_ids = [
+            row[0] for row in db.execute(
+                "SELECT job_id FROM jobs WHERE status = 'running' AND (lease_expires IS NULL OR lease_expires < ?)", (now,)
+            )
+        ]
+        for job_id in job_ids:
+            db.execute("UPDATE jobs SET status = 'queued', owner = NULL WHERE job_id = ?", (job_id,))
+            self._reset_results(db, job_id)
+        if job_ids:
+            print(f"Requeued {len(job_ids)} OCR jobs whose worker stopped renewing its lease")
+        return job_ids
+
+    # A requeued job starts over, so its partial results are dropped to avoid
+    # duplicates (the result cache makes the repeated files cheap)
+    def _reset_results(self, db, job_id):
+        db.execute("DELETE FROM job_results WHERE job_id = ?", (job_id,))
+        db.execute("UPDATE jobs SET results_count = 0, files_done = 0 WHERE job_id = ?", (job_id,))
+
+    # Cancel a queued or running job; returns its status afterwards (None if unknown)
+    def cancel(self, job_id):
+        with self._db() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE job_id = ? AND status IN ('queued', 'running')",
+                (time.time(), job_id),
+            )
+            row = db.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is not None and row["status"] == "cancelled":
+            shutil.rmtree(self._input_dir(job_id), ignore_errors=True)
+        return None if row is None else row["status"]
+
+    def counts(self):
+        with self._db() as db:
+            rows = db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+# Pulls jobs from a JobStore and runs them. process_files(job, files) is an async
+# generator yielding result events for a chunk of (file_index, file_name, path)
+# inputs. Any number of containers sharing the store can run workers: each claimed job
+# is leased to its worker, which renews the lease while it runs, and only jobs whose
+# lease ran out are taken over.
+class JobWorker:
+    def __init__(self, store, process_files, workers=OCR_JOB_WORKERS, chunk_files=OCR_JOB_CHUNK_FILES,
+                 poll_seconds=OCR_JOB_POLL_SECONDS, lease_seconds=OCR_JOB_LEASE_SECONDS):
+        self.store = store
+        self.process_files = process_files
+        self.workers = workers
+        self.chunk_files = max(1, chunk_files)
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        # Names this worker's leases in the store
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._tasks = []
+        self._running = {}
+        self._stopping = False
+        self.jobs_completed = 0
+        self.jobs_failed = 0
+        self.jobs_cancelled = 0
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._loop()) for _ in range(self.workers)]
+
+    async def stop(self):
+        self._stopping = True
+        running = list(self._running.values())
+        for task in self._tasks:
+            task.cancel()
+        # Wait for the running jobs too, so they are back in the queue before exit
+        await asyncio.gather(*self._tasks, *running, return_exceptions=True)
+
+    # Stop a job running in this container right away; jobs elsewhere notice their
+    # cancellation at the next chunk
+    def cancel(self, job_id):
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+
+    async def _loop(self):
+        while True:
+            job = await asyncio.to_thread(self.store.claim, self.owner, self.lease_seconds)
+            if job is None:
+                await asyncio.sleep(self.poll_seconds)
+                continue
+            task = asyncio.create_task(self._run_job(job))
+            self._running[job["job_id"]] = task
+            try:
+                # wait() rather than await, so cancelling the job doesn't stop the worker
+                await asyncio.wait([task])
+            finally:
+                task.cancel()
+                self._running.pop(job["job_id"], None)
+
+    # Renew the job's lease while it runs; stop the job if the lease is lost
+    async def _heartbeat(self, job_id):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not await asyncio.to_thread(self.store.renew, job_id, self.owner, self.lease_seconds):
+                self.cancel(job_id)
+                return
+
+    async def _run_job(self, job):
+        job_id = job["job_id"]
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            files = await asyncio.to_thread(self.store.files, job_id)
+            for start in range(0, len(files), self.chunk_files):
+                if not await asyncio.to_thread(self.store.renew, job_id, self.owner, self.lease_seconds):
+                    self.jobs_cancelled += 1
+                    return
+                events = []
+                async for event in self.process_files(job, files[start:start + self.chunk_files]):
+                    events.append(event)
+                    if len(events) >= RESULT_FLUSH_EVENTS:
+                        await asyncio.to_thread(self.store.add_results, job_id, self.owner, events)
+                        events = []
+                if events:
+                    await asyncio.to_thread(self.store.add_results, job_id, self.owner, events)
+            await asyncio.to_thread(self.store.finish, job_id, self.owner, "completed")
+            self.jobs_completed += 1
+        except asyncio.CancelledError:
+            if self._stopping:
+                # Shutting down: another worker (or this one after a restart) takes it over
+                await asyncio.to_thread(self.store.requeue, job_id, self.owner)
+                raise
+            self.jobs_cancelled += 1
+        except LeaseLost:
+            # Cancelled, or taken over by another worker after a stall
+            self.jobs_cancelled += 1
+        except Exception as e:
+            print(f"OCR job {job_id} failed: {str(e)}")
+            await asyncio.to_thread(
+                self.store.finish, job_id, self.owner, "failed", "An internal server error occurred. Please check the logs for details."
+            )
+            self.jobs_failed += 1
+        finally:
+            heartbeat.cancel()
+
+    # Blocking (reads the store)
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "owner": self.owner,
+            "running": list(self._running),
+            "jobs_completed": self.jobs_completed,
+            "jobs_failed": self.jobs_failed,
+            "jobs_cancelled": self.jobs_cancelled,
+            "jobs": self.store.counts(),
+        }
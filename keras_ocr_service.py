@@ -1,8 +1,17 @@
 import modal
 from fastapi import FastAPI, File, UploadFile, Body, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+import os
 import time
+import asyncio
 from typing import List
+from micro_batcher import MicroBatcher
+from inference_executor import get_executor
+from image_io import read_upload, decode_image, RequestSizeLimitMiddleware
+from result_cache import OCRResultCache
+from engine_registry import EngineRegistry
+from metrics import StageMetrics, json_response
+from ocr_engines import register_engines, run_keras_ocr_batch
 
 # Initialize Modal app
 app = modal.App("keras_ocr_service")
@@ -17,7 +26,7 @@ image = modal.Image.debian_slim().apt_install(
     "uvicorn",
     "tensorflow==2.15",
     "keras-ocr" 
-)
+).add_local_python_source("micro_batcher", "inference_executor", "image_io", "result_cache", "engine_registry", "ocr_engines", "metrics")
 
 # Create FastAPI app
 fastapi_app = FastAPI()
@@ -34,50 +43,67 @@ fastapi_app.add_middleware(
 # Maximum file size limit (e.g., 100MB)
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100 MB
 
+# Cap on the whole multipart body, enforced while it streams in
+MAX_REQUEST_SIZE = int(os.environ.get("OCR_MAX_REQUEST_SIZE", 10 * MAX_FILE_SIZE))
+fastapi_app.add_middleware(RequestSizeLimitMiddleware, max_body_size=MAX_REQUEST_SIZE)
+
+# Micro-batching knobs: images from concurrent requests are recognized together in one
+# pipeline.recognize call of at most OCR_MAX_BATCH_SIZE images
+OCR_MAX_BATCH_SIZE = int(os.environ.get("OCR_MAX_BATCH_SIZE", 8))
+OCR_MAX_BATCH_WAIT_MS = float(os.environ.get("OCR_MAX_BATCH_WAIT_MS", 5))
+
+# TensorFlow releases the GIL, so recognition runs on a bounded thread pool off the
+# event loop. Concurrent batches are set with OCR_KERAS_OCR_CONCURRENCY (default 1)
+keras_executor = get_executor("keras_ocr", kind="thread", default_concurrency=1)
+
+# Results cached by image content, so resubmitted images skip inference.
+# The default pipeline has no tunable parameters, so the key is content + engine only
+ocr_cache = OCRResultCache()
+
+# Pipeline loaded and warmed up once, then shared by all requests so their images can
+# be batched together
+registry = EngineRegistry()
+register_engines(registry, ["keras_ocr"])
+
+# Load and warm up the pipeline before serving traffic
+@fastapi_app.on_event("startup")
+async def preload_pipeline():
+    await asyncio.to_thread(registry.get, "keras_ocr")
+
+# Per-stage latency histograms, exported at GET /metrics
+stage_metrics = StageMetrics("keras_ocr_service")
+
+# Load time, warm-up time and memory footprint of the pipeline
+@fastapi_app.get("/engines")
+async def engine_stats():
+    return registry.stats()
+
 @fastapi_app.post("/ocr")
 async def perform_ocr(
     files: List[UploadFile] = File(..., description="List of files to process"),
-    logging_enabled: bool = Body(False, embed=True)
+    logging_enabled: bool = Body(False, embed=True),
+    include_timings: bool = Body(False, embed=True)
 ):
+    request_start = time.perf_counter()
     try:
-        results_with_benchmark = []
-        # Lazy load Keras-OCR and TensorFlow within the Modal image context
-        with image.imports():
-            import keras_ocr
-        
-            # Create pipeline inside the imports context
-            pipeline = keras_ocr.pipeline.Pipeline()
-
-            for file in files:
-                # Save uploaded file locally
-                file_path = f"/tmp/{file.filename}"
-                
-                # Check file size before saving
-                content = await file.read()
-                if len(content) > MAX_FILE_SIZE:
-                    raise HTTPException(status_code=413, detail=f"File size of {file.filename} exceeds maximum limit of 100MB.")
-                
-                with open(file_path, "wb") as f:
-                    f.write(content)
-
-                # Start benchmark timer
-                start_time = time.time()
-
-                # Process image using Keras-OCR
-                result = process_image_with_keras_ocr(file_path, pipeline)
-
-                # End benchmark timer
-                end_time = time.time()
-                processing_time = end_time - start_time
-
-                # Append result for each file
-                results_with_benchmark.append({
-                    "file_name": file.filename,
-                    "processing_time_seconds": processing_time,
-                    "ocr_results": result
-                })
-        
-        return results_with_benchmark
+        uploads = []
+
+        for file in files:
+            timer = stage_metrics.timer()
+            with timer.stage("upload_read"):
+                # Read the upload into memory in chunks, enforcing the size limit as bytes arrive
+                content = await read_upload(file, MAX_FILE_SIZE)
+            uploads.append((file.filename, content, timer))
+
+        # Submit every file at once so the batcher can group them with each other
+        # and with images from concurrent requests
+        results_with_benchmark = await asyncio.gather(*[
+            process_file(file_name, content, timer, include_timings) for file_name, content, timer in uploads
+        ])
+
+        response = json_response(stage_metrics, results_with_benchmark)
+        stage_metrics.observe("request", time.perf_counter() - request_start)
+        return response
 
     except HTTPException as e:
         raise e
@@ -90,25 +116,59 @@ async def perform_ocr(
         print(error_message)
         return {"detail": error_message}
 
-def process_image_with_keras_ocr(image_path, pipeline):
-    # Use Keras-OCR to process the image
-    with image.imports():
-        import keras_ocr
-        
-    images = [keras_ocr.tools.read(image_path)]
-    prediction_groups = pipeline.recognize(images)
-    
-    # Format the results
-    formatted_results = []
-    for predictions in prediction_groups:
-        for prediction in predictions:
-            text, box = prediction
-            formatted_results.append({
-                "text": text,
-                "bounding_box": box.tolist()
-            })
-    
-    return formatted_results
+# Per-stage latency histograms and p50/p95/p99 in the Prometheus text format
+@fastapi_app.get("/metrics")
+async def metrics():
+    return stage_metrics.response()
+
+# Hit/miss/eviction counters of the result cache
+@fastapi_app.get("/cache")
+async def cache_stats():
+    return ocr_cache.stats()
+
+async def process_file(file_name, content, timer, include_timings=False):
+    # Start benchmark timer (monotonic, unaffected by clock adjustments)
+    start_time = time.perf_counter()
+
+    async def run_ocr():
+        # Decode straight from the upload buffer, off the event loop
+        with timer.stage("decode"):
+            img = await asyncio.to_thread(decode_image, content, file_name)
+
+        # Process image using Keras-OCR; the batch reports how long recognition took
+        submitted = time.perf_counter()
+        result, inference_time = await keras_batcher.submit(img)
+        timer.add("queue_wait", max(0.0, time.perf_counter() - submitted - inference_time))
+        timer.add("inference", inference_time)
+        return result
+
+    # Identical images (resubmitted or arriving together) share one inference
+    cache_key = await asyncio.to_thread(OCRResultCache.make_key, content, "keras_ocr")
+    result = await ocr_cache.get_or_compute(cache_key, run_ocr)
+
+    # End benchmark timer
+    processing_time = time.perf_counter() - start_time
+
+    file_result = {
+        "file_name": file_name,
+        "processing_time_seconds": processing_time,
+        "ocr_results": result
+    }
+    if include_timings:
+        file_result["stage_seconds"] = timer.breakdown()
+    return file_result
+
+def process_images_with_keras_ocr(images):
+    # Use Keras-OCR to process a batch of decoded (BGR) images in a single recognize
+    # call, through the same runner as the main service
+    timings = {}
+    with registry.use("keras_ocr") as pipeline:
+        results = run_keras_ocr_batch(pipeline, images, timings)
+
+    # One result list per input image, each with the batch's inference time
+    return [(result, timings["inference"]) for result in results]
+
+keras_batcher = MicroBatcher(process_images_with_keras_ocr, max_batch_size=OCR_MAX_BATCH_SIZE, max_wait_ms=OCR_MAX_BATCH_WAIT_MS, executor=keras_executor)
 
 # Use modal.asgi_app to deploy FastAPI app with Modal and request a GPU
 @app.function(image=image, gpu="A10G")  # Adjust GPU as needed
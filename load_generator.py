@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import importlib
+import contextlib
+import httpx
+from benchmark_batching import percentile
+
+# Set the URL of your deployed OCR service
+OCR_SERVICE_URL = "https://shubhamsaini01--ocr-service-fastapi-modal-app.modal.run/ocr"
+
+# Path to the folder containing images
+DATASET_FOLDER = "benchmark_dataset/images"
+
+# File to store the load test results
+OUTPUT_FILE = "load_test_results.json"
+
+# Width of the buckets in the latency-over-time report
+TIMELINE_BUCKET_SECONDS = 1.0
+
+
+# Read every image into memory up front, so file I/O never shows up in the latencies
+def load_images(folder=DATASET_FOLDER):
+    images = []
+    for name in sorted(os.listdir(folder)):
+        if name.endswith(('jpg', 'png')):
+            with open(os.path.join(folder, name), 'rb') as f:
+                images.append((name, f.read()))
+    if not images:
+        raise SystemExit(f"No images found in {folder}")
+    return images
+
+
+# Minimal stand-in for the OCR service: reads the uploads like the real /ocr and holds
+# each image for service_ms on one of `workers` slots, like a GPU that can run that
+# many inferences at once. Past workers / service_ms images per second it saturates.
+def make_stand_in_app(service_ms=50.0, workers=1):
+    from typing import List
+    from fastapi import FastAPI, File, UploadFile
+
+    stand_in = FastAPI()
+    slots = asyncio.Semaphore(workers)
+
+    @stand_in.post("/ocr")
+    async def perform_ocr(files: List[UploadFile] = File(...)):
+        results = []
+        for file in files:
+            await file.read()
+            async with slots:
+                await asyncio.sleep(service_ms / 1000.0)
+            results.append({"file_name": file.filename, "ocr_results": []})
+        return results
+
+    return stand_in
+
+
+# "module:attribute" -> the ASGI app it names, e.g. "modelService:fastapi_app"
+def import_app(spec):
+    module_name, _, attribute = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attribute or "fastapi_app")
+
+
+# Client talking to a URL, or to an ASGI app in this process without any sockets
+def make_client(app=None, timeout=300.0):
+    if app is not None:
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://in-process", timeout=timeout)
+    # No connection cap: the load generator's own concurrency limit decides
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    return httpx.AsyncClient(timeout=timeout, limits=limits)
+
+
+# Open-loop load: requests are sent on a schedule set by the arrival rate (Poisson or
+# constant spacing), whether or not earlier ones have finished, so a slow server
+# builds a queue instead of quietly slowing the client down. At most `concurrency`
+# requests are outstanding; arrivals beyond that are counted as dropped. Latency is
+# measured from the scheduled send time, so client-side delays are not hidden.
+async def run_load(client, path, images, rate, concurrency, duration_s, warmup_s,
+                   files_per_request=1, poisson=True, form_fields=None):
+    records = []
+    in_flight = set()
+    dropped = 0
+    image_index = 0
+    start = time.perf_counter()
+    end = start + warmup_s + duration_s
+    next_send = start
+
+    async def send(scheduled, upload):
+        files = [('files', (name, content, 'image/jpeg')) for name, content in upload]
+        try:
+            response = await client.post(path, files=files, data=form_fields or {})
+            status = response.status_code
+            await response.aread()
+        except Exception as e:
+            status = type(e).__name__
+        records.append((scheduled - start, time.perf_counter() - scheduled, status))
+
+    while next_send < end:
+        delay = next_send - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if len(in_flight) >= concurrency:
+            if next_send - start >= warmup_s:
+                dropped += 1
+        else:
+            upload = []
+            for _ in range(files_per_request):
+                upload.append(images[image_index % len(images)])
+                image_index += 1
+            task = asyncio.create_task(send(next_send, upload))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+        next_send += random.expovariate(rate) if poisson else 1.0 / rate
+
+    if in_flight:
+        await asyncio.wait(in_flight)
+    return summarize(records, rate, duration_s, warmup_s, dropped, files_per_request)
+
+
+def summarize(records, rate, duration_s, warmup_s, dropped, files_per_request):
+    # Requests scheduled during the warm-up are left out of every statistic
+    measured = [record for record in records if record[0] >= warmup_s]
+    succeeded = [latency for _, latency, status in measured if status == 200]
+    # Throughput counts what completed inside the measured window, so a backlog that
+    # only drains after the run doesn't inflate it
+    completed_in_window = sum(
+        1 for offset, latency, status in records
+        if status == 200 and warmup_s <= offset + latency < warmup_s + duration_s
+    )
+    status_counts = {}
+    for _, _, status in measured:
+        status_counts[str(status)] = status_counts.get(str(status), 0) + 1
+
+    timeline = {}
+    for offset, latency, status in measured:
+        bucket = int((offset - warmup_s) // TIMELINE_BUCKET_SECONDS)
+        timeline.setdefault(bucket, []).append((latency, status))
+
+    def latency_summary(latencies):
+        return {
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies) if latencies else 0,
+            "mean": sum(latencies) / len(latencies) if latencies else 0,
+        }
+
+    attempted = len(measured) + dropped
+    return {
+        "target_rate_rps": rate,
+        "duration_seconds": duration_s,
+        "files_per_request": files_per_request,
+        "requests_sent": len(measured),
+        "requests_dropped": dropped,
+        "throughput_rps": completed_in_window / duration_s,
+        "throughput_images_per_second": completed_in_window * files_per_request / duration_s,
+        "error_rate": (attempted - len(succeeded)) / attempted if attempted else 0,
+        "status_counts": status_counts,
+        "latency_seconds": latency_summary(succeeded),
+        "latency_over_time": [
+            {
+                "second": bucket * TIMELINE_BUCKET_SECONDS,
+                "requests": len(entries),
+                "errors": sum(1 for _, status in entries if status != 200),
+                **latency_summary([latency for latency, status in entries if status == 200]),
+            }
+            for bucket, entries in sorted(timeline.items())
+        ],
+    }
+
+
+def print_summary(result):
+    latency = result["latency_seconds"]
+    print(
+        f"rate={result['target_rate_rps']:>7.1f} rps  throughput={result['throughput_rps']:7.1f} rps  "
+        f"p50={latency['p50'] * 1000:8.1f} ms  p95={latency['p95'] * 1000:8.1f} ms  "
+        f"p99={latency['p99'] * 1000:8.1f} ms  errors={result['error_rate']:.1%}  dropped={result['requests_dropped']}"
+    )
+
+
+async def main(args):
+    random.seed(args.seed)
+    images = load_images(args.dataset)
+    if args.app:
+        app = import_app(args.app)
+    elif args.url:
+        app = None
+    else:
+        app = make_stand_in_app(args.service_ms, args.workers)
+
+    form_fields = {"model_name": args.model_name} if args.model_name else None
+    results = []
+    # Run the app's startup/shutdown handlers (engine preloading) like a server would
+    lifespan = app.router.lifespan_context(app) if app is not None else contextlib.nullcontext()
+    async with lifespan, make_client(app) as client:
+        path = "/ocr" if app is not None else args.url
+        for rate in args.rates:
+            result = await run_load(
+                client, path, images, rate, args.concurrency, args.duration, args.warmup,
+                files_per_request=args.files_per_request, poisson=not args.constant_rate,
+                form_fields=form_fields,
+            )
+            print_summary(result)
+            results.append(result)
+
+    target = args.app or args.url or f"stand-in ({args.service_ms} ms x {args.workers} workers)"
+    with open(args.output, 'w') as outfile:
+        json.dump({"target": target, "concurrency": args.concurrency, "warmup_seconds": args.warmup, "runs": results}, outfile, indent=4)
+    print(f"Load test completed. Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Open-loop load generator for the OCR service")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help=f"service URL, e.g. {OCR_SERVICE_URL} (default: in-process stand-in)")
+    target.add_argument("--app", help="in-process ASGI app as module:attribute, e.g. modelService:fastapi_app")
+    parser.add_argument("--rates", type=lambda value: [float(rate) for rate in value.split(",")], default=[5.0, 10.0, 20.0, 40.0],
+                        help="comma-separated target arrival rates in requests per second; one run per rate")
+    parser.add_argument("--concurrency", type=int, default=64, help="maximum outstanding requests")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per rate")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of load sent before measuring")
+    parser.add_argument("--files-per-request", type=int, default=1)
+    parser.add_argument("--constant-rate", action="store_true", help="evenly spaced arrivals instead of Poisson")
+    parser.add_argument("--model-name", help="model_name form field sent with every request")
+    parser.add_argument("--service-ms", type=float, default=50.0, help="stand-in time per image")
+    parser.add_argument("--workers", type=int, default=1, help="stand-in images served at once")
+    parser.add_argument("--dataset", default=DATASET_FOLDER)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    asyncio.run(main(parser.parse_args()))
@@ -1,25 +1,15 @@
 import os
-import requests
 import json
 import numpy as np
-from urllib.parse import urlparse
-# Path to ground truth JSON file and OCR service URL
-GROUND_TRUTH_PATH = "ground_truth_converted.json"
+from evaluation_store import ResponseStore, get_service_name
+from evaluation_runner import EvaluationRunner
+from ground_truth import ANNOTATIONS_PATH, load_ground_truth
+# Path to the ground truth annotations and OCR service URL
+GROUND_TRUTH_PATH = ANNOTATIONS_PATH
 OCR_SERVICE_URL = "https://shubhamsaini01--keras-ocr-service-fastapi-modal-app.modal.run/ocr"
 
-# Function to extract service name from URL
-def get_service_name(url):
-    parsed_url = urlparse(url)
-    # Extract the service name from the hostname (e.g., 'shubhamsaini01--ocr-service-fastapi-modal-app')
-    service_name = parsed_url.hostname.split('--')[1]
-    return service_name
-
-
-# Load ground truth data
-def load_ground_truth(file_path):
-    print(f"Loading ground truth data from {file_path}...")
-    with open(file_path, 'r') as f:
-        return json.load(f).get("annotations", {})
+# Raw service responses, recorded and replayed according to OCR_EVAL_MODE
+response_store = ResponseStore(OCR_SERVICE_URL)
 
 # Filter OCR results to remove non-numeric inferences
 def filter_numeric_ocr_results(ocr_results):
@@ -32,67 +22,205 @@ def filter_numeric_ocr_results(ocr_results):
     print(f"Filtered {len(ocr_results) - len(numeric_results)} non-numeric inferences out of {len(ocr_results)} results.")
     return numeric_results
 
-# Get OCR results from the service for an image
-def get_ocr_results(image_path):
-    print(f"Requesting OCR results for {image_path}...")
-    with open(image_path, 'rb') as image_file:
-        files = {'files': (os.path.basename(image_path), image_file, 'image/jpeg')}
-        response = requests.post(OCR_SERVICE_URL, files=files)
-        
-        if response.status_code == 200:
-            try:
-                json_response = response.json()
-                if isinstance(json_response, list) and len(json_response) > 0:
-                    print(f"Received OCR results for {image_path}: {json_response}")
-                    ocr_results = json_response[0].get('ocr_results', [])
-                    return filter_numeric_ocr_results(ocr_results)  # Apply numeric filter here
-            except json.JSONDecodeError:
-                print(f"Error: Failed to parse JSON response for {image_path}.")
-        else:
-            print(f"Error: OCR service failed for {image_path}. Status code: {response.status_code}")
-    
+# OCR results of an image from its service response. None when the image was never
+# recorded in replay mode, so it is left out rather than scored as empty
+def get_ocr_results(image_path, json_response):
+    if json_response is None and response_store.mode == "replay":
+        return None
+    if isinstance(json_response, list) and len(json_response) > 0:
+        print(f"Received OCR results for {image_path}: {json_response}")
+        ocr_results = json_response[0].get('ocr_results', [])
+        return filter_numeric_ocr_results(ocr_results)  # Apply numeric filter here
     return []
 
-# IoU calculation between two bounding boxes
+# IoU thresholds the mAP is averaged over (COCO style: 0.50, 0.55, ..., 0.95)
+IOU_THRESHOLDS = np.round(np.arange(0.5, 0.951, 0.05), 2)
+
+# IoU a detection needs to count as a true positive in the per-image precision/recall
+MATCH_IOU_THRESHOLD = 0.5
+
+# How detections are paired with ground truth: "greedy" (highest confidence first, the
+# COCO rule) or "hungarian" (maximum total IoU; needs scipy)
+MATCHING = "greedy"
+
+# Recall points of the interpolated precision-recall curve
+RECALL_POINTS = np.linspace(0, 1, 101)
+
+# Corners of a box as a (4, 2) array. CVAT boxes are axis-aligned corners plus a
+# clockwise rotation in degrees around the box center
+def box_corners(bounding_box, rotation=0.0):
+    corners = np.asarray(bounding_box, dtype=np.float64).reshape(-1, 2)
+    if rotation:
+        theta = np.deg2rad(rotation)
+        rotation_matrix = np.array([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]])
+        center = corners.mean(axis=0)
+        corners = (corners - center) @ rotation_matrix.T + center
+    return corners
+
+# (N, 4, 2) array of ground-truth boxes, rotated where annotated
+def ground_truth_boxes(ground_truth_data):
+    if not ground_truth_data:
+        return np.zeros((0, 4, 2))
+    return np.stack([box_corners(gt['bounding_box'], gt.get('rotation', 0.0)) for gt in ground_truth_data])
+
+# (N, 4, 2) array of predicted boxes (OCR engines return 4-point polygons)
+def prediction_boxes(ocr_results):
+    if not ocr_results:
+        return np.zeros((0, 4, 2))
+    return np.stack([box_corners(result['bounding_box']) for result in ocr_results])
+
+# Shoelace area of every polygon in an (N, K, 2) array
+def polygon_areas(boxes):
+    x, y = boxes[..., 0], boxes[..., 1]
+    return 0.5 * np.abs(np.sum(x * np.roll(y, -1, axis=-1) - np.roll(x, -1, axis=-1) * y, axis=-1))
+
+# IoU of every prediction with every ground-truth box, as a (P, G) matrix. Axis-aligned
+# pairs are computed exactly in one vectorized step; pairs involving a rotated box are
+# refined with an exact convex polygon intersection, but only where their bounding
+# rectangles overlap at all
+def iou_matrix(pred_boxes, gt_boxes):
+    if len(pred_boxes) == 0 or len(gt_boxes) == 0:
+        return np.zeros((len(pred_boxes), len(gt_boxes)))
+
+    pred_min, pred_max = pred_boxes.min(axis=1), pred_boxes.max(axis=1)
+    gt_min, gt_max = gt_boxes.min(axis=1), gt_boxes.max(axis=1)
+    top_left = np.maximum(pred_min[:, None, :], gt_min[None, :, :])
+    bottom_right = np.minimum(pred_max[:, None, :], gt_max[None, :, :])
+    overlap = np.clip(bottom_right - top_left, 0, None)
+    intersection = overlap[..., 0] * overlap[..., 1]
+
+    pred_areas, gt_areas = polygon_areas(pred_boxes), polygon_areas(gt_boxes)
+    # A box is an axis-aligned rectangle when it fills its own bounding rectangle
+    pred_aligned = np.isclose(pred_areas, np.prod(pred_max - pred_min, axis=1))
+    gt_aligned = np.isclose(gt_areas, np.prod(gt_max - gt_min, axis=1))
+    refine = (intersection > 0) & ~(pred_aligned[:, None] & gt_aligned[None, :])
+    if refine.any():
+        import cv2
+        for i, j in zip(*np.nonzero(refine)):
+            intersection[i, j], _ = cv2.intersectConvexConvex(
+                pred_boxes[i].astype(np.float32), gt_boxes[j].astype(np.float32)
+            )
+
+    union = pred_areas[:, None] + gt_areas[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+# IoU between two bounding boxes given as 4-point polygons
 def iou(boxA, boxB):
-    xA = max(boxA[0][0], boxB[0][0])
-    yA = max(boxA[0][1], boxB[0][1])
-    xB = min(boxA[2][0], boxB[2][0])
-    yB = min(boxA[2][1], boxB[2][1])
+    return float(iou_matrix(box_corners(boxA)[None], box_corners(boxB)[None])[0, 0])
 
-    interArea = max(0, xB - xA + 1) * max(0, yA - yA + 1)
-    boxAArea = (boxA[2][0] - boxA[0][0] + 1) * (boxA[2][1] - boxA[0][1] + 1)
-    boxBArea = (boxB[2][0] - boxB[0][0] + 1) * (boxB[2][1] - boxB[0][1] + 1)
+def normalize_text(text):
+    return "".join(text.split()).lower()
 
-    return interArea / float(boxAArea + boxBArea - interArea)
+# Pair predictions with ground truth boxes they overlap by at least threshold, where
+# `eligible` says which pairs may match at all. Returns the matched ground truth index
+# of every prediction (-1 when unmatched)
+def match_predictions(ious, eligible, confidences, threshold, method=MATCHING):
+    matches = np.full(ious.shape[0], -1)
+    candidates = eligible & (ious >= threshold)
+    if not candidates.any():
+        return matches
 
-# Calculate precision and recall based on OCR results and ground truth
-def calculate_metrics(ocr_results, ground_truth_data):
-    true_positives = 0
-    false_negatives = 0
+    if method == "hungarian":
+        from scipy.optimize import linear_sum_assignment
+        rows, cols = linear_sum_assignment(np.where(candidates, ious, 0.0), maximize=True)
+        keep = candidates[rows, cols]
+        matches[rows[keep]] = cols[keep]
+        return matches
 
-    detected_texts = [result['text'] for result in ocr_results]
-    ground_truth_texts = [gt['attributes']['text'] for gt in ground_truth_data]
+    # Greedy: the most confident prediction takes its best remaining ground truth box
+    gt_taken = np.zeros(ious.shape[1], dtype=bool)
+    for p in np.argsort(-confidences, kind="stable"):
+        scores = np.where(candidates[p] & ~gt_taken, ious[p], -1.0)
+        g = int(scores.argmax())
+        if scores[g] >= 0:
+            matches[p] = g
+            gt_taken[g] = True
+    return matches
 
-    print(f"Detected OCR texts: {detected_texts}")
-    print(f"Ground truth texts: {ground_truth_texts}")
+# Match one image's detections against its ground truth at every IoU threshold, both
+# requiring the text to match and on boxes alone
+def evaluate_image(ocr_results, ground_truth_data, method=MATCHING):
+    pred_texts = np.array([normalize_text(result['text']) for result in ocr_results], dtype=object)
+    gt_texts = np.array([normalize_text(gt['attributes']['text']) for gt in ground_truth_data], dtype=object)
+    confidences = np.array([float(result.get('confidence', 1.0)) for result in ocr_results])
 
-    for gt in ground_truth_texts:
-        if gt in detected_texts:
-            true_positives += 1
-        else:
-            false_negatives += 1
+    ious = iou_matrix(prediction_boxes(ocr_results), ground_truth_boxes(ground_truth_data))
+    text_match = pred_texts[:, None] == gt_texts[None, :] if len(pred_texts) and len(gt_texts) else np.zeros(ious.shape, dtype=bool)
+    any_box = np.ones(ious.shape, dtype=bool)
 
-    precision = true_positives / len(detected_texts) if detected_texts else 0
-    recall = true_positives / (true_positives + false_negatives) if (true_positives + false_negatives) > 0 else 0
-    
-    print(f"Results: True Positives={true_positives}, False Negatives={false_negatives}")
-    
-    return precision, recall, true_positives, false_negatives
+    return {
+        "confidences": confidences,
+        "num_ground_truth": len(ground_truth_data),
+        # (thresholds, predictions) true-positive flags
+        "text_matches": np.array([match_predictions(ious, text_match, confidences, t, method) >= 0 for t in IOU_THRESHOLDS]).reshape(len(IOU_THRESHOLDS), -1),
+        "box_matches": np.array([match_predictions(ious, any_box, confidences, t, method) >= 0 for t in IOU_THRESHOLDS]).reshape(len(IOU_THRESHOLDS), -1),
+    }
 
-# Calculate mean Average Precision (mAP)
-def calculate_map(precisions):
-    return np.mean(precisions) if precisions else 0
+# Precision and recall of one image at MATCH_IOU_THRESHOLD, box and text both matching
+def calculate_metrics(evaluation):
+    threshold_index = int(np.argmin(np.abs(IOU_THRESHOLDS - MATCH_IOU_THRESHOLD)))
+    matched = evaluation["text_matches"][threshold_index]
+    true_positives = int(matched.sum())
+    false_positives = int(len(matched) - true_positives)
+    false_negatives = evaluation["num_ground_truth"] - true_positives
+
+    precision = true_positives / len(matched) if len(matched) else 0
+    recall = true_positives / evaluation["num_ground_truth"] if evaluation["num_ground_truth"] else 0
+
+    print(f"Results: True Positives={true_positives}, False Positives={false_positives}, False Negatives={false_negatives}")
+
+    return precision, recall, true_positives, false_positives, false_negatives
+
+# Area under the interpolated precision-recall curve of detections ranked by confidence
+def average_precision(confidences, matched, num_ground_truth):
+    if num_ground_truth == 0 or len(confidences) == 0:
+        return 0.0
+    order = np.argsort(-confidences, kind="stable")
+    true_positives = np.cumsum(matched[order])
+    false_positives = np.cumsum(~matched[order])
+    recall = true_positives / num_ground_truth
+    precision = true_positives / (true_positives + false_positives)
+    # Precision envelope: the best precision at this recall or any higher one
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    indices = np.searchsorted(recall, RECALL_POINTS, side="left")
+    return float(np.where(indices < len(precision), precision[np.minimum(indices, len(precision) - 1)], 0.0).mean())
+
+# Mean Average Precision over IOU_THRESHOLDS across all evaluated images: "mAP" needs
+# the box and the text to match, "detection_mAP" only the box
+def calculate_map(evaluations):
+    if not evaluations:
+        return {"mAP": 0, "AP50": 0, "AP75": 0, "detection_mAP": 0, "per_threshold": {}}
+    confidences = np.concatenate([evaluation["confidences"] for evaluation in evaluations])
+    text_matches = np.concatenate([evaluation["text_matches"] for evaluation in evaluations], axis=1)
+    box_matches = np.concatenate([evaluation["box_matches"] for evaluation in evaluations], axis=1)
+    num_ground_truth = sum(evaluation["num_ground_truth"] for evaluation in evaluations)
+
+    text_ap = [average_precision(confidences, text_matches[i], num_ground_truth) for i in range(len(IOU_THRESHOLDS))]
+    box_ap = [average_precision(confidences, box_matches[i], num_ground_truth) for i in range(len(IOU_THRESHOLDS))]
+    per_threshold = {f"{t:.2f}": {"AP": ap, "detection_AP": box} for t, ap, box in zip(IOU_THRESHOLDS, text_ap, box_ap)}
+    return {
+        "mAP": float(np.mean(text_ap)),
+        "AP50": per_threshold["0.50"]["AP"],
+        "AP75": per_threshold["0.75"]["AP"],
+        "detection_mAP": float(np.mean(box_ap)),
+        "per_threshold": per_threshold,
+    }
+
+# Precision and recall at MATCH_IOU_THRESHOLD plus the mAP figures over a set of
+# evaluated images, for benchmarks that score engine output directly
+def summarize_evaluations(evaluations):
+    threshold_index = int(np.argmin(np.abs(IOU_THRESHOLDS - MATCH_IOU_THRESHOLD)))
+    true_positives = sum(int(evaluation["text_matches"][threshold_index].sum()) for evaluation in evaluations)
+    detections = sum(len(evaluation["confidences"]) for evaluation in evaluations)
+    num_ground_truth = sum(evaluation["num_ground_truth"] for evaluation in evaluations)
+    map_results = calculate_map(evaluations)
+    return {
+        "precision": true_positives / detections if detections else 0,
+        "recall": true_positives / num_ground_truth if num_ground_truth else 0,
+        "mAP": map_results["mAP"],
+        "AP50": map_results["AP50"],
+        "detection_mAP": map_results["detection_mAP"],
+    }
 
 # Main function to process images and calculate precision, recall, and mAP
 def process_images(image_folder, ground_truth_path, output_file_base):
@@ -100,34 +228,43 @@ def process_images(image_folder, ground_truth_path, output_file_base):
     ground_truth = load_ground_truth(ground_truth_path)
     results = {}
     cumulative_true_positives = 0
+    cumulative_false_positives = 0
     cumulative_false_negatives = 0
-    all_precisions = []
-
-    # Process each image in the folder
-    for image_name in os.listdir(image_folder):
-        image_path = os.path.join(image_folder, image_name)
+    evaluations = []
 
+    # Collect the images that have ground truth to score against
+    image_paths = []
+    for image_name in sorted(os.listdir(image_folder)):
         # Skip non-image files
         if not image_name.lower().endswith(('.png', '.jpg', '.jpeg')):
             print(f"Skipping non-image file: {image_name}")
             continue
 
-        print(f"Processing {image_name}...")
-        gt_data = ground_truth.get(f"images/{image_name}", [])
-
-        if not gt_data:
+        if not ground_truth.get(f"images/{image_name}"):
             print(f"No ground truth data for {image_name}")
             continue
+        image_paths.append(os.path.join(image_folder, image_name))
 
-        # Get OCR results from the service
-        ocr_results = get_ocr_results(image_path)
-        
+    # Score each image as its response arrives, in file name order, while the
+    # runner's workers keep requesting the rest
+    runner = EvaluationRunner(OCR_SERVICE_URL, response_store)
+    for image_path, json_response in runner.run(image_paths):
+        image_name = os.path.basename(image_path)
+        print(f"Processing {image_name}...")
+        gt_data = ground_truth[f"images/{image_name}"]
+
+        # An image without detections still counts: all of its ground truth boxes are
+        # false negatives
+        ocr_results = get_ocr_results(image_path, json_response)
+        if ocr_results is None:
+            continue
         if not ocr_results:
             print(f"No OCR results found for {image_name}")
-            continue
-        
-        # Calculate precision, recall, true positives, and false negatives (without false positives for now)
-        precision, recall, true_positives, false_negatives = calculate_metrics(ocr_results, gt_data)
+
+        # Match detections to ground truth by IoU and text at every threshold
+        evaluation = evaluate_image(ocr_results, gt_data)
+        evaluations.append(evaluation)
+        precision, recall, true_positives, false_positives, false_negatives = calculate_metrics(evaluation)
         
         print(f"Results for {image_name}: Precision={precision:.4f}, Recall={recall:.4f}")
         
@@ -136,27 +273,32 @@ def process_images(image_folder, ground_truth_path, output_file_base):
             "precision": precision,
             "recall": recall,
             "true_positives": true_positives,
+            "false_positives": false_positives,
             "false_negatives": false_negatives
         }
 
         # Update cumulative results
         cumulative_true_positives += true_positives
+        cumulative_false_positives += false_positives
         cumulative_false_negatives += false_negatives
-        all_precisions.append(precision)
 
     # Calculate cumulative precision, recall, and mAP
-    cumulative_precision = cumulative_true_positives / len(all_precisions) if all_precisions else 0
+    detections = cumulative_true_positives + cumulative_false_positives
+    cumulative_precision = cumulative_true_positives / detections if detections > 0 else 0
     cumulative_recall = cumulative_true_positives / (cumulative_true_positives + cumulative_false_negatives) if (cumulative_true_positives + cumulative_false_negatives) > 0 else 0
-    mAP = calculate_map(all_precisions)
+    map_results = calculate_map(evaluations)
+    mAP = map_results["mAP"]
 
     print(f"Cumulative Precision: {cumulative_precision:.4f}, Cumulative Recall: {cumulative_recall:.4f}, mAP: {mAP:.4f}")
+    print(response_store.summary())
     
     results["cumulative"] = {
         "precision": cumulative_precision,
         "recall": cumulative_recall,
-        "mAP": mAP,
         "true_positives": cumulative_true_positives,
-        "false_negatives": cumulative_false_negatives
+        "false_positives": cumulative_false_positives,
+        "false_negatives": cumulative_false_negatives,
+        **map_results
     }
 
     # Dynamically name the output file
@@ -170,7 +312,7 @@ def process_images(image_folder, ground_truth_path, output_file_base):
 if __name__ == "__main__":
     # Input paths
     IMAGE_FOLDER = "benchmark_dataset/images"
-    GROUND_TRUTH_PATH = "ground_truth_converted.json"
+    GROUND_TRUTH_PATH = ANNOTATIONS_PATH
     OUTPUT_FILE_BASE = "precision_recall_map_results"
     OUTPUT_FILE = "precision_recall_map_results.json"
 
@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from fastapi.responses import PlainTextResponse, Response
+
+# Recent observations kept per stage to compute the p50/p95/p99 quantiles
+OCR_METRICS_WINDOW = int(os.environ.get("OCR_METRICS_WINDOW", 2048))
+
+# Histogram bucket bounds in seconds, from a cache hit up to a long video
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class StageHistogram:
+    def __init__(self, window=OCR_METRICS_WINDOW):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def quantile(self, q):
+        if not self.recent:
+            return None
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+
+# Per-stage latency histograms of one service, exported in the Prometheus text format:
+# ocr_stage_seconds is a histogram over all requests, ocr_stage_quantile_seconds holds
+# p50/p95/p99 over the most recent OCR_METRICS_WINDOW observations of each stage
+class StageMetrics:
+    def __init__(self, service):
+        self.service = service
+        self._histograms = {}
+        # Observed from inference threads as well as the event loop
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = StageHistogram()
+            histogram.observe(seconds)
+
+    def timer(self):
+        return StageTimer(self)
+
+    def render(self):
+        lines = [
+            "# HELP ocr_stage_seconds Time spent in each stage of OCR request handling.",
+            "# TYPE ocr_stage_seconds histogram",
+        ]
+        quantile_lines = [
+            "# HELP ocr_stage_quantile_seconds Recent p50/p95/p99 of each stage.",
+            "# TYPE ocr_stage_quantile_seconds gauge",
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                labels = f'service="{self.service}",stage="{stage}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.bucket_counts):
+                    cumulative += count
+                    lines.append(f'ocr_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'ocr_stage_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"ocr_stage_seconds_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"ocr_stage_seconds_count{{{labels}}} {histogram.count}")
+                for q in QUANTILES:
+                    value = histogram.quantile(q)
+                    if value is not None:
+                        quantile_lines.append(f'ocr_stage_quantile_seconds{{{labels},quantile="{q}"}} {value}')
+        return "\n".join(lines + quantile_lines) + "\n"
+
+    def response(self):
+        return PlainTextResponse(self.render(), media_type="text/plain; version=0.0.4")
+
+
+# Monotonic stage timer for one request (or one file of it). Every stage is recorded
+# in the service histograms and summed into a breakdown that can go in the response.
+class StageTimer:
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start_time)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        self.metrics.observe(name, seconds)
+
+    def breakdown(self):
+        return {name: round(seconds, 6) for name, seconds in self.stages.items()}
+
+
+# Serialize a JSON response body, recording the time spent in the serialization stage
+def json_response(metrics, content):
+    start_time = time.perf_counter()
+    body = json.dumps(content)
+    metrics.observe("serialization", time.perf_counter() - start_time)
+    return Response(content=body, media_type="application/json")
@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+
+# Collects items submitted by concurrent requests and runs them through a single
+# batched engine call. A batch is flushed as soon as it reaches max_batch_size or
+# max_wait_ms after its first item arrived, whichever comes first.
+# Batches run on the given BoundedExecutor (or the loop's default executor), with at
+# most max_concurrent_batches in flight; while all slots are busy new items keep
+# queueing, so the next batch fills up instead of being dispatched one by one.
+class MicroBatcher:
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=5.0, executor=None, max_concurrent_batches=None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1.")
+        # run_batch is a blocking callable: list of items -> list of results (same order).
+        # A result that is an Exception instance fails only that item's request.
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.executor = executor
+        if max_concurrent_batches is None:
+            max_concurrent_batches = executor.max_workers if executor is not None else 1
+        self.max_concurrent_batches = max_concurrent_batches
+        self._queue = None
+        self._worker = None
+        self._loop = None
+        self._slots = None
+        self._in_flight = set()
+
+        # Simple counters so the batch size actually achieved can be inspected
+        self.batches_run = 0
+        self.items_processed = 0
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, item):
+        # Queue a single item and wait for its own result from the batched call
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect_batch(self):
+        # Block for the first item, then keep filling until the batch is full
+        # or the wait window closes
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            # Items that are already waiting join the batch without any delay
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            # Wait for a free engine slot before starting to collect the next batch
+            await self._slots.acquire()
+            batch = await self._collect_batch()
+            # Drop items whose caller has already gone away
+            batch = [(item, future) for item, future in batch if not future.cancelled()]
+            if not batch:
+                self._slots.release()
+                continue
+
+            task = self._loop.create_task(self._dispatch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _dispatch(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            if self.executor is None:
+                results = await self._loop.run_in_executor(None, self.run_batch, items)
+            else:
+                results = await self.executor.run(self.run_batch, items)
+            if len(results) != len(items):
+                raise RuntimeError(f"Batch returned {len(results)} results for {len(items)} items.")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+
+        self.batches_run += 1
+        self.items_processed += len(items)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "max_concurrent_batches": self.max_concurrent_batches,
+            "batches_run": self.batches_run,
+            "items_processed": self.items_processed,
+            "average_batch_size": self.items_processed / self.batches_run if self.batches_run else 0,
+        }
@@ -1,10 +1,36 @@
 import modal
-from fastapi import FastAPI, File, UploadFile, Body, HTTPException
+from fastapi import FastAPI, File, UploadFile, Body, HTTPException, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-import easyocr
-import cv2
+import os
+import json
 import time
-from typing import List
+import asyncio
+import tempfile
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from micro_batcher import MicroBatcher
+from inference_executor import get_executor, get_engine_concurrency
+from image_io import read_upload, save_upload, decode_image, RequestSizeLimitMiddleware
+from result_cache import OCRResultCache
+from video_reader import VideoFrameReader
+from engine_registry import EngineRegistry
+from ocr_engines import ENGINE_PARAMS, ENGINE_CONCURRENCY, ENGINES, RECOGNIZERS, register_engines, bake_weights, keep_allowed, make_warm_up
+from streaming import STREAM_MODES, merge_streams, streaming_response
+from job_queue import JobStore, JobWorker
+from admission import AdmissionController, client_id_for
+from metrics import StageMetrics
+from response_formats import negotiated_response
+from result_filter import ResultFilter, allowlist_of, apply_filter
+from tiling import OCR_TILE_MAX_IN_FLIGHT, TILE_PARAMS, needs_tiling, tile_grid, crop_tile, offset_results, merge_tile_results
+from cascade import OCR_CASCADE_THRESHOLD, CascadePolicy, tag_results, merge_escalated
+from startup import OCR_WARM_UP, StartupTimeline, process_age_seconds
+from inference_workers import OCR_INFERENCE_WORKERS, OCR_WORKER_ENGINES, with_inference_workers
+
+# Startup phases of this container, reported at GET /ready. Engine libraries are
+# imported by their loaders, so the service's own imports stay light
+startup = StartupTimeline()
+startup.record("imports", process_age_seconds())
 
 # Global flag to control logging for the current request
 LOGGING_ENABLED = False  # Default value, can be overridden per request
@@ -12,9 +38,25 @@ LOGGING_ENABLED = False  # Default value, can be overridden per request
 # Initialize Modal
 app = modal.App("ocr_service")
 
-# Define the container image to include necessary dependencies and request a GPU
-image = modal.Image.debian_slim().pip_install(
-    "fastapi", "uvicorn", "easyocr", "opencv-python-headless", "torch"
+# Define the container image to include necessary dependencies and request a GPU.
+# It carries every engine the registry can load; each is imported only when loaded.
+# The engines' weights are downloaded (and the ONNX models exported) while the image is
+# built, so a cold container reads them from disk instead of fetching them
+image = modal.Image.debian_slim().apt_install(
+    "tesseract-ocr", "libtesseract-dev", "libleptonica-dev", "pkg-config", "g++",
+    "libgl1", "libglib2.0-0", "libgstreamer1.0-0"
+).pip_install(
+    "fastapi", "uvicorn", "easyocr", "opencv-python-headless", "torch", "msgpack", "zstandard", "onnx", "onnxruntime",
+    "pytesseract", "tesserocr", "tensorflow==2.15", "keras-ocr", "paddlepaddle", "paddleocr>=2.0.1"
+).add_local_python_source(
+    # Copied into the image rather than mounted: bake_weights runs them at build time
+    "ocr_engines", "onnx_easyocr", copy=True
+).run_function(
+    bake_weights
+).add_local_python_source(
+    "micro_batcher", "inference_executor", "image_io", "result_cache", "video_reader",
+    "engine_registry", "tesseract_pool", "streaming", "job_queue", "admission",
+    "metrics", "tiling", "result_filter", "response_formats", "startup", "cascade", "inference_workers"
 )
 
 # Create the FastAPI app and rename it to avoid conflict
@@ -29,101 +71,703 @@ fastapi_app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize the EasyOCR reader at the global scope and enable GPU (if available)
-reader = easyocr.Reader(['en'], gpu=True)  # Enable GPU
-
 # Set the maximum file size limit (e.g., 100MB)
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100 MB
 
+# Cap on the whole multipart body, enforced while it streams in
+MAX_REQUEST_SIZE = int(os.environ.get("OCR_MAX_REQUEST_SIZE", 10 * MAX_FILE_SIZE))
+fastapi_app.add_middleware(RequestSizeLimitMiddleware, max_body_size=MAX_REQUEST_SIZE)
+
+# Every engine is loaded and warmed up once, then kept in memory for later requests
+# (up to OCR_MAX_LOADED_ENGINES at a time, unloaded after OCR_ENGINE_IDLE_SECONDS idle)
+registry = EngineRegistry()
+
+# With OCR_INFERENCE_WORKERS set, the OCR_WORKER_ENGINES run in that many forked worker
+# processes, fed through shared memory, instead of on this process's inference
+# threads. Each worker runs one batch at a time, so the engine runs as many batches at
+# once as it has workers
+engines, recognizers = with_inference_workers(ENGINES, RECOGNIZERS, make_warm_up)
+engine_concurrency = {
+    **ENGINE_CONCURRENCY,
+    **{name: OCR_INFERENCE_WORKERS for name in OCR_WORKER_ENGINES if OCR_INFERENCE_WORKERS > 0},
+}
+register_engines(registry, warm_up=OCR_WARM_UP, engines=engines)
+
+# Engines loaded when the container starts instead of on their first request
+OCR_PRELOAD_ENGINES = [name for name in os.environ.get("OCR_PRELOAD_ENGINES", "easyocr").split(",") if name]
+
 # Available OCR models
-available_models = ["easyocr"]
+available_models = registry.names()
+
+# Results cached by image content, so resubmitted images skip inference
+ocr_cache = OCRResultCache()
+
+# Micro-batching knobs: images from concurrent requests are grouped into one batched
+# engine call of at most OCR_MAX_BATCH_SIZE images, waiting at most
+# OCR_MAX_BATCH_WAIT_MS for the batch to fill up
+OCR_MAX_BATCH_SIZE = int(os.environ.get("OCR_MAX_BATCH_SIZE", 8))
+OCR_MAX_BATCH_WAIT_MS = float(os.environ.get("OCR_MAX_BATCH_WAIT_MS", 5))
+
+# Bounded queue per engine: /ocr requests beyond OCR_MAX_QUEUE queued images are turned
+# away with 503 + Retry-After (429 past a client's OCR_CLIENT_MAX_SHARE of the queue)
+admission = {
+    model_name: AdmissionController(model_name, get_engine_concurrency(model_name, engine_concurrency[model_name]))
+    for model_name in available_models
+}
+
+# Per-stage latency histograms, exported at GET /metrics
+stage_metrics = StageMetrics("ocr_service")
+
+# Run batched calls on a registry engine, loading it first if it isn't in memory. Items
+# are (image, allowlist) pairs; images sharing an allowlist go through one engine call.
+# Every image's result comes back with the stage timings of the call it ran in.
+def make_engine_batch(model_name):
+    run_batch = engines[model_name][1]
+    def run_engine_batch(items):
+        groups = {}
+        for index, (_, allowlist) in enumerate(items):
+            groups.setdefault(allowlist, []).append(index)
+
+        outputs = [None] * len(items)
+        with registry.use(model_name) as engine:
+            start_time = time.perf_counter()
+            for allowlist, indices in groups.items():
+                timings = {}
+                results = run_batch(engine, [items[i][0] for i in indices], timings, allowlist)
+                for i, result in zip(indices, results):
+                    outputs[i] = (result, timings)
+        # Observed service time drives the Retry-After estimate
+        admission[model_name].observe(time.perf_counter() - start_time, len(items))
+        return outputs
+    return run_engine_batch
+
+# Inference runs on bounded thread pools so the event loop keeps serving uploads and
+# health checks; the engines release the GIL during inference. Batches in flight at
+# once per engine are set with OCR_<ENGINE>_CONCURRENCY (e.g. OCR_EASYOCR_CONCURRENCY)
+batchers = {
+    model_name: MicroBatcher(
+        make_engine_batch(model_name),
+        max_batch_size=OCR_MAX_BATCH_SIZE,
+        max_wait_ms=OCR_MAX_BATCH_WAIT_MS,
+        executor=get_executor(model_name, kind="thread", default_concurrency=engine_concurrency[model_name]),
+    )
+    for model_name in available_models
+}
 
-# Utility function to log messages
+# Load and warm up the preloaded engines before serving traffic (or, with
+# OCR_PRELOAD_IN_BACKGROUND, while already serving, with /ready answering 503 until done)
+async def preload_engines():
+    for model_name in OCR_PRELOAD_ENGINES:
+        await asyncio.to_thread(registry.get, model_name)
+        startup.record_engine(model_name, registry.stats()["engines"][model_name])
+
+# Unload engines idle for OCR_ENGINE_IDLE_SECONDS even when no request comes in to
+# trigger the eviction
+async def evict_idle_engines():
+    while True:
+        await asyncio.sleep(registry.idle_seconds / 2)
+        try:
+            await asyncio.to_thread(registry.evict_idle)
+        except Exception as e:
+            print(f"Error while unloading idle OCR engines: {str(e)}")
+
+idle_eviction = None
+
+@fastapi_app.on_event("startup")
+async def start_up():
+    global idle_eviction
+    if registry.idle_seconds:
+        idle_eviction = asyncio.create_task(evict_idle_engines())
+    await startup.run(preload_engines)
+
+# Engines that own processes stop them on the way out; inference worker pools also
+# free their shared memory
+@fastapi_app.on_event("shutdown")
+async def unload_engines():
+    if idle_eviction is not None:
+        idle_eviction.cancel()
+    for model_name in registry.names():
+        registry.unload(model_name)
+
+# Asynchronous jobs: POST /jobs queues the files in a SQLite-backed store and returns at
+# once, background workers (OCR_JOB_WORKERS per container) process them chunk by chunk.
+# The store lives on the container's own disk (OCR_JOBS_DIR): on a deployment scaled to
+# several containers, a job is only known to the container that accepted it
+job_store = JobStore()
+
+# Worker side of a job: recognize one chunk of its stored files, events in completion order
+async def job_file_events(job, files):
+    params = job["params"]
+    streams = []
+    for file_index, file_name, path in files:
+        content = await asyncio.to_thread(read_file, path)
+        streams.append(stream_file_events(
+            file_index, file_name, content, params["sample_rate"], params["model_name"],
+            tile=params.get("tile", False), result_filter=ResultFilter.from_params(params.get("result_filter")),
+            cascade=CascadePolicy.from_params(params.get("cascade"))
+        ))
+    async for event in merge_streams(streams):
+        yield event
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+job_worker = JobWorker(job_store, job_file_events)
+
+@fastapi_app.on_event("startup")
+async def start_job_worker():
+    await job_worker.start()
+
+@fastapi_app.on_event("shutdown")
+async def stop_job_worker():
+    await job_worker.stop()
+
+# Utility function to log informational messages when the request asked for them;
+# unexpected errors are always printed, since streams and jobs outlive the request flag
 def log_message(message: str):
     if LOGGING_ENABLED:
         print(message)
 
 @fastapi_app.post("/ocr")
 async def perform_ocr(
+    request: Request,
     files: List[UploadFile] = File(..., description="List of files to process"),
     sample_rate: int = Body(1, embed=True),
     model_name: str = Body("easyocr", embed=True),
-    logging_enabled: bool = Body(False, embed=True)
+    logging_enabled: bool = Body(False, embed=True),
+    stream: Optional[str] = Body(None, embed=True),
+    include_timings: bool = Body(False, embed=True),
+    tile: bool = Body(False, embed=True),
+    allowlist: Optional[str] = Body(None, embed=True),
+    text_pattern: Optional[str] = Body(None, embed=True),
+    min_confidence: float = Body(0.0, embed=True),
+    cascade: bool = Body(False, embed=True),
+    cascade_threshold: float = Body(OCR_CASCADE_THRESHOLD, embed=True)
 ):
     global LOGGING_ENABLED  # Use global variable to control logging
     LOGGING_ENABLED = logging_enabled  # Set logging status based on the request parameter
 
     if model_name not in available_models:
         raise HTTPException(status_code=400, detail=f"Unsupported OCR model: {model_name}. Available models are {available_models}.")
+    if stream is not None and stream not in STREAM_MODES:
+        raise HTTPException(status_code=400, detail=f"Unsupported stream mode: {stream}. Available modes are {list(STREAM_MODES)}.")
+    result_filter = make_result_filter(allowlist, text_pattern, min_confidence)
+    cascade_policy = make_cascade_policy(cascade, cascade_threshold, model_name)
+
+    # Admit the request before its files are read into memory; a full queue is
+    # rejected right away instead of adding to the backlog
+    tickets = admit_request(request, model_name, cascade_policy, len(files))
+    streaming = False
+    request_start = time.perf_counter()
 
     try:
-        results_with_benchmark = []
+        uploads = []
 
         for file in files:
-            # Save uploaded file locally
-            file_path = f"/tmp/{file.filename}"
-            
-            # Check file size before saving
-            content = await file.read()
-            if len(content) > MAX_FILE_SIZE:
-                raise HTTPException(status_code=413, detail=f"File size of {file.filename} exceeds maximum limit of 100MB.")
-            
-            with open(file_path, "wb") as f:
-                f.write(content)
-
-            # Start benchmark timer
-            start_time = time.time()
-
-            # Check if it's a video or an image
-            if file.filename.endswith(('.mp4', '.avi')):
-                result, frames_processed = process_video(file_path, sample_rate, model_name)
-            else:
-                result = process_image(file_path, model_name)
-                frames_processed = None
+            # One stage timer per file; its breakdown goes in the response on request
+            timer = stage_metrics.timer()
+            with timer.stage("upload_read"):
+                # Read the upload into memory in chunks, enforcing the size limit as bytes arrive
+                content = await read_upload(file, MAX_FILE_SIZE)
+            uploads.append((file.filename, content, timer))
 
-            # End benchmark timer
-            end_time = time.time()
-            processing_time = end_time - start_time
+        if stream is not None:
+            # Emit each file's (and each video frame's) result as soon as it is ready,
+            # in completion order; every event carries the index of its file
+            events = merge_streams([
+                stream_file_events(file_index, file_name, content, sample_rate, model_name, timer, include_timings, tile, result_filter, cascade_policy)
+                for file_index, (file_name, content, timer) in enumerate(uploads)
+            ])
+            streaming = True
+            return streaming_response(release_after(events, tickets), stream)
 
-            # Append result for each file
-            results_with_benchmark.append({
-                "file_name": file.filename,
-                "processing_time_seconds": processing_time,
-                "frames_processed": frames_processed,
-                "ocr_results": result
-            })
-        
-        return results_with_benchmark
+        # Submit every file at once so the batcher can group them with each other
+        # and with images from concurrent requests
+        results_with_benchmark = await asyncio.gather(*[
+            process_file(file_name, content, sample_rate, model_name, timer, include_timings, tile, result_filter, cascade_policy)
+            for file_name, content, timer in uploads
+        ])
+
+        response = negotiated_response(stage_metrics, results_with_benchmark, request)
+        stage_metrics.observe("request", time.perf_counter() - request_start)
+        return response
     
     except HTTPException as e:
         raise e
     except Exception as e:
-        log_message(f"Error during OCR processing for {file.filename}: {str(e)}")
+        print(f"Error during OCR processing: {str(e)}")
         raise HTTPException(status_code=500, detail="An internal server error occurred. Please check the logs for details.")
     finally:
         LOGGING_ENABLED = False
+        if not streaming:
+            release_tickets(tickets)
+
+# Recognition only: read the text inside regions the caller already knows, such as the
+# bounding_box values of an earlier /ocr response, without running text detection.
+# `boxes` is a JSON list of 4-point boxes, [x1, y1, x2, y2] rectangles or result
+# objects with a bounding_box; results come back one per box, in the same order
+@fastapi_app.post("/recognize")
+async def recognize_regions(
+    request: Request,
+    file: UploadFile = File(..., description="Image to read the regions from"),
+    boxes: str = Body(..., embed=True),
+    model_name: str = Body("easyocr", embed=True),
+    include_timings: bool = Body(False, embed=True)
+):
+    if model_name not in recognizers:
+        raise HTTPException(status_code=400, detail=f"Unsupported recognition model: {model_name}. Available models are {list(recognizers)}.")
+    regions = parse_boxes(boxes)
+
+    ticket = admission[model_name].admit(client_id_for(request), 1)
+    request_start = time.perf_counter()
+    try:
+        timer = stage_metrics.timer()
+        with timer.stage("upload_read"):
+            content = await read_upload(file, MAX_FILE_SIZE)
+        with timer.stage("decode"):
+            img = await asyncio.to_thread(decode_image, content, file.filename)
+
+        result = await recognize_image_regions(img, model_name, regions, timer)
+
+        file_result = {
+            "file_name": file.filename,
+            "processing_time_seconds": time.perf_counter() - request_start,
+            "ocr_results": result
+        }
+        if include_timings:
+            file_result["stage_seconds"] = timer.breakdown()
+        response = negotiated_response(stage_metrics, [file_result], request)
+        stage_metrics.observe("request", time.perf_counter() - request_start)
+        return response
+    finally:
+        admission[model_name].release(ticket)
+
+# Run model_name's recognizer on regions of a decoded image. Shares the engine's
+# executor with /ocr batches, so GPU concurrency stays bounded
+async def recognize_image_regions(img, model_name, regions, timer=None):
+    executor = get_executor(model_name, kind="thread", default_concurrency=engine_concurrency[model_name])
+    submitted = time.perf_counter()
+    result, timings = await executor.run(run_recognizer, model_name, img, regions)
+    if timer is not None:
+        timer.add("queue_wait", max(0.0, time.perf_counter() - submitted - sum(timings.values())))
+        for stage, seconds in timings.items():
+            timer.add(stage, seconds)
+    return result
+
+def run_recognizer(model_name, img, regions):
+    timings = {}
+    with registry.use(model_name) as engine:
+        start_time = time.perf_counter()
+        result = recognizers[model_name](engine, img, regions, timings)
+    admission[model_name].observe(time.perf_counter() - start_time, 1)
+    return result, timings
+
+# The boxes form field of /recognize as a list of 4-point boxes
+def parse_boxes(boxes):
+    try:
+        items = json.loads(boxes)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="boxes must be a JSON list of boxes.")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="boxes must be a JSON list of boxes.")
+
+    regions = []
+    for item in items:
+        box = item.get("bounding_box") if isinstance(item, dict) else item
+        try:
+            if len(box) == 4 and all(isinstance(value, (int, float)) for value in box):
+                x1, y1, x2, y2 = box
+                box = [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]
+            box = [[float(x), float(y)] for x, y in box]
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail=f"Invalid box: {item}. Expected 4 [x, y] points or [x1, y1, x2, y2].")
+        if len(box) != 4:
+            raise HTTPException(status_code=400, detail=f"Invalid box: {item}. Expected 4 [x, y] points or [x1, y1, x2, y2].")
+        regions.append(box)
+    return regions
+
+# Filter for the allowlist/text_pattern/min_confidence form fields; None when all are unset
+def make_result_filter(allowlist, text_pattern, min_confidence):
+    if not allowlist and not text_pattern and not min_confidence:
+        return None
+    return ResultFilter(allowlist, text_pattern, min_confidence)
+
+# Cascade settings of a request, or None without cascade. model_name is the heavy engine
+def make_cascade_policy(cascade, cascade_threshold, model_name):
+    if not cascade:
+        return None
+    policy = CascadePolicy(cascade_threshold)
+    if policy.fast_engine not in available_models:
+        raise HTTPException(status_code=400, detail=f"Cascade engine {policy.fast_engine} is not available.")
+    if model_name == policy.fast_engine:
+        raise HTTPException(status_code=400, detail=f"A cascade needs a model_name other than its first-pass engine {policy.fast_engine}.")
+    return policy
+
+# Per-stage latency histograms and p50/p95/p99 in the Prometheus text format
+@fastapi_app.get("/metrics")
+async def metrics():
+    return stage_metrics.response()
+
+# Keep a streamed request admitted until its last event has been sent
+async def release_after(events, tickets):
+    try:
+        async for event in events:
+            yield event
+    finally:
+        release_tickets(tickets)
+
+# Admit a request on every engine it runs on: with a cascade, the first-pass engine
+# reads every image as well. Returns the (engine, ticket) pairs to release afterwards
+def admit_request(request, model_name, cascade_policy, weight):
+    engine_names = [model_name] if cascade_policy is None else [model_name, cascade_policy.fast_engine]
+    tickets = []
+    try:
+        for engine_name in engine_names:
+            tickets.append((engine_name, admission[engine_name].admit(client_id_for(request), weight)))
+    except BaseException:
+        release_tickets(tickets)
+        raise
+    return tickets
 
-def process_image(image_path, model_name):
-    if model_name == "easyocr":
-        results = reader.readtext(image_path)
-        return format_results(results)
+def release_tickets(tickets):
+    for engine_name, ticket in tickets:
+        admission[engine_name].release(ticket)
+
+# Queue depth, service time and rejection counters of every engine's admission queue
+@fastapi_app.get("/admission")
+async def admission_stats():
+    return {model_name: controller.stats() for model_name, controller in admission.items()}
+
+# Queue a batch of files (or videos) and return a job id right away
+@fastapi_app.post("/jobs", status_code=202)
+async def create_job(
+    files: List[UploadFile] = File(..., description="List of files to process"),
+    sample_rate: int = Body(1, embed=True),
+    model_name: str = Body("easyocr", embed=True),
+    tile: bool = Body(False, embed=True),
+    allowlist: Optional[str] = Body(None, embed=True),
+    text_pattern: Optional[str] = Body(None, embed=True),
+    min_confidence: float = Body(0.0, embed=True),
+    cascade: bool = Body(False, embed=True),
+    cascade_threshold: float = Body(OCR_CASCADE_THRESHOLD, embed=True)
+):
+    if model_name not in available_models:
+        raise HTTPException(status_code=400, detail=f"Unsupported OCR model: {model_name}. Available models are {available_models}.")
+    if sample_rate < 1:
+        raise HTTPException(status_code=400, detail="sample_rate must be at least 1.")
+    result_filter = make_result_filter(allowlist, text_pattern, min_confidence)
+    cascade_policy = make_cascade_policy(cascade, cascade_threshold, model_name)
+
+    # Uploads are streamed straight into the job's input directory, so a large job is
+    # never held in memory
+    job_id = await asyncio.to_thread(job_store.reserve)
+    uploads = []
+    try:
+        for file_index, file in enumerate(files):
+            path = job_store.input_path(job_id, file_index, file.filename)
+            await save_upload(file, path, MAX_FILE_SIZE)
+            uploads.append((file.filename, path))
+    except BaseException:
+        await asyncio.to_thread(job_store.discard, job_id)
+        raise
+
+    params = {
+        "sample_rate": sample_rate,
+        "model_name": model_name,
+        "tile": tile,
+        "result_filter": result_filter.to_params() if result_filter is not None else None,
+        "cascade": cascade_policy.to_params() if cascade_policy is not None else None,
+    }
+    await asyncio.to_thread(job_store.create, job_id, params, uploads)
+    return {"job_id": job_id, "status": "queued", "total_files": len(uploads)}
+
+# Job status plus one page of its results so far; page through with offset/limit
+@fastapi_app.get("/jobs/{job_id}")
+async def get_job(job_id: str, offset: int = 0, limit: int = 100):
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}. Jobs are kept by the container that accepted them unless OCR_JOBS_DIR is shared.")
+    limit = max(1, min(limit, 1000))
+    results = await asyncio.to_thread(job_store.results, job_id, offset, limit)
+    next_offset = offset + len(results)
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "model_name": job["params"]["model_name"],
+        "total_files": job["total_files"],
+        "files_done": job["files_done"],
+        "results_count": job["results_count"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "results": results,
+        "next_offset": next_offset if next_offset < job["results_count"] else None,
+    }
+
+# Cancel a queued or running job; results produced so far stay available
+@fastapi_app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    status = await asyncio.to_thread(job_store.cancel, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    job_worker.cancel(job_id)
+    if status != "cancelled":
+        return JSONResponse(status_code=409, content={"job_id": job_id, "status": status, "detail": f"Job already {status}."})
+    return {"job_id": job_id, "status": status}
+
+# Worker and queue counters of the job API
+@fastapi_app.get("/jobs")
+async def job_stats():
+    return await asyncio.to_thread(job_worker.stats)
+
+# Hit/miss/eviction counters of the result cache
+@fastapi_app.get("/cache")
+async def cache_stats():
+    return ocr_cache.stats()
+
+# Readiness probe: 200 once the preloaded engines are loaded and warmed up, 503 before
+# that or after a failed startup. Either way the body breaks startup down by phase
+@fastapi_app.get("/ready")
+async def ready():
+    report = startup.report()
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
+
+# Which engines are loaded, with their load/warm-up time and memory footprint
+@fastapi_app.get("/engines")
+async def engine_stats():
+    return registry.stats()
+
+async def process_file(file_name, content, sample_rate, model_name, timer=None, include_timings=False, tile=False, result_filter=None, cascade=None):
+    timer = timer or stage_metrics.timer()
+
+    # Start benchmark timer (monotonic, unaffected by clock adjustments)
+    start_time = time.perf_counter()
+
+    # Check if it's a video or an image
+    if is_video(file_name):
+        async with video_file(file_name, content) as video_path:
+            result, frames_processed = await process_video(video_path, sample_rate, model_name, timer, result_filter, tile, cascade)
+    else:
+        result = await process_image_upload(file_name, content, model_name, timer, tile, result_filter, cascade)
+        frames_processed = None
+
+    # End benchmark timer
+    processing_time = time.perf_counter() - start_time
+
+    log_message(f"Processed {file_name} in {processing_time:.3f}s")
+    file_result = {
+        "file_name": file_name,
+        "processing_time_seconds": processing_time,
+        "frames_processed": frames_processed,
+        "ocr_results": result
+    }
+    if include_timings:
+        file_result["stage_seconds"] = timer.breakdown()
+    return file_result
+
+def is_video(file_name):
+    return file_name.endswith(('.mp4', '.avi'))
+
+# OpenCV can only open videos from a path, so videos still go through a uniquely
+# named temp file that is removed once processed. Both happen off the event loop: a
+# video can be hundreds of megabytes
+@asynccontextmanager
+async def video_file(file_name, content):
+    video_path = await asyncio.to_thread(write_temp_file, content, os.path.splitext(file_name)[1])
+    try:
+        yield video_path
+    finally:
+        await asyncio.to_thread(os.remove, video_path)
+
+def write_temp_file(content, suffix):
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+        f.write(content)
+        return f.name
+
+async def process_image_upload(file_name, content, model_name, timer=None, tile=False, result_filter=None, cascade=None):
+    allowlist = allowlist_of(result_filter)
+
+    async def run_ocr():
+        # Decode straight from the upload buffer, off the event loop
+        start_time = time.perf_counter()
+        img = await asyncio.to_thread(decode_image, content, file_name)
+        if timer is not None:
+            timer.add("decode", time.perf_counter() - start_time)
+        return await process_decoded_image(img, model_name, timer, allowlist, tile, cascade)
+
+    # Identical images (resubmitted or arriving together) share one inference. The
+    # allowlist changes what the engine reads; the other filters apply to cached results
+    params = dict(ENGINE_PARAMS[model_name])
+    if tile:
+        params["tile"] = TILE_PARAMS
+    if allowlist:
+        params["allowlist"] = allowlist
+    if cascade is not None:
+        params["cascade"] = {**cascade.to_params(), "fast_engine_params": ENGINE_PARAMS[cascade.fast_engine]}
+    cache_key = await asyncio.to_thread(OCRResultCache.make_key, content, model_name, params)
+    return apply_filter(result_filter, await ocr_cache.get_or_compute(cache_key, run_ocr))
+
+# OCR of a decoded image or video frame: tiled when asked for and large enough,
+# through the cascade when one is set
+async def process_decoded_image(img, model_name, timer=None, allowlist=None, tile=False, cascade=None):
+    if tile and needs_tiling(img.shape):
+        return await process_image_tiled(img, model_name, timer, allowlist, cascade)
+    if cascade is not None:
+        return await process_image_cascade(img, model_name, cascade, timer, allowlist)
+    return await process_image(img, model_name, timer, allowlist)
+
+# Streaming counterpart of process_file: one event for an image, one per sampled frame
+# for a video followed by a summary event. Errors are reported as an event for this
+# file only, since the response status has already been sent.
+async def stream_file_events(file_index, file_name, content, sample_rate, model_name, timer=None, include_timings=False, tile=False, result_filter=None, cascade=None):
+    timer = timer or stage_metrics.timer()
+    start_time = time.perf_counter()
+    try:
+        if is_video(file_name):
+            frames_processed = 0
+            async with video_file(file_name, content) as video_path:
+                async for frame_result in iter_video_results(video_path, sample_rate, model_name, timer, result_filter, tile, cascade):
+                    frames_processed += 1
+                    yield {"file_index": file_index, "file_name": file_name, **frame_result}
+            summary = {
+                "file_index": file_index,
+                "file_name": file_name,
+                "processing_time_seconds": time.perf_counter() - start_time,
+                "frames_processed": frames_processed,
+                "done": True,
+            }
+        else:
+            result = await process_image_upload(file_name, content, model_name, timer, tile, result_filter, cascade)
+            summary = {
+                "file_index": file_index,
+                "file_name": file_name,
+                "processing_time_seconds": time.perf_counter() - start_time,
+                "frames_processed": None,
+                "ocr_results": result,
+                "done": True,
+            }
+        if include_timings:
+            summary["stage_seconds"] = timer.breakdown()
+        yield summary
+    except HTTPException as e:
+        yield {"file_index": file_index, "file_name": file_name, "error": e.detail, "status_code": e.status_code, "done": True}
+    except Exception as e:
+        print(f"Error during OCR processing of {file_name}: {str(e)}")
+        yield {
+            "file_index": file_index,
+            "file_name": file_name,
+            "error": "An internal server error occurred. Please check the logs for details.",
+            "status_code": 500,
+            "done": True,
+        }
+    log_message(f"Streamed {file_name} in {time.perf_counter() - start_time:.3f}s")
+
+async def process_image(img, model_name, timer=None, allowlist=None):
+    if model_name in batchers:
+        start_time = time.perf_counter()
+        result, batch_timings = await batchers[model_name].submit((img, allowlist))
+        if timer is not None:
+            # Whatever the batch itself didn't spend went to waiting for a batch slot
+            waited = time.perf_counter() - start_time - sum(batch_timings.values())
+            timer.add("queue_wait", max(0.0, waited))
+            for stage, seconds in batch_timings.items():
+                timer.add(stage, seconds)
+        return result
 
     else:
         raise ValueError(f"Unsupported OCR model: {model_name}")
 
-def process_video(video_path, sample_rate, model_name):
-    # Similar to process_image but processes frames in the video
-    pass  # Implement video processing similarly to process_image
+# Recognize a large image as overlapping tiles at full resolution. The tiles go through
+# the engine's batcher like any other images, so they are batched together; at most
+# OCR_TILE_MAX_IN_FLIGHT of them are cropped at a time, which bounds memory beyond the
+# decoded image itself. Boxes come back in image coordinates, deduplicated at the seams
+async def process_image_tiled(img, model_name, timer=None, allowlist=None, cascade=None):
+    tiles = tile_grid(img.shape)
+    slots = asyncio.Semaphore(OCR_TILE_MAX_IN_FLIGHT)
+
+    async def recognize_tile(tile):
+        async with slots:
+            if cascade is not None:
+                result = await process_image_cascade(crop_tile(img, tile), model_name, cascade, timer, allowlist)
+            else:
+                result = await process_image(crop_tile(img, tile), model_name, timer, allowlist)
+        return offset_results(result, tile[0], tile[1])
+
+    tile_results = await asyncio.gather(*[recognize_tile(tile) for tile in tiles])
+    start_time = time.perf_counter()
+    merged = await asyncio.to_thread(merge_tile_results, tiles, tile_results)
+    if timer is not None:
+        timer.add("tile_merge", time.perf_counter() - start_time)
+    return merged
+
+# Confidence-gated cascade: the cheap first-pass engine reads the image, its confident
+# results are kept, and model_name only re-reads the unsure regions with its recognizer,
+# or reads the whole image when the first pass found little it is sure of. Every result
+# names the engine that produced it
+async def process_image_cascade(img, model_name, cascade, timer=None, allowlist=None):
+    results = await process_image(img, cascade.fast_engine, timer, allowlist)
+    confident, unsure = cascade.split(results)
+    if cascade.escalate_image(results, unsure, model_name in recognizers):
+        return tag_results(await process_image(img, model_name, timer, allowlist), model_name)
+    if not unsure:
+        return tag_results(confident, cascade.fast_engine)
+    rereads = await recognize_image_regions(img, model_name, [result["bounding_box"] for result in unsure], timer)
+    # Recognizers take no allowlist, so their reads are held to it afterwards
+    return merge_escalated(confident, cascade.fast_engine, keep_allowed(rereads, allowlist), model_name)
+
+async def process_video(video_path, sample_rate, model_name, timer=None, result_filter=None, tile=False, cascade=None):
+    # Similar to process_image but processes every sample_rate-th frame in the video
+    results = [frame_result async for frame_result in iter_video_results(video_path, sample_rate, model_name, timer, result_filter, tile, cascade)]
+    return results, len(results)
 
-def format_results(results):
-    output = []
-    for bbox, text, _ in results:
-        bbox = [[int(coord[0]), int(coord[1])] for coord in bbox]
-        output.append({"bounding_box": bbox, "text": text})
-    return output
+# Yield per-frame OCR results in frame order. Frames are decoded ahead on a background
+# thread (bounded queue) while the previous batch is being recognized, so memory stays
+# constant no matter how long the video is.
+async def iter_video_results(video_path, sample_rate, model_name, timer=None, result_filter=None, tile=False, cascade=None):
+    if sample_rate < 1:
+        raise HTTPException(status_code=400, detail="sample_rate must be at least 1.")
+
+    pending = []
+    # Decode time is the time spent waiting for the reader's next frame
+    wait_start = time.perf_counter()
+    async for frame in VideoFrameReader(video_path, sample_rate):
+        if timer is not None:
+            timer.add("decode", time.perf_counter() - wait_start)
+        pending.append(frame)
+        if len(pending) >= OCR_MAX_BATCH_SIZE:
+            for frame_result in await recognize_frames(pending, model_name, timer, result_filter, tile, cascade):
+                yield frame_result
+            pending = []
+        wait_start = time.perf_counter()
+
+    if pending:
+        for frame_result in await recognize_frames(pending, model_name, timer, result_filter, tile, cascade):
+            yield frame_result
+
+# Submit a group of frames together so the batcher can run them as one batch
+async def recognize_frames(frames, model_name, timer=None, result_filter=None, tile=False, cascade=None):
+    allowlist = allowlist_of(result_filter)
+    ocr_results = await asyncio.gather(*[process_decoded_image(img, model_name, timer, allowlist, tile, cascade) for _, _, img in frames])
+    return [
+        {"frame_index": frame_index, "timestamp_seconds": timestamp, "ocr_results": apply_filter(result_filter, result)}
+        for (frame_index, timestamp, _), result in zip(frames, ocr_results)
+    ]
 
 # Use modal.asgi_app to deploy FastAPI app with Modal and request a GPU
 @app.function(image=image, gpu="A10G")
 @modal.asgi_app()
 def fastapi_modal_app():
     return fastapi_app
+
+# The same app on a CPU-only container, serving EasyOCR through ONNX Runtime
+# (model_name=easyocr_onnx)
+@app.function(image=image, cpu=8.0, secrets=[modal.Secret.from_dict({
+    "OCR_PRELOAD_ENGINES": "easyocr_onnx",
+    # Four inference processes of two cores each
+    "OCR_INFERENCE_WORKERS": "4", "OCR_WORKER_ENGINES": "easyocr_onnx", "OCR_ONNX_INTRA_OP_THREADS": "2",
+})])
+@modal.asgi_app()
+def fastapi_modal_app_cpu():
+    return fastapi_app
@@ -0,0 +1,396 @@
+# Loaders, warm-ups and batch runners for every OCR engine the services can use.
+# Engine libraries are imported inside the loaders, so a container only needs the
+# packages of the engines it actually loads. Every run_*_batch function takes the
+# loaded engine and a list of decoded BGR images and returns one result list per
+# image, each result being {"bounding_box": [[x, y], ...], "text": text, "confidence": c}
+# with c between 0 and 1 (keras-ocr reports no confidence). Runners also take an
+# optional timings dict and add the seconds spent per stage to it: "detection" and
+# "recognition" where the engine runs them separately, "inference" otherwise. An
+# optional allowlist restricts the characters the engine may recognize; engines
+# without such a setting drop results containing any other character instead.
+
+import os
+import time
+from contextlib import contextmanager
+
+EASYOCR_LANGUAGES = ['en']
+TESSERACT_PARAMS = {"lang": "eng", "config": ""}
+PADDLE_PARAMS = {"use_angle_cls": True, "lang": "en"}
+# int8 quantization of the ONNX Runtime EasyOCR networks: none, recognizer or all
+ONNX_QUANTIZE = os.environ.get("OCR_ONNX_QUANTIZE", "recognizer")
+# EasyOCR's detector scales its input down to fit this many pixels on the long side
+# (the canvas_size default of Reader.detect)
+EASYOCR_CANVAS_SIZE = 2560
+# Largest share of a batched EasyOCR canvas an image may leave as padding
+OCR_BATCH_MAX_PADDING = float(os.environ.get("OCR_BATCH_MAX_PADDING", 0.5))
+
+# Engine parameters that change the output; they are part of the result cache key
+ENGINE_PARAMS = {
+    "easyocr": {"languages": EASYOCR_LANGUAGES},
+    "easyocr_onnx": {"languages": EASYOCR_LANGUAGES, "quantize": ONNX_QUANTIZE},
+    "tesseract": TESSERACT_PARAMS,
+    "keras_ocr": {},
+    "paddleocr": PADDLE_PARAMS,
+}
+
+# Default number of concurrent inference calls per engine (OCR_<ENGINE>_CONCURRENCY
+# overrides it). A Tesseract batch is already spread over one worker process per core,
+# so two batches in flight are enough to keep those workers busy. The ONNX Runtime
+# networks already use every core for one call (OCR_ONNX_INTRA_OP_THREADS).
+ENGINE_CONCURRENCY = {
+    "easyocr": 1,
+    "easyocr_onnx": 1,
+    "tesseract": 2,
+    "keras_ocr": 1,
+    "paddleocr": 1,
+}
+
+
+def format_results(results):
+    output = []
+    for bbox, text, confidence in results:
+        bbox = [[int(coord[0]), int(coord[1])] for coord in bbox]
+        output.append({"bounding_box": bbox, "text": text, "confidence": float(confidence)})
+    return output
+
+# For engines that can't restrict their character set: keep only results made of
+# allowed characters
+def keep_allowed(results, allowlist):
+    if not allowlist:
+        return results
+    allowed = set(allowlist)
+    return [result for result in results if set(result["text"]) <= allowed]
+
+# Pad images to a shared canvas so they can go through readtext_batched together.
+# Padding is added on the bottom/right only, so box coordinates stay unchanged.
+def pad_to_common_size(images):
+    import cv2
+
+    max_height = max(img.shape[0] for img in images)
+    max_width = max(img.shape[1] for img in images)
+    return [
+        cv2.copyMakeBorder(img, 0, max_height - img.shape[0], 0, max_width - img.shape[1], cv2.BORDER_CONSTANT, value=0)
+        for img in images
+    ]
+
+# Scale EasyOCR's detector applies to an image (or padded canvas) of this size
+def detection_scale(height, width, canvas_size=EASYOCR_CANVAS_SIZE):
+    return min(1.0, canvas_size / max(height, width))
+
+# Split a batch into groups of images that can share a padded canvas: one where every
+# image keeps the detection scale it would get alone (a small image padded next to a
+# large one would otherwise be detected at a lower resolution) and is at most
+# max_padding padding. Returns lists of indices into images
+def size_groups(images, canvas_size=EASYOCR_CANVAS_SIZE, max_padding=OCR_BATCH_MAX_PADDING):
+    def fits(sizes, height, width):
+        canvas_scale = detection_scale(height, width, canvas_size)
+        return all(
+            detection_scale(h, w, canvas_size) == canvas_scale and h * w >= (1 - max_padding) * height * width
+            for h, w in sizes
+        )
+
+    groups = []
+    # Largest first, so each group's canvas is set by its first image where possible
+    for index in sorted(range(len(images)), key=lambda i: images[i].shape[0] * images[i].shape[1], reverse=True):
+        size = images[index].shape[:2]
+        for group in groups:
+            height, width = max(group["height"], size[0]), max(group["width"], size[1])
+            if fits(group["sizes"] + [size], height, width):
+                group["indices"].append(index)
+                group["sizes"].append(size)
+                group["height"], group["width"] = height, width
+                break
+        else:
+            groups.append({"indices": [index], "sizes": [size], "height": size[0], "width": size[1]})
+    return [sorted(group["indices"]) for group in groups]
+
+# Small synthetic image with digits on it, used to warm every engine up
+def make_warmup_image():
+    import numpy as np
+    import cv2
+
+    img = np.full((64, 256, 3), 255, dtype=np.uint8)
+    cv2.putText(img, "1234", (20, 48), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 0), 3)
+    return img
+
+# Add the time spent in the block to timings[stage], if timings are collected
+@contextmanager
+def timed(timings, stage):
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start_time
+
+# Build a warm-up callable that runs one batch through the engine's own runner. Engines
+# spread over worker processes (inference_workers.py) warm every worker up instead
+def make_warm_up(run_batch):
+    def warm_up(engine):
+        if hasattr(engine, "warm_up"):
+            engine.warm_up()
+            return
+        run_batch(engine, [make_warmup_image()])
+    return warm_up
+
+
+# EasyOCR
+def load_easyocr():
+    import easyocr
+    return easyocr.Reader(EASYOCR_LANGUAGES, gpu=True)  # Enable GPU
+
+# Same steps as readtext/readtext_batched, with detection and recognition timed apart
+def run_easyocr_batch(reader, images, timings=None, allowlist=None):
+    # Only images of compatible sizes go through the detector together, so a result
+    # doesn't depend on which other images shared its batch
+    if len(images) > 1:
+        groups = size_groups(images)
+        if len(groups) > 1:
+            outputs = [None] * len(images)
+            for group in groups:
+                for index, result in zip(group, run_easyocr_batch(reader, [images[i] for i in group], timings, allowlist)):
+                    outputs[index] = result
+            return outputs
+
+    # Only passed when set, so the reader's own default applies otherwise
+    options = {"allowlist": allowlist} if allowlist else {}
+    if len(images) == 1:
+        with timed(timings, "detection"):
+            horizontal_list, free_list = reader.detect(images[0])
+        with timed(timings, "recognition"):
+            return [format_results(reader.recognize(images[0], horizontal_list[0], free_list[0], **options))]
+
+    import numpy as np
+    import cv2
+
+    # What easyocr.utils.reformat_input_batched does for BGR arrays
+    padded = pad_to_common_size(images)
+    batch = np.array(padded)
+    grey_batch = [cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) for img in padded]
+    with timed(timings, "detection"):
+        horizontal_lists, free_lists = reader.detect(batch, reformat=False)
+    with timed(timings, "recognition"):
+        return [
+            format_results(reader.recognize(grey, horizontal_list, free_list, reformat=False, **options))
+            for grey, horizontal_list, free_list in zip(grey_batch, horizontal_lists, free_lists)
+        ]
+
+
+# EasyOCR with its networks on ONNX Runtime, for CPU-only containers. The reader keeps
+# EasyOCR's interface, so run_easyocr_batch and recognize_easyocr serve it unchanged
+def load_easyocr_onnx():
+    from onnx_easyocr import load_onnx_reader
+    return load_onnx_reader(EASYOCR_LANGUAGES, quantize=ONNX_QUANTIZE)
+
+
+# Tesseract
+def load_tesseract():
+    from tesseract_pool import TesseractPool
+    # Long-lived worker processes, one per core, each with the language data loaded once
+    return TesseractPool(lang=TESSERACT_PARAMS["lang"], config=TESSERACT_PARAMS["config"])
+
+def run_tesseract_batch(tesseract_pool, images, timings=None, allowlist=None):
+    # The batch's images are spread over all worker processes
+    with timed(timings, "inference"):
+        batch_words = tesseract_pool.map_words(images, allowlist)
+    results = []
+    for words in batch_words:
+        results.append([
+            {"bounding_box": [[x1, y1], [x2, y1], [x2, y2], [x1, y2]], "text": text, "confidence": confidence / 100.0}
+            for text, confidence, (x1, y1, x2, y2) in words
+        ])
+    return results
+
+
+# keras-ocr
+def load_keras_ocr():
+    import keras_ocr
+    return keras_ocr.pipeline.Pipeline()
+
+def run_keras_ocr_batch(pipeline, images, timings=None, allowlist=None):
+    import cv2
+
+    # keras-ocr expects RGB; its pipeline pads the batch to a common size internally
+    rgb_images = [cv2.cvtColor(img, cv2.COLOR_BGR2RGB) for img in images]
+    with timed(timings, "inference"):
+        prediction_groups = pipeline.recognize(rgb_images)
+    return [
+        keep_allowed([{"bounding_box": [[int(x), int(y)] for x, y in box], "text": text} for text, box in predictions], allowlist)
+        for predictions in prediction_groups
+    ]
+
+
+# PaddleOCR
+def load_paddleocr():
+    from paddleocr import PaddleOCR
+    return PaddleOCR(**PADDLE_PARAMS)
+
+# paddle_reader.ocr returns one list of [box, (text, confidence)] lines per page in
+# paddleocr >= 2.6 (None for a page without text) and a flat list of lines before that
+def paddle_lines(results):
+    if not results:
+        return []
+    if results[0] is None:
+        return []
+    first = results[0]
+    if len(first) == 2 and isinstance(first[1], (list, tuple)) and isinstance(first[1][0], str):
+        return results
+    return [line for page in results if page for line in page]
+
+def run_paddleocr_batch(paddle_reader, images, timings=None, allowlist=None):
+    # PaddleOCR only accepts lists of images with detection disabled, so detect per image
+    results = []
+    for img in images:
+        with timed(timings, "inference"):
+            lines = paddle_lines(paddle_reader.ocr(img))
+        results.append(keep_allowed([
+            {"bounding_box": [[int(x), int(y)] for x, y in box], "text": text, "confidence": float(confidence)}
+            for box, (text, confidence) in lines
+        ], allowlist))
+    return results
+
+
+# Recognition only, on regions the caller already knows. Every recognize_* function
+# takes the loaded engine, one decoded BGR image and a list of 4-point boxes (clockwise
+# from the top-left corner, as in the results above) and returns one
+# {"bounding_box", "text", "confidence"} per box, in the order given. Detection is
+# skipped entirely; the time goes to timings["recognition"].
+
+# Crops per recognizer forward pass
+OCR_RECOGNIZE_BATCH_SIZE = int(os.environ.get("OCR_RECOGNIZE_BATCH_SIZE", 32))
+
+# Clip a box to the image and round it to whole pixels
+def clip_box(box, width, height):
+    return [[min(max(int(round(x)), 0), width), min(max(int(round(y)), 0), height)] for x, y in box]
+
+def box_extent(box):
+    xs, ys = [x for x, _ in box], [y for _, y in box]
+    return min(xs), min(ys), max(xs), max(ys)
+
+def is_axis_aligned(box):
+    x_min, y_min, x_max, y_max = box_extent(box)
+    return all(x in (x_min, x_max) and y in (y_min, y_max) for x, y in box)
+
+def is_empty_box(box):
+    x_min, y_min, x_max, y_max = box_extent(box)
+    return x_max - x_min < 1 or y_max - y_min < 1
+
+# Pixels of one region, rotated regions straightened out with a perspective warp
+def crop_region(img, box):
+    import numpy as np
+    import cv2
+
+    if is_axis_aligned(box):
+        x_min, y_min, x_max, y_max = box_extent(box)
+        return img[y_min:y_max, x_min:x_max]
+    corners = np.array(box, dtype=np.float32)
+    width = int(max(np.linalg.norm(corners[1] - corners[0]), np.linalg.norm(corners[2] - corners[3])))
+    height = int(max(np.linalg.norm(corners[3] - corners[0]), np.linalg.norm(corners[2] - corners[1])))
+    target = np.array([[0, 0], [width, 0], [width, height], [0, height]], dtype=np.float32)
+    return cv2.warpPerspective(img, cv2.getPerspectiveTransform(corners, target), (max(width, 1), max(height, 1)))
+
+# EasyOCR's recognizer on the regions, batched in one recognize call. Axis-aligned boxes
+# go in as its horizontal list, anything else as its free-form list. recognize sorts
+# its output by position, so results are matched back to the boxes by their corners
+def recognize_easyocr(reader, img, boxes, timings=None):
+    import cv2
+
+    height, width = img.shape[:2]
+    boxes = [clip_box(box, width, height) for box in boxes]
+    horizontal_list, free_list = [], []
+    for box in boxes:
+        if is_empty_box(box):
+            continue
+        if is_axis_aligned(box):
+            x_min, y_min, x_max, y_max = box_extent(box)
+            horizontal_list.append([x_min, x_max, y_min, y_max])
+        else:
+            free_list.append(box)
+
+    recognized = {}
+    if horizontal_list or free_list:
+        grey = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        with timed(timings, "recognition"):
+            results = reader.recognize(grey, horizontal_list, free_list, batch_size=OCR_RECOGNIZE_BATCH_SIZE, reformat=False)
+        recognized = {region_key(bbox): (text, float(confidence)) for bbox, text, confidence in results}
+
+    output = []
+    for box in boxes:
+        text, confidence = recognized.get(region_key(box), ("", 0.0))
+        output.append({"bounding_box": box, "text": text, "confidence": confidence})
+    return output
+
+def region_key(box):
+    box = [[int(round(x)), int(round(y))] for x, y in box]
+    if is_axis_aligned(box):
+        return box_extent(box)
+    return tuple(map(tuple, box))
+
+# Tesseract on each cropped region as a single text line, spread over the pool's workers
+def recognize_tesseract(tesseract_pool, img, boxes, timings=None):
+    height, width = img.shape[:2]
+    boxes = [clip_box(box, width, height) for box in boxes]
+    regions = [i for i, box in enumerate(boxes) if not is_empty_box(box)]
+    lines = {}
+    if regions:
+        with timed(timings, "recognition"):
+            results = tesseract_pool.map_lines([crop_region(img, boxes[i]) for i in regions])
+        lines = dict(zip(regions, results))
+
+    output = []
+    for i, box in enumerate(boxes):
+        text, confidence = lines.get(i, ("", 0.0))
+        output.append({"bounding_box": box, "text": text, "confidence": confidence / 100.0})
+    return output
+
+# Engines that can recognize caller-supplied regions without detecting them
+RECOGNIZERS = {
+    "easyocr": recognize_easyocr,
+    "easyocr_onnx": recognize_easyocr,
+    "tesseract": recognize_tesseract,
+}
+
+
+# name -> (loader, batch runner)
+ENGINES = {
+    "easyocr": (load_easyocr, run_easyocr_batch),
+    "easyocr_onnx": (load_easyocr_onnx, run_easyocr_batch),
+    "tesseract": (load_tesseract, run_tesseract_batch),
+    "keras_ocr": (load_keras_ocr, run_keras_ocr_batch),
+    "paddleocr": (load_paddleocr, run_paddleocr_batch),
+}
+
+# Libraries each engine's loader imports, timed as their own startup phase
+ENGINE_IMPORTS = {
+    "easyocr": ("torch", "easyocr"),
+    "easyocr_onnx": ("torch", "easyocr", "onnxruntime"),
+    "tesseract": ("tesseract_pool",),
+    "keras_ocr": ("tensorflow", "keras_ocr"),
+    "paddleocr": ("paddle", "paddleocr"),
+}
+
+# Engines whose loaders download weights (or export models) on first use; the service
+# image runs their loaders at build time so containers start with them on disk
+BAKED_ENGINES = ["easyocr", "easyocr_onnx", "keras_ocr", "paddleocr"]
+
+# Register the given engines (default: all of them) with an EngineRegistry, warmed up
+# after loading unless warm_up is False. engines replaces ENGINES' loaders and runners
+# (e.g. with inference_workers.with_inference_workers)
+def register_engines(registry, names=None, warm_up=True, engines=ENGINES):
+    for name in names or engines:
+        loader, run_batch = engines[name]
+        registry.register(
+            name, loader, warm_up=make_warm_up(run_batch) if warm_up else None, imports=ENGINE_IMPORTS.get(name, ())
+        )
+
+
+# Download (and export) the weights of the given engines (default: BAKED_ENGINES) into
+# their caches. Runs in the image build, where there is no GPU: EasyOCR falls back to
+# the CPU, which is enough to fetch its weights
+def bake_weights(names=None):
+    for name in names or BAKED_ENGINES:
+        start_time = time.perf_counter()
+        engine = ENGINES[name][0]()
+        if hasattr(engine, "close"):
+            engine.close()
+        print(f"Baked the weights of {name} in {time.perf_counter() - start_time:.2f}s")
@@ -0,0 +1,180 @@
+import os
+import copy
+import numpy as np
+
+# EasyOCR on ONNX Runtime, for CPU-only containers. The reader keeps all of EasyOCR's
+# pre- and post-processing; only its two networks, the CRAFT text detector and the
+# CRNN recognizer, are exported to ONNX once and then run by ONNX Runtime instead of
+# PyTorch eager mode. Optionally the exported networks get dynamic int8 quantization.
+#   OCR_ONNX_MODEL_DIR         where exported models are kept; missing ones are exported
+#                              when the engine loads
+#   OCR_ONNX_INTRA_OP_THREADS  threads one network call may use (default: every core);
+#                              lower it when several engines share the container
+OCR_ONNX_MODEL_DIR = os.environ.get("OCR_ONNX_MODEL_DIR", os.path.join(os.path.expanduser("~"), ".EasyOCR", "onnx"))
+OCR_ONNX_INTRA_OP_THREADS = int(os.environ.get("OCR_ONNX_INTRA_OP_THREADS", os.cpu_count() or 1))
+
+# Which networks are quantized to int8: the recognizer's LSTM and linear layers
+# quantize well, CRAFT's convolutions lose more box accuracy for less speed
+QUANTIZE_MODES = ("none", "recognizer", "all")
+
+OPSET_VERSION = 17
+
+# Height EasyOCR resizes every text crop to before recognition
+RECOGNIZER_HEIGHT = 64
+
+
+# Folder of the exported models, per EasyOCR version since its weights change with it
+def model_directory(model_dir=OCR_ONNX_MODEL_DIR):
+    import easyocr
+    return os.path.join(model_dir, f"easyocr-{getattr(easyocr, '__version__', 'unknown')}")
+
+
+def model_paths(languages, quantize, model_dir=OCR_ONNX_MODEL_DIR):
+    if quantize not in QUANTIZE_MODES:
+        raise ValueError(f"Unsupported quantization: {quantize}. Available modes are {list(QUANTIZE_MODES)}.")
+    directory = model_directory(model_dir)
+    recognizer = f"recognizer_{'_'.join(languages)}"
+    return {
+        "detector": os.path.join(directory, "craft.int8.onnx" if quantize == "all" else "craft.onnx"),
+        "recognizer": os.path.join(directory, f"{recognizer}.onnx" if quantize == "none" else f"{recognizer}.int8.onnx"),
+    }
+
+
+# The torch module behind a network EasyOCR may have wrapped in DataParallel
+def unwrap(network):
+    return getattr(network, "module", network)
+
+
+def export_detector(reader, path):
+    import torch
+
+    detector = unwrap(reader.detector).eval()
+    sample = torch.randn(1, 3, 640, 640)
+    with torch.no_grad():
+        torch.onnx.export(
+            detector, sample, path, opset_version=OPSET_VERSION,
+            input_names=["image"], output_names=["score_maps", "feature"],
+            dynamic_axes={
+                "image": {0: "batch", 2: "height", 3: "width"},
+                "score_maps": {0: "batch", 1: "map_height", 2: "map_width"},
+                "feature": {0: "batch", 2: "map_height", 3: "map_width"},
+            },
+        )
+
+
+def export_recognizer(reader, path):
+    import torch
+
+    # AdaptiveAvgPool2d((None, 1)) has no ONNX equivalent for a dynamic width; with an
+    # output size of 1 it is just the mean over the last axis
+    class MeanOverLastAxis(torch.nn.Module):
+        def forward(self, x):
+            return x.mean(dim=3, keepdim=True)
+
+    # EasyOCR's recognizer takes the (unused, for CTC) target text as a second input
+    class ImageOnly(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, image):
+            return self.model(image, None)
+
+    model = copy.deepcopy(unwrap(reader.recognizer)).eval()
+    model.AdaptiveAvgPool = MeanOverLastAxis()
+    sample = torch.randn(1, 1, RECOGNIZER_HEIGHT, 256)
+    with torch.no_grad():
+        torch.onnx.export(
+            ImageOnly(model), sample, path, opset_version=OPSET_VERSION,
+            input_names=["image"], output_names=["logits"],
+            dynamic_axes={"image": {0: "batch", 3: "width"}, "logits": {0: "batch", 1: "sequence"}},
+        )
+
+
+def quantize_model(path, output_path):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(path, output_path, weight_type=QuantType.QInt8)
+
+
+# Write a model through a temporary file, so a crash mid-export never leaves a
+# truncated model behind for the next load
+def write_atomically(path, write):
+    root, extension = os.path.splitext(path)
+    tmp_path = f"{root}.tmp{extension}"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+# Export (and quantize) whatever models `languages` and `quantize` need that aren't on
+# disk yet. `reader` is a PyTorch EasyOCR reader with float weights
+def export_models(reader, languages, quantize, model_dir=OCR_ONNX_MODEL_DIR):
+    paths = model_paths(languages, quantize, model_dir)
+    float_paths = model_paths(languages, "none", model_dir)
+    os.makedirs(os.path.dirname(paths["detector"]), exist_ok=True)
+    for network, export in (("detector", export_detector), ("recognizer", export_recognizer)):
+        if not os.path.exists(float_paths[network]):
+            print(f"Exporting the EasyOCR {network} to {float_paths[network]}")
+            write_atomically(float_paths[network], lambda path: export(reader, path))
+        if paths[network] != float_paths[network] and not os.path.exists(paths[network]):
+            print(f"Quantizing the EasyOCR {network} to {paths[network]}")
+            write_atomically(paths[network], lambda path: quantize_model(float_paths[network], path))
+    return paths
+
+
+# Stands in for one of the reader's torch networks: EasyOCR calls it with a torch
+# tensor and reads torch tensors back, so the session's numpy arrays are converted at
+# the boundary (without copies on CPU)
+class OnnxNetwork:
+    def __init__(self, path, intra_op_threads=OCR_ONNX_INTRA_OP_THREADS):
+        self.path = path
+        self.intra_op_threads = intra_op_threads
+        self.session = None
+
+    # Opened on the first call, in the process that runs the network: an inference
+    # worker pool (inference_workers.py) loads the engine in the API process and forks
+    # workers off it, and a session opened there first would be one more copy of the
+    # weights, with intra-op threads live at the fork. A session doesn't survive a
+    # fork either, so a forked process reopens one it inherited
+    def open(self):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # One network call at a time per session, spread over intra_op_threads cores;
+        # the service already runs one engine call at a time (ENGINE_CONCURRENCY)
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(self.path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.pid = os.getpid()
+
+    # EasyOCR calls these on its networks before inference
+    def eval(self):
+        return self
+
+    def to(self, device):
+        return self
+
+    def __call__(self, image, *args):
+        import torch
+
+        if self.session is None or self.pid != os.getpid():
+            self.open()
+        inputs = np.ascontiguousarray(image.detach().cpu().numpy(), dtype=np.float32)
+        outputs = [torch.from_numpy(output) for output in self.session.run(None, {self.input_name: inputs})]
+        return outputs[0] if len(outputs) == 1 else tuple(outputs)
+
+
+# An EasyOCR reader whose detector and recognizer run on ONNX Runtime, exporting the
+# models on first use
+def load_onnx_reader(languages, quantize="recognizer", model_dir=OCR_ONNX_MODEL_DIR, intra_op_threads=OCR_ONNX_INTRA_OP_THREADS):
+    import easyocr
+
+    # Float weights on CPU: EasyOCR would otherwise quantize them in PyTorch, and the
+    # export needs the originals
+    reader = easyocr.Reader(languages, gpu=False, quantize=False)
+    paths = export_models(reader, languages, quantize, model_dir)
+    reader.detector = OnnxNetwork(paths["detector"], intra_op_threads)
+    reader.recognizer = OnnxNetwork(paths["recognizer"], intra_op_threads)
+    return reader
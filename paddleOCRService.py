@@ -1,8 +1,16 @@
 import modal
 from fastapi import FastAPI, File, UploadFile, Body, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+import os
 import time
+import asyncio
 from typing import List
+from inference_executor import get_executor
+from image_io import read_upload, decode_image, RequestSizeLimitMiddleware
+from result_cache import OCRResultCache
+from engine_registry import EngineRegistry
+from metrics import StageMetrics, json_response
+from ocr_engines import PADDLE_PARAMS, paddle_lines, register_engines
 
 # Initialize Modal
 app = modal.App("paddle_ocr_service")
@@ -19,6 +27,8 @@ image = modal.Image.debian_slim().apt_install(
     "paddlepaddle",
     "paddleocr>=2.0.1",
     "albumentations"
+).add_local_python_source(
+    "inference_executor", "image_io", "result_cache", "engine_registry", "ocr_engines", "metrics"
 )
 
 # Create the FastAPI app and set up CORS
@@ -31,49 +41,81 @@ fastapi_app.add_middleware(
     allow_headers=["*"],
 )
 
-# Lazy load PaddleOCR within Modal container
-def load_paddle_ocr():
-    with image.imports():
-        from paddleocr import PaddleOCR
-        return PaddleOCR(use_angle_cls=True, lang='en')
+# PaddleOCR is loaded and warmed up once, then reused by every request
+registry = EngineRegistry()
+register_engines(registry, ["paddleocr"])
+
+# Load and warm up PaddleOCR before serving traffic
+@fastapi_app.on_event("startup")
+async def preload_paddle_ocr():
+    await asyncio.to_thread(registry.get, "paddleocr")
+
+# Load time, warm-up time and memory footprint of PaddleOCR
+@fastapi_app.get("/engines")
+async def engine_stats():
+    return registry.stats()
 
 # Set the maximum file size limit (100MB)
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100 MB
 
+# Cap on the whole multipart body, enforced while it streams in
+MAX_REQUEST_SIZE = int(os.environ.get("OCR_MAX_REQUEST_SIZE", 10 * MAX_FILE_SIZE))
+fastapi_app.add_middleware(RequestSizeLimitMiddleware, max_body_size=MAX_REQUEST_SIZE)
+
+# Paddle inference releases the GIL, so it runs on a bounded thread pool off the event
+# loop. Concurrent calls are set with OCR_PADDLEOCR_CONCURRENCY (default 1)
+paddle_executor = get_executor("paddleocr", kind="thread", default_concurrency=1)
+
+# Results cached by image content, so resubmitted images skip inference
+ocr_cache = OCRResultCache()
+
+# Hit/miss/eviction counters of the result cache
+@fastapi_app.get("/cache")
+async def cache_stats():
+    return ocr_cache.stats()
+
+# Per-stage latency histograms, exported at GET /metrics
+stage_metrics = StageMetrics("paddle_ocr_service")
+
+# Per-stage latency histograms and p50/p95/p99 in the Prometheus text format
+@fastapi_app.get("/metrics")
+async def metrics():
+    return stage_metrics.response()
+
 @fastapi_app.post("/ocr")
 async def perform_paddleocr(
     files: List[UploadFile] = File(..., description="List of files to process"),
-    logging_enabled: bool = Body(False, embed=True)
+    logging_enabled: bool = Body(False, embed=True),
+    include_timings: bool = Body(False, embed=True)
 ):
+    request_start = time.perf_counter()
     try:
-        # Lazy load PaddleOCR only when this endpoint is called
-        paddle_reader = load_paddle_ocr()
         results_with_benchmark = []
 
         for file in files:
-            file_path = f"/tmp/{file.filename}"
-            content = await file.read()
-
-            if len(content) > MAX_FILE_SIZE:
-                raise HTTPException(status_code=413, detail=f"File size of {file.filename} exceeds maximum limit of 100MB.")
-            
-            with open(file_path, "wb") as f:
-                f.write(content)
-
-            # Start benchmark timer
-            start_time = time.time()
-            result = process_image_with_paddleocr(paddle_reader, file_path)
+            timer = stage_metrics.timer()
+            with timer.stage("upload_read"):
+                # Read the upload into memory in chunks, enforcing the size limit as bytes arrive
+                content = await read_upload(file, MAX_FILE_SIZE)
+
+            # Start benchmark timer (monotonic, unaffected by clock adjustments)
+            start_time = time.perf_counter()
+            result = await cached_paddleocr(content, file.filename, timer)
             # End benchmark timer
-            end_time = time.time()
-            processing_time = end_time - start_time
+            processing_time = time.perf_counter() - start_time
 
-            results_with_benchmark.append({
+            file_result = {
                 "file_name": file.filename,
                 "processing_time_seconds": processing_time,
                 "ocr_results": result
-            })
-        
-        return results_with_benchmark
+            }
+            if include_timings:
+                file_result["stage_seconds"] = timer.breakdown()
+            results_with_benchmark.append(file_result)
+
+        response = json_response(stage_metrics, results_with_benchmark)
+        stage_metrics.observe("request", time.perf_counter() - request_start)
+        return response
     
     except HTTPException as e:
         raise e
@@ -82,11 +124,24 @@ async def perform_paddleocr(
         print(error_message)
         return {"detail": error_message}
 
-# Process image with PaddleOCR
-def process_image_with_paddleocr(paddle_reader, image_path):
+async def cached_paddleocr(content, file_name, timer):
+    async def run_ocr():
+        # Decode straight from the upload buffer, off the event loop
+        with timer.stage("decode"):
+            img = await asyncio.to_thread(decode_image, content, file_name)
+        with timer.stage("inference"):
+            return await paddle_executor.run(process_image_with_paddleocr, img)
+
+    # Identical images (resubmitted or arriving together) share one inference
+    cache_key = await asyncio.to_thread(OCRResultCache.make_key, content, "paddleocr", PADDLE_PARAMS)
+    return await ocr_cache.get_or_compute(cache_key, run_ocr)
 
-    results = paddle_reader.ocr(image_path)
-    formatted_results = [{"text": line[1][0], "bounding_box": line[0]} for line in results]
+# Process image with PaddleOCR. The reader is loaded at startup; this only blocks if it
+# was unloaded since
+def process_image_with_paddleocr(img):
+    with registry.use("paddleocr") as paddle_reader:
+        results = paddle_reader.ocr(img)
+    formatted_results = [{"text": line[1][0], "bounding_box": line[0]} for line in paddle_lines(results)]
     return formatted_results
 
 # Use modal.asgi_app to deploy FastAPI app with Modal and request a GPU
@@ -0,0 +1,200 @@
+import os
+import json
+import gzip
+import time
+import importlib.util
+import numpy as np
+from fastapi import Response
+
+# Response encodings of /ocr, chosen by the client:
+#   Accept: application/json (default)      the usual list of per-file results
+#   Accept: application/msgpack              MessagePack, columnar: per result list one
+#                                            packed int32 array of box corners, the texts
+#                                            as one UTF-8 blob plus int32 offsets, and
+#                                            float32 confidences
+#   Accept-Encoding: zstd / gzip             compression of either, for bodies of at
+#                                            least OCR_COMPRESS_MIN_BYTES
+OCR_COMPRESS_MIN_BYTES = int(os.environ.get("OCR_COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.environ.get("OCR_GZIP_LEVEL", 5))
+ZSTD_LEVEL = int(os.environ.get("OCR_ZSTD_LEVEL", 3))
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+MEDIA_TYPES = {
+    JSON: JSON,
+    MSGPACK: MSGPACK,
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+}
+
+# Version tag of the columnar layout, sent in every msgpack body
+COLUMNAR_FORMAT = "ocr-columnar/1"
+RESULT_KEYS = ("bounding_box", "text", "confidence")
+
+
+# Whether a package is installed, without paying for its import at startup
+def has_module(name):
+    return importlib.util.find_spec(name) is not None
+
+
+# Encodings this process can produce; msgpack and zstandard are optional packages
+AVAILABLE_MEDIA_TYPES = {JSON} | ({MSGPACK} if has_module("msgpack") else set())
+AVAILABLE_ENCODINGS = (["zstd"] if has_module("zstandard") else []) + ["gzip"]
+
+
+# (value, q) pairs of an Accept / Accept-Encoding header, highest preference first
+def parse_header(header):
+    entries = []
+    for position, part in enumerate((header or "").split(",")):
+        value, *params = [item.strip() for item in part.split(";")]
+        if not value:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        entries.append((value.lower(), q, position))
+    return [(value, q) for value, q, _ in sorted(entries, key=lambda entry: (-entry[1], entry[2])) if q > 0]
+
+
+# Media type to answer with: the client's most preferred one we can produce, else JSON
+def negotiate_media_type(accept):
+    for value, _ in parse_header(accept):
+        media_type = MEDIA_TYPES.get(value)
+        if media_type in AVAILABLE_MEDIA_TYPES:
+            return media_type
+        if value in ("*/*", "application/*"):
+            return JSON
+    return JSON
+
+
+def negotiate_encoding(accept_encoding):
+    accepted = parse_header(accept_encoding)
+    for value, _ in accepted:
+        if value in AVAILABLE_ENCODINGS:
+            return value
+        if value == "*":
+            return AVAILABLE_ENCODINGS[0]
+    return None
+
+
+# One list of result dicts as columns. Returns None when the boxes don't all have four
+# corners, in which case the list is sent as-is
+def pack_results(results):
+    if any(len(result.get("bounding_box", ())) != 4 for result in results):
+        return None
+    texts = [result["text"].encode("utf-8") for result in results]
+    offsets = np.zeros(len(texts) + 1, dtype="<i4")
+    np.cumsum([len(text) for text in texts], out=offsets[1:])
+    columns = {
+        "count": len(results),
+        "boxes": np.array([result["bounding_box"] for result in results], dtype="<i4").reshape(-1, 8).tobytes(),
+        "text": b"".join(texts),
+        "text_offsets": offsets.tobytes(),
+    }
+    if results and all("confidence" in result for result in results):
+        columns["confidences"] = np.array([result["confidence"] for result in results], dtype="<f4").tobytes()
+    # Anything else engines attach to a result, one list per key
+    extra_keys = sorted({key for result in results for key in result} - set(RESULT_KEYS))
+    if extra_keys:
+        columns["extra"] = {key: [result.get(key) for result in results] for key in extra_keys}
+    return columns
+
+
+# Columnar copy of a file (or video frame) result: its ocr_results list is packed, or,
+# for a video, the ocr_results of each frame
+def pack_file_result(file_result):
+    results = file_result.get("ocr_results")
+    if not isinstance(results, list):
+        return file_result
+    packed = dict(file_result)
+    if results and all(isinstance(item, dict) and "ocr_results" in item for item in results):
+        packed["ocr_results"] = [pack_file_result(frame) for frame in results]
+        return packed
+    columns = pack_results(results)
+    if columns is not None:
+        packed["ocr_results"] = columns
+    return packed
+
+
+# Inverse of pack_results, for clients: columns back to a list of result dicts
+def unpack_results(columns):
+    if not isinstance(columns, dict) or "boxes" not in columns:
+        return columns
+    boxes = np.frombuffer(columns["boxes"], dtype="<i4").reshape(-1, 4, 2).tolist()
+    offsets = np.frombuffer(columns["text_offsets"], dtype="<i4").tolist()
+    text = columns["text"]
+    confidences = np.frombuffer(columns["confidences"], dtype="<f4").tolist() if "confidences" in columns else None
+    results = []
+    for i, box in enumerate(boxes):
+        result = {"bounding_box": box, "text": text[offsets[i]:offsets[i + 1]].decode("utf-8")}
+        if confidences is not None:
+            result["confidence"] = confidences[i]
+        for key, values in columns.get("extra", {}).items():
+            result[key] = values[i]
+        results.append(result)
+    return results
+
+
+def unpack_file_result(file_result):
+    results = file_result.get("ocr_results")
+    unpacked = dict(file_result)
+    if isinstance(results, list):
+        unpacked["ocr_results"] = [unpack_file_result(frame) if isinstance(frame, dict) and "ocr_results" in frame else frame for frame in results]
+    else:
+        unpacked["ocr_results"] = unpack_results(results)
+    return unpacked
+
+
+def encode_body(content, media_type):
+    if media_type == MSGPACK:
+        import msgpack
+        return msgpack.packb({"format": COLUMNAR_FORMAT, "files": [pack_file_result(file_result) for file_result in content]})
+    return json.dumps(content).encode("utf-8")
+
+
+# Decode a response body of any media type (after HTTP decompression) into the JSON layout
+def decode_body(body, media_type):
+    if media_type == MSGPACK:
+        import msgpack
+        return [unpack_file_result(file_result) for file_result in msgpack.unpackb(body)["files"]]
+    return json.loads(body)
+
+
+def compress(body, encoding):
+    if encoding == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+def decompress(body, encoding):
+    if encoding == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    if encoding == "gzip":
+        return gzip.decompress(body)
+    return body
+
+
+# Response in the format the request's Accept / Accept-Encoding headers ask for, timing
+# the "serialization" and "compression" stages
+def negotiated_response(metrics, content, request):
+    media_type = negotiate_media_type(request.headers.get("accept"))
+    start_time = time.perf_counter()
+    body = encode_body(content, media_type)
+    metrics.observe("serialization", time.perf_counter() - start_time)
+
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if encoding is not None and len(body) >= OCR_COMPRESS_MIN_BYTES:
+        start_time = time.perf_counter()
+        body = compress(body, encoding)
+        metrics.observe("compression", time.perf_counter() - start_time)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
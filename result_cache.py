@@ -0,0 +1,139 @@
+import os
+import json
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+# Cache settings shared by all services:
+#   OCR_CACHE_MAX_ENTRIES  size of the in-memory LRU tier (0 disables caching)
+#   OCR_CACHE_DIR          directory for the on-disk tier; unset keeps the cache memory-only
+OCR_CACHE_MAX_ENTRIES = int(os.environ.get("OCR_CACHE_MAX_ENTRIES", 1024))
+OCR_CACHE_DIR = os.environ.get("OCR_CACHE_DIR")
+
+
+# Content-addressed cache of OCR results. Keys are a hash of the image bytes plus the
+# engine name and its parameters, so the same image run through a different engine or
+# setting is a different entry. Values must be JSON-serializable (they are the
+# formatted results the services return).
+class OCRResultCache:
+    def __init__(self, max_entries=OCR_CACHE_MAX_ENTRIES, disk_dir=OCR_CACHE_DIR):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._memory = OrderedDict()
+        # Computations in progress, so identical concurrent images share one inference
+        self._in_flight = {}
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(content, engine_name, params=None):
+        digest = hashlib.sha256(content).hexdigest()
+        params_json = json.dumps(params or {}, sort_keys=True, separators=(",", ":"))
+        params_digest = hashlib.sha256(f"{engine_name}:{params_json}".encode()).hexdigest()[:16]
+        return f"{digest}-{params_digest}"
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key):
+        try:
+            with open(self._disk_path(key), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_disk(self, key, value):
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a crash never leaves a half-written entry behind
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, key):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return self._memory[key]
+
+        if self.disk_dir:
+            value = await asyncio.to_thread(self._read_disk, key)
+            if value is not None:
+                self.disk_hits += 1
+                self._remember(key, value)
+                return value
+
+        return None
+
+    async def put(self, key, value):
+        self._remember(key, value)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, value)
+
+    # Return the cached value for key, or run compute() once and cache its result.
+    # Concurrent callers with the same key share that one computation. It runs as its
+    # own task, so a caller disconnecting doesn't cancel it for the others.
+    async def get_or_compute(self, key, compute):
+        if not self.enabled:
+            return await compute()
+
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        task = self._in_flight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.get_running_loop().create_task(self._compute_and_store(key, compute))
+            task.add_done_callback(_consume_exception)
+            self._in_flight[key] = task
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _compute_and_store(self, key, compute):
+        try:
+            value = await compute()
+            await self.put(key, value)
+            return value
+        finally:
+            del self._in_flight[key]
+
+    def stats(self):
+        return {
+            "entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "disk_tier": self.disk_dir,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "in_flight": len(self._in_flight),
+        }
+
+
+# Errors are re-raised to every waiting caller; this only keeps asyncio from logging
+# "exception was never retrieved" when all of them have gone away
+def _consume_exception(task):
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,91 @@
+import re
+from fastapi import HTTPException
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+# Longest accepted text_pattern; patterns run on every result, so keep them small
+MAX_PATTERN_LENGTH = 256
+
+
+# Reject patterns that can backtrack catastrophically, like (1+)+x: a pattern runs on
+# the event loop, and re holds the GIL while matching, so one slow match stalls every
+# connection. Inside a group repeated a variable number of times, only fixed-count
+# repeats (\d{3}) are allowed, not variable ones (+, *, ?, {1,3}) or alternation.
+# Backreferences are rejected anywhere
+def check_pattern_complexity(parsed, in_repeat=False):
+    for op, av in parsed:
+        op = str(op)
+        if op in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT"):
+            low, high, subpattern = av
+            variable = low != high
+            if variable and in_repeat:
+                raise ValueError("nested variable repeats")
+            check_pattern_complexity(subpattern, in_repeat or (variable and high > 1))
+        elif op == "BRANCH":
+            if in_repeat:
+                raise ValueError("alternation inside a repeated group")
+            for branch in av[1]:
+                check_pattern_complexity(branch, in_repeat)
+        elif op == "SUBPATTERN":
+            check_pattern_complexity(av[-1], in_repeat)
+        elif op in ("ASSERT", "ASSERT_NOT"):
+            check_pattern_complexity(av[1], in_repeat)
+        elif op == "ATOMIC_GROUP":
+            check_pattern_complexity(av, in_repeat)
+        elif op in ("GROUPREF", "GROUPREF_EXISTS", "GROUPREF_IGNORE", "GROUPREF_LOC_IGNORE", "GROUPREF_UNI_IGNORE"):
+            raise ValueError("backreferences")
+
+
+# Per-request narrowing of OCR results, for domain-specific jobs like reading bib
+# numbers. The allowlist is handed to the engine itself (EasyOCR's allowlist,
+# Tesseract's tessedit_char_whitelist), so the recognizer never produces other
+# characters; text_pattern (a regex the whole text must match) and min_confidence
+# drop results before they are serialized.
+class ResultFilter:
+    def __init__(self, allowlist=None, text_pattern=None, min_confidence=0.0):
+        self.allowlist = "".join(sorted(set(allowlist))) if allowlist else None
+        self.text_pattern = text_pattern or None
+        self.min_confidence = min_confidence or 0.0
+        self._pattern = None
+        if self.text_pattern is not None:
+            if len(self.text_pattern) > MAX_PATTERN_LENGTH:
+                raise HTTPException(status_code=400, detail=f"text_pattern is longer than {MAX_PATTERN_LENGTH} characters.")
+            try:
+                self._pattern = re.compile(self.text_pattern)
+            except re.error as e:
+                raise HTTPException(status_code=400, detail=f"Invalid text_pattern: {e}")
+            try:
+                check_pattern_complexity(sre_parse.parse(self.text_pattern))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"text_pattern is too expensive to match ({e}).")
+        if not 0.0 <= self.min_confidence <= 1.0:
+            raise HTTPException(status_code=400, detail="min_confidence must be between 0 and 1.")
+
+    # Rebuild a filter saved with to_params (e.g. in a job's parameters)
+    @classmethod
+    def from_params(cls, params):
+        return cls(**params) if params else None
+
+    def to_params(self):
+        return {"allowlist": self.allowlist, "text_pattern": self.text_pattern, "min_confidence": self.min_confidence}
+
+    # Results without a confidence (keras-ocr reports none) pass the min_confidence check
+    def keep(self, result):
+        if result.get("confidence", 1.0) < self.min_confidence:
+            return False
+        if self._pattern is not None and not self._pattern.fullmatch(result["text"]):
+            return False
+        return True
+
+    def apply(self, results):
+        return [result for result in results if self.keep(result)]
+
+
+# Allowlist of the filter, or None without one
+def allowlist_of(result_filter):
+    return result_filter.allowlist if result_filter is not None else None
+
+def apply_filter(result_filter, results):
+    return result_filter.apply(results) if result_filter is not None else results
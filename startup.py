@@ -0,0 +1,81 @@
+import os
+import asyncio
+
+# Startup settings:
+#   OCR_PRELOAD_IN_BACKGROUND  start serving right away and load the preloaded engines in
+#                              the background; /ready answers 503 until they are warm.
+#                              For platforms that route by readiness probe. Modal waits
+#                              for startup to finish, so the default loads before serving
+#   OCR_WARM_UP                run one inference on every engine right after loading it
+OCR_PRELOAD_IN_BACKGROUND = os.environ.get("OCR_PRELOAD_IN_BACKGROUND", "0") == "1"
+OCR_WARM_UP = os.environ.get("OCR_WARM_UP", "1") != "0"
+
+
+# Seconds since this process was started, from /proc where available; covers the
+# interpreter itself and every import before the caller
+def process_age_seconds():
+    try:
+        with open("/proc/self/stat") as f:
+            # Field 22 is the start time in clock ticks after boot; the command name
+            # (field 2) may contain spaces, so count from its closing parenthesis
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# Phases of a container's startup, from process start to the first request it can serve
+# warm: "imports" (interpreter and service modules), then per preloaded engine its
+# library imports, weight load and warm-up inference. Reported by GET /ready
+class StartupTimeline:
+    def __init__(self):
+        self.phases = {}
+        self.ready = False
+        self.error = None
+        self.ready_after_seconds = None
+        self._task = None
+
+    def record(self, phase, seconds):
+        if seconds is not None:
+            self.phases[phase] = seconds
+
+    # The preloaded engines' phases, as the registry measured them
+    def record_engine(self, name, engine_stats):
+        self.record(f"{name}.import", engine_stats.get("import_time_seconds"))
+        self.record(f"{name}.weight_load", engine_stats.get("load_time_seconds"))
+        self.record(f"{name}.warm_up", engine_stats.get("warmup_time_seconds"))
+
+    # Run the startup coroutine now, or in the background with OCR_PRELOAD_IN_BACKGROUND.
+    # In the foreground a failure fails the container's startup as before
+    async def run(self, startup, in_background=OCR_PRELOAD_IN_BACKGROUND):
+        if not in_background:
+            await startup()
+            self.mark_ready()
+            return
+        self._task = asyncio.create_task(self._run_in_background(startup))
+
+    async def _run_in_background(self, startup):
+        try:
+            await startup()
+        except Exception as e:
+            # The server keeps running, so report the failure on /ready
+            self.error = f"{type(e).__name__}: {e}"
+            print(f"Startup failed: {self.error}")
+            return
+        self.mark_ready()
+
+    def mark_ready(self):
+        self.ready = True
+        self.ready_after_seconds = process_age_seconds()
+        phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.phases.items())
+        print(f"Ready after {self.ready_after_seconds or 0:.2f}s ({phases})")
+
+    def report(self):
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "ready_after_seconds": self.ready_after_seconds,
+            "phases": self.phases,
+        }
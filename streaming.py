@@ -0,0 +1,60 @@
+import json
+import asyncio
+from fastapi.responses import StreamingResponse
+
+# Streaming formats accepted by the stream form field of /ocr
+STREAM_MODES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+_DONE = object()
+
+
+# Run several async generators at once and yield their items in completion order,
+# so one slow file never holds back results that are already finished
+async def merge_streams(generators):
+    queue = asyncio.Queue()
+
+    async def drain(generator):
+        try:
+            async for item in generator:
+                await queue.put(item)
+        finally:
+            await queue.put(_DONE)
+
+    tasks = [asyncio.ensure_future(drain(generator)) for generator in generators]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            item = await queue.get()
+            if item is _DONE:
+                remaining -= 1
+                continue
+            yield item
+    finally:
+        # The client went away or the stream finished: stop any work still running
+        for task in tasks:
+            task.cancel()
+        # Re-raise a producer's failure; per-item errors should be yielded as events
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+
+def format_ndjson(event):
+    return json.dumps(event) + "\n"
+
+def format_sse(event, event_name="result"):
+    return f"event: {event_name}\ndata: {json.dumps(event)}\n\n"
+
+# Wrap a stream of JSON-serializable events into a StreamingResponse in the given mode
+def streaming_response(events, mode):
+    async def body():
+        async for event in events:
+            yield format_sse(event) if mode == "sse" else format_ndjson(event)
+        if mode == "sse":
+            yield format_sse({}, event_name="done")
+
+    # X-Accel-Buffering stops nginx-style proxies from holding the stream back
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(body(), media_type=STREAM_MODES[mode], headers=headers)
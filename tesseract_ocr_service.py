@@ -1,20 +1,25 @@
 import modal
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, Body, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-import pytesseract
-import cv2
 import os
+import time
+import asyncio
 from typing import List
+from image_io import read_upload, check_image_size, RequestSizeLimitMiddleware
+from result_cache import OCRResultCache
+from tesseract_pool import TesseractPool, TESSERACT_WORKERS
+from metrics import StageMetrics, json_response
 
 # Initialize Modal
 app = modal.App("tesseract_ocr_service")
 
-# Define the container image with Tesseract and OpenCV
+# Define the container image with Tesseract and OpenCV. tesserocr binds libtesseract
+# directly, so each worker keeps its language data loaded between images
 image = modal.Image.debian_slim().apt_install(
-    "tesseract-ocr", "libtesseract-dev"
+    "tesseract-ocr", "libtesseract-dev", "libleptonica-dev", "pkg-config", "g++"
 ).pip_install(
-    "fastapi", "pytesseract", "uvicorn", "opencv-python-headless"
-)
+    "fastapi", "pytesseract", "tesserocr", "uvicorn", "opencv-python-headless"
+).add_local_python_source("image_io", "result_cache", "tesseract_pool", "metrics")
 
 # Create FastAPI app
 fastapi_app = FastAPI()
@@ -31,51 +36,95 @@ fastapi_app.add_middleware(
 # Maximum file size for upload
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100 MB
 
+# Cap on the whole multipart body, enforced while it streams in
+MAX_REQUEST_SIZE = int(os.environ.get("OCR_MAX_REQUEST_SIZE", 10 * MAX_FILE_SIZE))
+fastapi_app.add_middleware(RequestSizeLimitMiddleware, max_body_size=MAX_REQUEST_SIZE)
+
+# Tesseract settings that change the output; they are part of the result cache key
+TESSERACT_PARAMS = {"lang": "eng", "config": ""}
+
+# OCR runs off the event loop on a pool of long-lived worker processes, one per core
+# (OCR_TESSERACT_WORKERS), each with its language data loaded once
+tesseract_pool = None
+
+@fastapi_app.on_event("startup")
+async def start_tesseract_pool():
+    global tesseract_pool
+    tesseract_pool = await asyncio.to_thread(
+        TesseractPool, TESSERACT_WORKERS, TESSERACT_PARAMS["lang"], TESSERACT_PARAMS["config"]
+    )
+
+@fastapi_app.on_event("shutdown")
+async def stop_tesseract_pool():
+    if tesseract_pool is not None:
+        tesseract_pool.close()
+
+# Results cached by image content, so resubmitted images skip inference
+ocr_cache = OCRResultCache()
+
+# Hit/miss/eviction counters of the result cache
+@fastapi_app.get("/cache")
+async def cache_stats():
+    return ocr_cache.stats()
+
+# Per-stage latency histograms, exported at GET /metrics
+stage_metrics = StageMetrics("tesseract_ocr_service")
+
+# Per-stage latency histograms and p50/p95/p99 in the Prometheus text format
+@fastapi_app.get("/metrics")
+async def metrics():
+    return stage_metrics.response()
+
 @fastapi_app.post("/ocr")
 async def perform_tesseract_ocr(
-    files: List[UploadFile] = File(..., description="List of files to process")
+    files: List[UploadFile] = File(..., description="List of files to process"),
+    include_timings: bool = Body(False, embed=True)
 ):
+    request_start = time.perf_counter()
     try:
-        results_with_benchmark = []
+        uploads = []
         for file in files:
-            # Save uploaded file locally
-            file_path = f"/tmp/{file.filename}"
+            timer = stage_metrics.timer()
+            with timer.stage("upload_read"):
+                # Read the upload into memory in chunks, enforcing the size limit as bytes arrive
+                content = await read_upload(file, MAX_FILE_SIZE)
 
-            # Check file size before saving
-            content = await file.read()
-            if len(content) > MAX_FILE_SIZE:
-                raise HTTPException(status_code=413, detail=f"File size of {file.filename} exceeds 100MB.")
+                # Reject decompression bombs from the header before a worker decodes them
+                check_image_size(content, file.filename)
+            uploads.append((file.filename, content, timer))
 
-            with open(file_path, "wb") as f:
-                f.write(content)
+        # Start OCR with Tesseract, the request's files spread over all workers. The
+        # encoded bytes are sent to the workers, far less to pickle than decoded pixels
+        ocr_texts = await asyncio.gather(*[
+            cached_tesseract_ocr(content, timer) for _, content, timer in uploads
+        ])
 
-            # Start OCR with Tesseract
-            ocr_text = run_tesseract_ocr(file_path)
-
-            # Append result for each file
-            results_with_benchmark.append({
-                "file_name": file.filename,
-                "ocr_text": ocr_text
-            })
+        # Append result for each file
+        results_with_benchmark = []
+        for (file_name, _, timer), ocr_text in zip(uploads, ocr_texts):
+            file_result = {"file_name": file_name, "ocr_text": ocr_text}
+            if include_timings:
+                file_result["stage_seconds"] = timer.breakdown()
+            results_with_benchmark.append(file_result)
 
-        return results_with_benchmark
+        response = json_response(stage_metrics, results_with_benchmark)
+        stage_metrics.observe("request", time.perf_counter() - request_start)
+        return response
 
     except HTTPException as e:
         raise e
     except Exception as e:
         return {"detail": f"Error during OCR processing: {str(e)}"}
 
-def run_tesseract_ocr(image_path: str) -> str:
-    """
-    Run Tesseract OCR on the given image and return the extracted text.
-    """
-    img = cv2.imread(image_path)
-    if img is None:
-        raise ValueError(f"Failed to read the image {image_path}.")
-    
-    # Perform OCR using Tesseract
-    ocr_text = pytesseract.image_to_string(img)
-    return ocr_text
+async def cached_tesseract_ocr(content, timer):
+    # Decoding happens in the worker, so it is part of the inference stage
+    async def run_ocr():
+        with timer.stage("inference"):
+            return await tesseract_pool.text(content)
+
+    # Identical images (resubmitted or arriving together) share one OCR run
+    cache_key = await asyncio.to_thread(OCRResultCache.make_key, content, "tesseract", TESSERACT_PARAMS)
+    return await ocr_cache.get_or_compute(cache_key, run_ocr)
 
 # Use modal.asgi_app to deploy FastAPI app with Modal
 @app.function(image=image)
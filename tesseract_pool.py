@@ -0,0 +1,181 @@
+import os
+import shlex
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# One long-lived worker per core by default (OCR_TESSERACT_WORKERS overrides it)
+TESSERACT_WORKERS = int(os.environ.get("OCR_TESSERACT_WORKERS", os.cpu_count() or 1))
+
+# State of a worker process, set once by init_worker
+_api = None
+_lang = "eng"
+_config = ""
+_whitelist = ""
+
+
+# Runs in every worker process when it starts. With tesserocr installed, the language
+# data is loaded here once into a PyTessBaseAPI that serves every later image; without
+# it we fall back to pytesseract, which starts the tesseract CLI for each call.
+def init_worker(lang, config):
+    global _api, _lang, _config, _whitelist
+    # Each worker gets exactly one core's worth of threads: N workers x OpenMP threads
+    # per worker would oversubscribe the CPU and scale worse than single-threaded workers
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    _lang = lang
+    _config = config
+    try:
+        import tesserocr
+    except ImportError:
+        _api = None
+        return
+
+    psm, variables = parse_config(config)
+    _whitelist = variables.get("tessedit_char_whitelist", "")
+    _api = tesserocr.PyTessBaseAPI(lang=lang)
+    if psm is not None:
+        _api.SetPageSegMode(psm)
+    for name, value in variables.items():
+        _api.SetVariable(name, value)
+
+# Translate the pytesseract-style config string ("--psm 6 -c name=value") into a page
+# segmentation mode and tesseract variables for tesserocr
+def parse_config(config):
+    psm = None
+    variables = {}
+    tokens = config.split()
+    i = 0
+    while i < len(tokens):
+        if tokens[i] == "--psm" and i + 1 < len(tokens):
+            psm = int(tokens[i + 1])
+            i += 2
+        elif tokens[i] == "-c" and i + 1 < len(tokens) and "=" in tokens[i + 1]:
+            name, value = tokens[i + 1].split("=", 1)
+            variables[name] = value
+            i += 2
+        else:
+            i += 1
+    return psm, variables
+
+# Accept encoded image bytes or a decoded BGR array; tesseract only needs grayscale
+def to_gray(image):
+    import numpy as np
+    import cv2
+
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        gray = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise ValueError("Failed to decode the image.")
+        return gray
+    if image.ndim == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+def _set_image(gray):
+    height, width = gray.shape
+    _api.SetImageBytes(gray.tobytes(), width, height, 1, width)
+
+# Worker task: plain text of one image
+def ocr_text(image):
+    gray = to_gray(image)
+    if _api is None:
+        import pytesseract
+        return pytesseract.image_to_string(gray, lang=_lang, config=_config)
+    _set_image(gray)
+    return _api.GetUTF8Text()
+
+# Worker task: words of one image with boxes and confidence (0-100). An allowlist
+# limits the characters tesseract may recognize for this image only
+def ocr_words(image, allowlist=None):
+    gray = to_gray(image)
+    words = []
+    if _api is None:
+        import pytesseract
+        config = f"{_config} -c {shlex.quote(f'tessedit_char_whitelist={allowlist}')}" if allowlist else _config
+        data = pytesseract.image_to_data(gray, lang=_lang, config=config, output_type=pytesseract.Output.DICT)
+        for text, conf, left, top, width, height in zip(
+            data["text"], data["conf"], data["left"], data["top"], data["width"], data["height"]
+        ):
+            if text.strip() and float(conf) >= 0:
+                words.append((text, float(conf), (left, top, left + width, top + height)))
+        return words
+
+    from tesserocr import RIL, iterate_level
+    if allowlist:
+        _api.SetVariable("tessedit_char_whitelist", allowlist)
+    try:
+        _set_image(gray)
+        _api.Recognize()
+        for word in iterate_level(_api.GetIterator(), RIL.WORD):
+            text = word.GetUTF8Text(RIL.WORD)
+            if text and text.strip():
+                words.append((text, word.Confidence(RIL.WORD), word.BoundingBox(RIL.WORD)))
+    finally:
+        if allowlist:
+            _api.SetVariable("tessedit_char_whitelist", _whitelist)
+    return words
+
+# Worker task: one line of text cropped from a larger image, as (text, confidence 0-100).
+# Tesseract reads the crop as a single text line (page segmentation mode 7) instead of
+# looking for a page layout in it
+def ocr_line(image):
+    gray = to_gray(image)
+    if _api is None:
+        import pytesseract
+        data = pytesseract.image_to_data(gray, lang=_lang, config=f"{_config} --psm 7", output_type=pytesseract.Output.DICT)
+        words = [(text, float(conf)) for text, conf in zip(data["text"], data["conf"]) if text.strip() and float(conf) >= 0]
+        if not words:
+            return "", 0.0
+        return " ".join(text for text, _ in words), sum(conf for _, conf in words) / len(words)
+
+    from tesserocr import PSM
+    page_seg_mode = _api.GetPageSegMode()
+    _api.SetPageSegMode(PSM.SINGLE_LINE)
+    try:
+        _set_image(gray)
+        text = _api.GetUTF8Text().strip()
+        return text, float(_api.MeanTextConf()) if text else 0.0
+    finally:
+        _api.SetPageSegMode(page_seg_mode)
+
+def _ready(_):
+    return os.getpid()
+
+
+# Pool of long-lived tesseract worker processes. Images are handed over in memory
+# (encoded bytes or arrays); a request's files are spread over all workers.
+class TesseractPool:
+    def __init__(self, workers=TESSERACT_WORKERS, lang="eng", config=""):
+        self.workers = workers
+        # spawn rather than fork: the parent may hold threads and GPU state that must
+        # not be copied into the workers
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(lang, config),
+        )
+        # Start every worker (and load its language data) now instead of on the
+        # first request
+        list(self.executor.map(_ready, range(workers)))
+
+    # Blocking helpers, for callers already running on an inference thread
+    def map_text(self, images):
+        return list(self.executor.map(ocr_text, images))
+
+    def map_words(self, images, allowlist=None):
+        return list(self.executor.map(functools.partial(ocr_words, allowlist=allowlist), images))
+
+    def map_lines(self, images):
+        return list(self.executor.map(ocr_line, images))
+
+    # Awaitable helpers, for the event loop
+    async def text(self, image):
+        return await asyncio.wrap_future(self.executor.submit(ocr_text, image))
+
+    async def words(self, image):
+        return await asyncio.wrap_future(self.executor.submit(ocr_words, image))
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,129 @@
+import os
+import numpy as np
+
+# Tiled inference for large images. Engines downscale big inputs (EasyOCR's detector
+# caps the canvas at 2560 px), so small text on a large scan is lost; cutting the
+# image into overlapping tiles keeps it at full resolution.
+#   OCR_TILE_SIZE           tile side in pixels; smaller images are never tiled
+#   OCR_TILE_OVERLAP        pixels shared by neighbouring tiles, at least the size of
+#                           the largest word expected, so every word is whole in a tile
+#   OCR_TILE_MAX_IN_FLIGHT  tiles of one image cropped and queued at once, which bounds
+#                           the extra memory a tiled image needs
+#   OCR_TILE_IOU_THRESHOLD  overlap above which two boxes from different tiles count
+#                           as the same word
+OCR_TILE_SIZE = int(os.environ.get("OCR_TILE_SIZE", 1024))
+OCR_TILE_OVERLAP = int(os.environ.get("OCR_TILE_OVERLAP", 128))
+OCR_TILE_MAX_IN_FLIGHT = int(os.environ.get("OCR_TILE_MAX_IN_FLIGHT", 8))
+OCR_TILE_IOU_THRESHOLD = float(os.environ.get("OCR_TILE_IOU_THRESHOLD", 0.5))
+
+# A box mostly inside a larger one from the neighbouring tile is the same word, cut
+# short at that tile's edge
+CONTAINMENT_THRESHOLD = 0.8
+
+# Tiling settings that change the output; they are part of the result cache key
+TILE_PARAMS = {"size": OCR_TILE_SIZE, "overlap": OCR_TILE_OVERLAP, "iou_threshold": OCR_TILE_IOU_THRESHOLD}
+
+
+def needs_tiling(image_shape, tile_size=OCR_TILE_SIZE):
+    return max(image_shape[:2]) > tile_size
+
+
+# Start offsets covering `length` with tiles of `tile_size` overlapping by `overlap`;
+# the last tile is flush with the end rather than hanging over it
+def tile_starts(length, tile_size, overlap):
+    if length <= tile_size:
+        return [0]
+    stride = max(1, tile_size - overlap)
+    starts = list(range(0, length - tile_size, stride))
+    starts.append(length - tile_size)
+    return starts
+
+
+# (x, y, width, height) of every tile of an image, row by row
+def tile_grid(image_shape, tile_size=OCR_TILE_SIZE, overlap=OCR_TILE_OVERLAP):
+    height, width = image_shape[:2]
+    return [
+        (x, y, min(tile_size, width - x), min(tile_size, height - y))
+        for y in tile_starts(height, tile_size, overlap)
+        for x in tile_starts(width, tile_size, overlap)
+    ]
+
+
+# The tile's pixels as their own contiguous array (engines expect one), copied only
+# when the tile is about to be recognized
+def crop_tile(img, tile):
+    x, y, width, height = tile
+    return np.ascontiguousarray(img[y:y + height, x:x + width])
+
+
+# Move a tile's results into the coordinates of the whole image
+def offset_results(results, x, y):
+    return [
+        {**result, "bounding_box": [[px + x, py + y] for px, py in result["bounding_box"]]}
+        for result in results
+    ]
+
+
+# Axis-aligned extents (x1, y1, x2, y2) of result boxes as an (N, 4) array
+def result_extents(results):
+    corners = [np.asarray(result["bounding_box"], dtype=np.float64).reshape(-1, 2) for result in results]
+    if not corners:
+        return np.zeros((0, 4))
+    return np.array([np.concatenate([c.min(axis=0), c.max(axis=0)]) for c in corners])
+
+
+# Pairs (i, j) among `extents` where box i of one tile and box j of another are the same
+# word: their IoU reaches iou_threshold or the smaller one lies mostly inside the other
+def duplicate_pairs(extents_a, extents_b, iou_threshold, containment_threshold):
+    areas_a = np.prod(extents_a[:, 2:] - extents_a[:, :2], axis=1)
+    areas_b = np.prod(extents_b[:, 2:] - extents_b[:, :2], axis=1)
+    top_left = np.maximum(extents_a[:, None, :2], extents_b[None, :, :2])
+    bottom_right = np.minimum(extents_a[:, None, 2:], extents_b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    union = areas_a[:, None] + areas_b[None, :] - intersection
+    iou = np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+    smaller = np.minimum(areas_a[:, None], areas_b[None, :])
+    containment = np.divide(intersection, smaller, out=np.zeros_like(intersection), where=smaller > 0)
+    return zip(*np.nonzero((iou >= iou_threshold) | (containment >= containment_threshold)))
+
+
+# Merge the results of all tiles (already in image coordinates) into one list, dropping
+# duplicate detections of a word seen by two overlapping tiles: of two boxes that
+# overlap by OCR_TILE_IOU_THRESHOLD, or where one lies mostly inside the other (a word
+# cut at one tile's edge next to its whole copy), the larger is kept. Only boxes in the
+# strip shared by two neighbouring tiles are compared, so the work grows with the
+# number of seams rather than with the square of the number of words
+def merge_tile_results(tiles, tile_results, iou_threshold=OCR_TILE_IOU_THRESHOLD, containment_threshold=CONTAINMENT_THRESHOLD):
+    offsets = np.cumsum([0] + [len(results) for results in tile_results])
+    results = [result for results in tile_results for result in results]
+    extents = result_extents(results)
+    areas = np.prod(extents[:, 2:] - extents[:, :2], axis=1)
+
+    duplicates = {}
+    for a, (ax, ay, aw, ah) in enumerate(tiles):
+        for b in range(a + 1, len(tiles)):
+            bx, by, bw, bh = tiles[b]
+            shared = (max(ax, bx), max(ay, by), min(ax + aw, bx + bw), min(ay + ah, by + bh))
+            if shared[0] >= shared[2] or shared[1] >= shared[3]:
+                continue
+            # Boxes of each tile that reach into the shared strip
+            in_a = [i for i in range(offsets[a], offsets[a + 1]) if overlaps(extents[i], shared)]
+            in_b = [j for j in range(offsets[b], offsets[b + 1]) if overlaps(extents[j], shared)]
+            if not in_a or not in_b:
+                continue
+            for i, j in duplicate_pairs(extents[in_a], extents[in_b], iou_threshold, containment_threshold):
+                duplicates.setdefault(in_a[i], []).append(in_b[j])
+                duplicates.setdefault(in_b[j], []).append(in_a[i])
+
+    # Largest first: each kept box drops its duplicates
+    keep = np.ones(len(results), dtype=bool)
+    for i in np.argsort(-areas, kind="stable"):
+        if keep[i]:
+            for j in duplicates.get(i, ()):
+                if areas[j] <= areas[i]:
+                    keep[j] = False
+    return [result for result, kept in zip(results, keep) if kept]
+
+
+def overlaps(extent, region):
+    return extent[0] < region[2] and extent[2] > region[0] and extent[1] < region[3] and extent[3] > region[1]
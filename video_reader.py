@@ -0,0 +1,106 @@
+import os
+import asyncio
+import threading
+import concurrent.futures
+
+# Frames decoded ahead of the engine. This bounds memory: however long the video is,
+# at most this many decoded frames exist at once (plus the batch being recognized)
+VIDEO_FRAME_QUEUE_SIZE = int(os.environ.get("OCR_VIDEO_FRAME_QUEUE_SIZE", 16))
+
+# From this sample rate on, jumping to the next sampled frame with a seek is cheaper
+# than grabbing every frame in between
+VIDEO_SEEK_THRESHOLD = int(os.environ.get("OCR_VIDEO_SEEK_THRESHOLD", 30))
+
+_END_OF_VIDEO = object()
+
+
+# Decodes every sample_rate-th frame of a video on a background thread and hands them
+# to the event loop through a bounded queue. Skipped frames are only grabbed (demuxed,
+# never converted to BGR arrays), or seeked over for large sample rates.
+#
+#     async for frame_index, timestamp, frame in VideoFrameReader(path, sample_rate):
+#         ...
+class VideoFrameReader:
+    def __init__(self, video_path, sample_rate=1, queue_size=VIDEO_FRAME_QUEUE_SIZE):
+        if sample_rate < 1:
+            raise ValueError("sample_rate must be at least 1.")
+        self.video_path = video_path
+        self.sample_rate = sample_rate
+        self.queue_size = queue_size
+        self.fps = None
+        self.frame_count = None
+        self._stop = threading.Event()
+
+    def _decode(self, loop, queue):
+        # Imported here so importing this module doesn't require OpenCV
+        import cv2
+
+        def put(item):
+            # Blocks this thread while the queue is full, which is the backpressure
+            # that keeps decoding from running ahead of recognition
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while not self._stop.is_set():
+                try:
+                    return future.result(timeout=0.1)
+                except concurrent.futures.TimeoutError:
+                    continue
+            future.cancel()
+
+        capture = cv2.VideoCapture(self.video_path)
+        try:
+            if not capture.isOpened():
+                put(ValueError(f"Failed to open the video {self.video_path}."))
+                return
+
+            self.fps = capture.get(cv2.CAP_PROP_FPS) or None
+            self.frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+            seek = self.sample_rate >= VIDEO_SEEK_THRESHOLD
+
+            frame_index = 0
+            while not self._stop.is_set():
+                ok, frame = capture.read()
+                if not ok:
+                    break
+
+                timestamp = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                if not timestamp and self.fps:
+                    timestamp = frame_index / self.fps
+                put((frame_index, timestamp, frame))
+                del frame
+
+                frame_index += self.sample_rate
+                if seek:
+                    if self.frame_count and frame_index >= self.frame_count:
+                        break
+                    capture.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+                else:
+                    # Advance over the skipped frames without retrieving them
+                    skipped = 0
+                    while skipped < self.sample_rate - 1 and capture.grab():
+                        skipped += 1
+                    if skipped < self.sample_rate - 1:
+                        break
+        except Exception as e:
+            put(e)
+        finally:
+            capture.release()
+            put(_END_OF_VIDEO)
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        thread = threading.Thread(target=self._decode, args=(loop, queue), daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END_OF_VIDEO:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Stop the decoder if the consumer bailed out early
+            self._stop.set()
+            while not queue.empty():
+                queue.get_nowait()